@@ -0,0 +1,51 @@
+import asyncio
+from typing import Optional
+import aiohttp
+import openai
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared connection pool and the event loop it belongs to
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Non-blocking HTTP session shared by the async views
+
+    Under ASGI a worker runs one event loop, so this is one connection pool
+    per process. A session can't be used from another loop, so a new one is
+    made if the running loop changes.
+    """
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.ASYNC_HTTP_MAX_CONNECTIONS),
+            # A streamed completion can take minutes; only a stalled read fails
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=settings.ASYNC_HTTP_TIMEOUT)
+        )
+        _http_session_loop = loop
+    return _http_session
+
+
+def _use_shared_session() -> None:
+    # Without it openai's acreate opens and closes a session, so a connection, per call
+    openai.aiosession.set(get_http_session())
+
+
+async def create_embeddings(**params):
+    """openai.Embedding.create without blocking, over the shared session"""
+    _use_shared_session()
+    return await openai.Embedding.acreate(**params)
+
+
+async def create_chat_completion(**params):
+    """openai.ChatCompletion.create without blocking, over the shared session
+
+    With ``stream=True`` this returns an async iterator of chunks.
+    """
+    _use_shared_session()
+    return await openai.ChatCompletion.acreate(**params)
@@ -0,0 +1,533 @@
+import asyncio
+import json
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Count
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from . import async_clients
+from .document_processor import DocumentProcessor, RETRIEVAL_MODES, adocument_version
+from .caching import get_response_cache, get_image_analysis_cache
+from .enhanced_views import (
+    DOCUMENTS_QUEUED_RESPONSE, EMPTY_REQUEST_RESPONSE, determine_document_type,
+    rag_messages, image_messages, stream_metadata, cache_hit_metadata, image_cache_hit_metadata
+)
+from .firebase_auth import async_require_auth
+from .image_preprocessing import ImageRejected, ImagePreprocessingTimeout, prepare_image_upload, image_data_url
+from .ingestion_queue import enqueue_document, get_ingestion_worker_pool, TERMINAL_STATUSES
+from .message_buffer import get_chat_message_buffer
+from .models import UserDocument, UserChatSession
+from .streaming import wants_event_stream, astream_chat_completion
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIView(View):
+    """Base for the async variants of the API views (served under /api/async/)
+
+    Handlers are coroutines, so under ASGI a request waiting on OpenAI or
+    the vector store holds no thread. Like DRF's APIView the views are
+    CSRF-exempt, since clients authenticate with bearer tokens.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    @staticmethod
+    def request_data(request):
+        """Parsed JSON or form body"""
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return request.POST
+
+
+class AsyncChatView(AsyncAPIView):
+    """Async EnhancedChatView: same request and response, non-blocking I/O"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.document_processor = DocumentProcessor()
+
+    @async_require_auth
+    async def post(self, request):
+        """Handle chat requests with authentication and RAG"""
+        try:
+            user_id = request.user_id
+            try:
+                data = self.request_data(request)
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+            user_message = (data.get('message') or '').strip()
+            image_file = request.FILES.get('image', None)
+            medical_report_files = request.FILES.getlist('medical_report')
+            session_id = data.get('session_id') or str(uuid.uuid4())
+            retrieval_mode = data.get('retrieval_mode') or None
+
+            if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+                return JsonResponse({
+                    'error': f'retrieval_mode must be one of: {", ".join(RETRIEVAL_MODES)}'
+                }, status=400)
+
+            session, created = await UserChatSession.objects.aget_or_create(
+                session_id=session_id,
+                user_id=user_id,
+                defaults={'is_active': True}
+            )
+
+            # Uploads are stored and queued; ingestion runs in the background queue
+            queued_documents = []
+            for medical_report_file in medical_report_files:
+                document_name = medical_report_file.name
+                try:
+                    document, queued = await sync_to_async(enqueue_document)(
+                        user_id=user_id,
+                        uploaded_file=medical_report_file,
+                        document_name=document_name,
+                        document_type=determine_document_type(document_name)
+                    )
+                except Exception as e:
+                    logger.error(f"Error queuing document: {str(e)}")
+                    return JsonResponse({
+                        'error': f'Failed to upload document: {str(e)}'
+                    }, status=500)
+                if queued:
+                    content = f'Document "{document_name}" uploaded and queued for processing.'
+                else:
+                    content = f'Document "{document_name}" was already uploaded as "{document.document_name}".'
+                await get_chat_message_buffer().aadd(
+                    session=session,
+                    message_type='system',
+                    content=content,
+                    metadata={'document_id': str(document.id), 'duplicate': not queued}
+                )
+                queued_documents.append({
+                    'id': str(document.id),
+                    'document_name': document.document_name,
+                    'processing_status': document.processing_status,
+                    'duplicate': not queued
+                })
+
+            image_base64 = None
+            image_fingerprint = None
+            if image_file:
+                try:
+                    prepared_image = await sync_to_async(prepare_image_upload, thread_sensitive=False)(image_file)
+                except ImageRejected as e:
+                    return JsonResponse({'error': str(e)}, status=400)
+                except ImagePreprocessingTimeout:
+                    return JsonResponse({
+                        'error': 'The image could not be processed in time; please try again'
+                    }, status=503)
+                image_base64 = image_data_url(prepared_image)
+                image_fingerprint = prepared_image.fingerprint
+
+            await get_chat_message_buffer().aadd(
+                session=session,
+                message_type='user',
+                content=user_message or "Image analysis requested",
+                metadata={'has_image': bool(image_file)}
+            )
+
+            if wants_event_stream(request, data):
+                return await self._stream_response(
+                    user_id, user_message, image_base64, session, retrieval_mode, queued_documents,
+                    image_fingerprint
+                )
+
+            cache_info = None
+            if user_message and not image_file:
+                response, cache_info = await self._generate_rag_response(user_id, user_message, retrieval_mode)
+            elif image_file:
+                response, cache_info = await self._generate_image_analysis(user_id, image_base64, image_fingerprint)
+            elif queued_documents:
+                response = DOCUMENTS_QUEUED_RESPONSE
+            else:
+                response = EMPTY_REQUEST_RESPONSE
+
+            await get_chat_message_buffer().aadd(
+                session=session,
+                message_type='assistant',
+                content=response
+            )
+
+            response_data = {
+                'response': response,
+                'session_id': session_id,
+                'user_id': user_id
+            }
+            if queued_documents:
+                response_data['documents'] = queued_documents
+            if cache_info is not None:
+                response_data['cache'] = cache_info
+
+            return JsonResponse(response_data, status=200)
+
+        except Exception as e:
+            logger.error(f"Error in async chat: {str(e)}")
+            return JsonResponse({
+                'error': f'Chat error: {str(e)}'
+            }, status=500)
+
+    def _start_query_embedding(self, query: str, retrieval_mode: str = None):
+        """Task embedding the query, shared by the response cache and the search (None in lexical mode)"""
+        if (retrieval_mode or settings.RETRIEVAL_MODE) == 'lexical':
+            return None
+        return asyncio.ensure_future(self.document_processor.aembed_query(query))
+
+    async def _lookup_cached_response(self, user_id: str, retrieval_mode: str, query_embedding) -> tuple:
+        """EnhancedChatView._lookup_cached_response with ``query_embedding`` a task"""
+        cache = get_response_cache()
+        if cache is None or query_embedding is None:
+            return None, None
+        try:
+            embedding = await query_embedding
+        except Exception:
+            # Retrieval reports the failed embedding (and falls back to BM25 in hybrid mode)
+            return None, None
+        cache_key = (embedding, await adocument_version(user_id), retrieval_mode or settings.RETRIEVAL_MODE)
+        return cache_key, cache.get(user_id, *cache_key)
+
+    async def _generate_rag_response(self, user_id: str, query: str, retrieval_mode: str = None) -> tuple:
+        """Generate response using RAG (Retrieval-Augmented Generation)
+
+        Returns the answer and the reply's ``cache`` field, see
+        EnhancedChatView._generate_rag_response.
+        """
+        try:
+            query_embedding = self._start_query_embedding(query, retrieval_mode)
+            cache_key, cached = await self._lookup_cached_response(user_id, retrieval_mode, query_embedding)
+            if cached is not None:
+                return cached[0].response, cache_hit_metadata(cached)
+
+            search_results, complete = await self.document_processor.asearch_with_status(
+                user_id=user_id,
+                query=query,
+                top_k=settings.RAG_TOP_K,
+                mode=retrieval_mode,
+                query_embedding=query_embedding
+            )
+            response = await async_clients.create_chat_completion(
+                model="gpt-4o",
+                messages=rag_messages(query, search_results)
+            )
+            answer = response.choices[0].message["content"]
+            if cache_key is None:
+                return answer, None
+            if complete:
+                # An answer to degraded retrieval (e.g. a vector store outage) is not reused
+                get_response_cache().set(user_id, *cache_key, query, answer)
+            return answer, {'hit': False}
+        except Exception as e:
+            logger.error(f"Error generating RAG response: {str(e)}")
+            return f"I apologize, but I encountered an error while processing your request: {str(e)}", None
+
+    async def _lookup_cached_analysis(self, user_id: str, image_fingerprint) -> tuple:
+        """EnhancedChatView._lookup_cached_analysis"""
+        cache = get_image_analysis_cache()
+        if cache is None or image_fingerprint is None:
+            return None, None
+        cache_key = (await adocument_version(user_id), image_fingerprint)
+        return cache_key, cache.get(user_id, *cache_key)
+
+    async def _generate_image_analysis(self, user_id: str, image_base64: str, image_fingerprint=None) -> tuple:
+        """Analyse a food image, see EnhancedChatView._generate_image_analysis"""
+        cache_key, cached = await self._lookup_cached_analysis(user_id, image_fingerprint)
+        if cached is not None:
+            return cached[0].response, image_cache_hit_metadata(cached, image_fingerprint)
+
+        try:
+            medical_chunks = await self.document_processor.aget_medical_profile(user_id)
+            ai_response = await async_clients.create_chat_completion(
+                model="gpt-4o",
+                messages=image_messages(medical_chunks, image_base64)
+            )
+            response = ai_response.choices[0].message["content"]
+        except Exception as e:
+            logger.error(f"Error generating image+medical response: {str(e)}")
+            return f"I apologize, but I encountered an error while analyzing the image: {str(e)}", None
+
+        if cache_key is None:
+            return response, None
+        get_image_analysis_cache().set(user_id, *cache_key, response)
+        return response, {'hit': False}
+
+    async def _stream_response(self, user_id: str, user_message: str, image_base64: str,
+                               session: UserChatSession, retrieval_mode: str = None,
+                               queued_documents: list = None, image_fingerprint=None):
+        """Stream the reply as server-sent events (see EnhancedChatView._stream_response)"""
+        messages = None
+        sources = []
+        fixed_response = ""
+        cache_key, image_cache_key, cache_info = None, None, None
+        if user_message and not image_base64:
+            query_embedding = self._start_query_embedding(user_message, retrieval_mode)
+            cache_key, cached = await self._lookup_cached_response(user_id, retrieval_mode, query_embedding)
+            if cached is not None:
+                fixed_response = cached[0].response
+                cache_info = cache_hit_metadata(cached)
+            else:
+                sources, complete = await self.document_processor.asearch_with_status(
+                    user_id=user_id,
+                    query=user_message,
+                    top_k=settings.RAG_TOP_K,
+                    mode=retrieval_mode,
+                    query_embedding=query_embedding
+                )
+                messages = rag_messages(user_message, sources)
+                if cache_key is not None:
+                    cache_info = {'hit': False}
+                if not complete:
+                    cache_key = None  # Don't cache an answer to degraded retrieval
+        elif image_base64:
+            image_cache_key, cached = await self._lookup_cached_analysis(user_id, image_fingerprint)
+            if cached is not None:
+                fixed_response = cached[0].response
+                cache_info = image_cache_hit_metadata(cached, image_fingerprint)
+            else:
+                sources = await self.document_processor.aget_medical_profile(user_id)
+                messages = image_messages(sources, image_base64)
+                if image_cache_key is not None:
+                    cache_info = {'hit': False}
+        elif queued_documents:
+            fixed_response = DOCUMENTS_QUEUED_RESPONSE
+        else:
+            fixed_response = EMPTY_REQUEST_RESPONSE
+
+        async def on_finish(text: str, completed: bool) -> dict:
+            if completed and messages is not None and cache_key is not None:
+                get_response_cache().set(user_id, *cache_key, user_message, text)
+            if completed and messages is not None and image_cache_key is not None:
+                get_image_analysis_cache().set(user_id, *image_cache_key, text)
+            message = await get_chat_message_buffer().aadd(
+                session=session,
+                message_type='assistant',
+                content=text,
+                metadata={'streamed': True, 'completed': completed}
+            )
+            return {'message_id': str(message.id)}
+
+        metadata = stream_metadata(session.session_id, user_id, sources, queued_documents)
+        if cache_info is not None:
+            metadata['cache'] = cache_info
+
+        return astream_chat_completion(
+            messages,
+            metadata,
+            on_finish,
+            fixed_response=fixed_response
+        )
+
+
+class AsyncDocumentManagementView(AsyncAPIView):
+    """Async DocumentManagementView
+
+    Listing uses the async ORM. Replacing and deleting a document are
+    mostly vector-store and file work and run in a worker thread.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.document_processor = DocumentProcessor()
+
+    @async_require_auth
+    async def get(self, request):
+        """Get user's documents"""
+        try:
+            document_list = [{
+                'id': str(doc.id),
+                'document_name': doc.document_name,
+                'document_type': doc.document_type,
+                'upload_date': doc.upload_date.isoformat(),
+                'processing_status': doc.processing_status,
+                'chunk_count': len(doc.vector_ids)
+            } async for doc in self.document_processor.get_user_documents(request.user_id)]
+
+            return JsonResponse({
+                'documents': document_list,
+                'total_count': len(document_list)
+            }, status=200)
+
+        except Exception as e:
+            logger.error(f"Error getting user documents: {str(e)}")
+            return JsonResponse({
+                'error': f'Error retrieving documents: {str(e)}'
+            }, status=500)
+
+    @async_require_auth
+    async def put(self, request, document_id):
+        """Replace a document with a revised file, re-embedding only changed chunks"""
+        try:
+            # Django only parses multipart bodies of POST requests
+            if request.content_type == 'multipart/form-data':
+                request.POST, request._files = request.parse_file_upload(request.META, request)
+            medical_report_file = request.FILES.get('medical_report', None)
+
+            if not medical_report_file:
+                return JsonResponse({
+                    'error': 'A medical_report file is required'
+                }, status=400)
+
+            document, changes = await sync_to_async(self.document_processor.replace_document)(
+                request.user_id,
+                document_id,
+                medical_report_file,
+                document_name=request.POST.get('document_name') or medical_report_file.name
+            )
+
+            return JsonResponse({
+                'message': 'Document replaced successfully',
+                'document': {
+                    'id': str(document.id),
+                    'document_name': document.document_name,
+                    'revision': document.revision,
+                    'processing_status': document.processing_status,
+                    'chunk_count': len(document.vector_ids)
+                },
+                'changes': changes
+            }, status=200)
+
+        except UserDocument.DoesNotExist:
+            return JsonResponse({
+                'error': 'Document not found'
+            }, status=404)
+        except ValueError as e:
+            return JsonResponse({
+                'error': str(e)
+            }, status=409)
+        except Exception as e:
+            logger.error(f"Error replacing document: {str(e)}")
+            return JsonResponse({
+                'error': f'Error replacing document: {str(e)}'
+            }, status=500)
+
+    @async_require_auth
+    async def delete(self, request, document_id=None):
+        """Delete a user's document, or all of them"""
+        try:
+            if document_id is None:
+                deleted = await sync_to_async(self.document_processor.delete_all_user_documents)(request.user_id)
+                return JsonResponse({
+                    'message': f'Deleted {deleted} documents',
+                    'deleted': deleted
+                }, status=200)
+
+            success = await sync_to_async(self.document_processor.delete_user_document)(
+                request.user_id, document_id
+            )
+
+            if success:
+                return JsonResponse({
+                    'message': 'Document deleted successfully'
+                }, status=200)
+            return JsonResponse({
+                'error': 'Document not found or could not be deleted'
+            }, status=404)
+
+        except Exception as e:
+            logger.error(f"Error deleting document: {str(e)}")
+            return JsonResponse({
+                'error': f'Error deleting document: {str(e)}'
+            }, status=500)
+
+
+class AsyncChatHistoryView(AsyncAPIView):
+    """Async ChatHistoryView"""
+
+    @async_require_auth
+    async def get(self, request):
+        """Get user's chat history"""
+        try:
+            user_id = request.user_id
+            session_id = request.GET.get('session_id')
+            # Read this process's own buffered writes (other workers' can lag by CHAT_MESSAGE_FLUSH_INTERVAL)
+            await sync_to_async(get_chat_message_buffer().flush)()
+
+            if not session_id:
+                sessions = (UserChatSession.objects
+                            .filter(user_id=user_id, is_active=True)
+                            .annotate(message_count=Count('messages'))
+                            .order_by('-last_activity'))
+                return JsonResponse({
+                    'sessions': [{
+                        'session_id': session.session_id,
+                        'created_at': session.created_at.isoformat(),
+                        'last_activity': session.last_activity.isoformat(),
+                        'message_count': session.message_count
+                    } async for session in sessions]
+                }, status=200)
+
+            try:
+                session = await UserChatSession.objects.aget(session_id=session_id, user_id=user_id)
+            except UserChatSession.DoesNotExist:
+                return JsonResponse({
+                    'error': 'Session not found'
+                }, status=404)
+
+            return JsonResponse({
+                'session_id': session_id,
+                'messages': [{
+                    'id': str(message.id),
+                    'type': message.message_type,
+                    'content': message.content,
+                    'timestamp': message.timestamp.isoformat(),
+                    'metadata': message.metadata
+                } async for message in session.messages.all().order_by('timestamp')]
+            }, status=200)
+
+        except Exception as e:
+            logger.error(f"Error getting chat history: {str(e)}")
+            return JsonResponse({
+                'error': f'Error retrieving chat history: {str(e)}'
+            }, status=500)
+
+
+class AsyncDocumentStatusView(AsyncAPIView):
+    """Async DocumentStatusView; a long poll waits on the event loop instead of a thread"""
+
+    @async_require_auth
+    async def get(self, request, document_id):
+        """Get a document's processing status, optionally long-polling with ?wait=<seconds>"""
+        try:
+            try:
+                document = await UserDocument.objects.aget(id=document_id, user_id=request.user_id)
+            except (UserDocument.DoesNotExist, ValueError, ValidationError):
+                return JsonResponse({
+                    'error': 'Document not found'
+                }, status=404)
+
+            try:
+                wait = float(request.GET.get('wait', 0))
+            except ValueError:
+                wait = 0
+            wait = max(0, min(wait, settings.INGESTION_STATUS_MAX_WAIT))
+
+            if settings.INGESTION_RUN_IN_PROCESS and document.processing_status == 'pending':
+                # Pick up jobs left over from before a restart
+                get_ingestion_worker_pool().start()
+
+            deadline = time.monotonic() + wait
+            while document.processing_status not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                await asyncio.sleep(settings.INGESTION_STATUS_POLL_INTERVAL)
+                await document.arefresh_from_db()
+
+            return JsonResponse({
+                'id': str(document.id),
+                'document_name': document.document_name,
+                'processing_status': document.processing_status,
+                'processing_error': document.processing_error,
+                'processing_attempts': document.processing_attempts,
+                'processed_at': document.processed_at.isoformat() if document.processed_at else None,
+                'chunk_count': len(document.vector_ids)
+            }, status=200)
+
+        except Exception as e:
+            logger.error(f"Error getting document status: {str(e)}")
+            return JsonResponse({
+                'error': f'Error retrieving document status: {str(e)}'
+            }, status=500)
@@ -0,0 +1,527 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict, namedtuple
+from typing import List, Dict, Any, Optional, Hashable, Tuple
+import numpy as np
+from django.conf import settings
+from .images import ImageFingerprint, hamming_distance
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with hit/miss counters"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        """Return the cached value and mark it most recently used"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value) -> None:
+        """Store a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# A cached RAG answer and what it was computed for
+CachedResponse = namedtuple('CachedResponse', ['query', 'embedding', 'response', 'document_version', 'mode', 'created_at'])
+
+
+class SemanticResponseCache:
+    """Per-user cache of RAG answers, looked up by query embedding similarity
+
+    A cached answer is served for a new query of the same user and retrieval
+    mode whose embedding has cosine similarity of at least ``threshold`` with
+    the cached query's, as long as the user's document version (bumped on
+    every upload, ingestion and delete) is still the one it was answered at.
+    Entries expire after ``ttl`` seconds; beyond ``max_entries`` in total the
+    least recently used are evicted.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (user_id, n) -> CachedResponse, in LRU order
+        self._user_keys: Dict[str, List[Tuple[str, int]]] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, embedding: List[float], document_version: int,
+            mode: str) -> Optional[Tuple[CachedResponse, float]]:
+        """Best cached answer for the query and its similarity, or None"""
+        query = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for key in list(self._user_keys.get(user_id, ())):
+                entry = self._entries[key]
+                if entry.document_version != document_version or now - entry.created_at > self.ttl:
+                    # Answered from documents the user no longer has, or too old
+                    self._remove(key)
+                elif entry.mode == mode:
+                    candidates.append(key)
+            if candidates:
+                similarities = np.stack([self._entries[key].embedding for key in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def set(self, user_id: str, embedding: List[float], document_version: int, mode: str,
+            query: str, response: str) -> None:
+        """Cache an answer, evicting the least recently used entries if full"""
+        entry = CachedResponse(query, self._normalize(embedding), response, document_version, mode, time.time())
+        with self._lock:
+            key = (user_id, self._next_key)
+            self._next_key += 1
+            self._entries[key] = entry
+            self._user_keys.setdefault(user_id, []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'users': len(self._user_keys),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, key: Tuple[str, int]) -> None:
+        del self._entries[key]
+        user_keys = self._user_keys[key[0]]
+        user_keys.remove(key)
+        if not user_keys:
+            del self._user_keys[key[0]]
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# A cached food-image analysis
+CachedAnalysis = namedtuple('CachedAnalysis', ['fingerprint', 'response', 'created_at'])
+
+
+class ImageAnalysisCache:
+    """Per-user cache of food-image analyses
+
+    Keyed on the image's fingerprint (see api.images) and the user's
+    document version, since the analysis depends on their medical context.
+    A lookup hits on the same bytes, or failing that on the perceptual hash
+    closest to the new image's if it is within ``max_distance`` bits: the
+    same photo resent after a retry, often re-encoded on the way. Holds at
+    most ``max_entries``; the least recently used are evicted first.
+    """
+
+    def __init__(self, max_entries: int, max_distance: int):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # (user_id, document_version, sha256) -> CachedAnalysis, in LRU order
+        self._user_keys: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, document_version: int,
+            fingerprint: ImageFingerprint) -> Optional[Tuple[CachedAnalysis, int]]:
+        """Cached analysis for the image and its Hamming distance (0 for identical bytes), or None"""
+        with self._lock:
+            key = (user_id, document_version, fingerprint.sha256)
+            best, best_distance = (key, 0) if key in self._entries else (None, None)
+            if best is None and fingerprint.phash is not None:
+                for candidate in list(self._user_keys.get(user_id, ())):
+                    if candidate[1] != document_version:
+                        # Analysed against medical context the user no longer has
+                        self._remove(candidate)
+                        continue
+                    phash = self._entries[candidate].fingerprint.phash
+                    if phash is None:
+                        continue
+                    distance = hamming_distance(phash, fingerprint.phash)
+                    if distance <= self.max_distance and (best is None or distance < best_distance):
+                        best, best_distance = candidate, distance
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best], best_distance
+
+    def set(self, user_id: str, document_version: int, fingerprint: ImageFingerprint, response: str) -> None:
+        """Cache an analysis, evicting the least recently used entries if full"""
+        key = (user_id, document_version, fingerprint.sha256)
+        with self._lock:
+            self._entries[key] = CachedAnalysis(fingerprint, response, time.time())
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, key: Tuple[str, int, str]) -> None:
+        del self._entries[key]
+        user_keys = self._user_keys[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._user_keys[key[0]]
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache
+
+    Entries are keyed on (embedding model, hash of normalized text). Lookups
+    go to an in-process LRU first and then to an SQLite table on local disk,
+    which is shared by every worker process on the host. The SQLite tier is
+    evicted by least-recent access once it grows past ``max_bytes``.
+    Disk hits only note their access time in memory; the notes are written
+    in one transaction once ``access_batch_size`` have gathered or
+    ``access_flush_interval`` seconds have passed, so reads don't queue for
+    the shared write lock.
+    """
+
+    def __init__(self, path: str, max_bytes: int, memory_entries: int,
+                 access_batch_size: int = 256, access_flush_interval: float = 60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory = LRUCache(max_entries=memory_entries)
+        self.access_batch_size = access_batch_size
+        self.access_flush_interval = access_flush_interval
+        self.disk_hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()  # Also guards _accessed
+        self._writes_since_eviction_check = 0
+        self._accessed: Dict[str, float] = {}  # Disk-hit key -> access time not yet written
+        self._last_access_flush = time.monotonic()
+        self._create_table()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize unicode and collapse whitespace so trivial edits share a key"""
+        return " ".join(unicodedata.normalize('NFC', text).split())
+
+    def make_key(self, text: str, model: str) -> str:
+        digest = hashlib.sha256(self.normalize_text(text).encode('utf-8')).hexdigest()
+        return f"{model}:{digest}"
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_table(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._get_connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+
+    def get_many(self, texts: List[str], model: str) -> List[Optional[List[float]]]:
+        """Return cached embeddings for ``texts``, with None for misses"""
+        keys = [self.make_key(text, model) for text in texts]
+        results = [self.memory.get(key) for key in keys]
+
+        disk_hits = 0
+        missing = {key for key, result in zip(keys, results) if result is None}
+        if missing:
+            found = self._read_disk(list(missing))
+            for i, key in enumerate(keys):
+                if results[i] is None and key in found:
+                    results[i] = found[key]
+                    self.memory.set(key, found[key])
+                    disk_hits += 1
+
+        with self._counter_lock:
+            self.disk_hits += disk_hits
+            self.misses += sum(1 for result in results if result is None)
+
+        return results
+
+    def set_many(self, texts: List[str], embeddings: List[List[float]], model: str) -> None:
+        """Store embeddings in both tiers"""
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            key = self.make_key(text, model)
+            self.memory.set(key, embedding)
+            blob = array('f', embedding).tobytes()
+            rows.append((key, model, blob, len(blob), now))
+
+        if not rows:
+            return
+
+        try:
+            conn = self._get_connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            with self._counter_lock:
+                self._writes_since_eviction_check += len(rows)
+                check_eviction = self._writes_since_eviction_check >= 256
+                if check_eviction:
+                    self._writes_since_eviction_check = 0
+            if check_eviction:
+                self._evict_if_needed()
+        except sqlite3.Error as e:
+            # The cache is an optimisation; never fail ingestion because of it
+            logger.warning(f"Error writing embedding cache: {str(e)}")
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        try:
+            conn = self._get_connection()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading embedding cache: {str(e)}")
+        if found:
+            self._note_access(found)
+        return found
+
+    def _note_access(self, keys) -> None:
+        """Record disk hits for the next batched last_access update"""
+        now = time.time()
+        with self._counter_lock:
+            for key in keys:
+                self._accessed[key] = now
+            due = (len(self._accessed) >= self.access_batch_size
+                   or time.monotonic() - self._last_access_flush >= self.access_flush_interval)
+        if due:
+            self._flush_access_times()
+
+    def _flush_access_times(self) -> None:
+        """Write the noted access times in one transaction"""
+        with self._counter_lock:
+            accessed, self._accessed = self._accessed, {}
+            self._last_access_flush = time.monotonic()
+        if not accessed:
+            return
+        try:
+            conn = self._get_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = MAX(last_access, ?) WHERE key = ?",
+                    [(access_time, key) for key, access_time in accessed.items()]
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # Only eviction order suffers
+            logger.warning(f"Error updating embedding cache access times: {str(e)}")
+
+    def _evict_if_needed(self) -> None:
+        """Drop least recently used rows until the table is under 90% of max_bytes"""
+        self._flush_access_times()
+        conn = self._get_connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        excess = total - target
+        removed = 0
+        to_delete = []
+        for key, size in conn.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            if removed >= excess:
+                break
+            to_delete.append((key,))
+            removed += size
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        logger.info(f"Evicted {len(to_delete)} embeddings ({removed} bytes) from cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus shared disk usage"""
+        entries, total_bytes = 0, 0
+        try:
+            entries, total_bytes = self._get_connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading embedding cache stats: {str(e)}")
+        return {
+            'memory': self.memory.stats(),
+            'memory_hits': self.memory.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'disk_entries': entries,
+            'disk_bytes': total_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+# Global instance
+embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Get or create the global embedding cache (None when disabled)"""
+    global embedding_cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(
+                path=settings.EMBEDDING_CACHE_PATH,
+                max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+                memory_entries=settings.EMBEDDING_CACHE_MEMORY_ENTRIES
+            )
+    return embedding_cache
+
+
+# Global instance
+chunk_cache = None
+
+def get_chunk_cache() -> Optional[LRUCache]:
+    """Get or create the global chunk cache (vector ID -> hydrated chunk; None when disabled)"""
+    global chunk_cache
+    if settings.CHUNK_CACHE_ENTRIES <= 0:
+        return None
+    if chunk_cache is None:
+        chunk_cache = LRUCache(max_entries=settings.CHUNK_CACHE_ENTRIES)
+    return chunk_cache
+
+
+# Global instance
+response_cache = None
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """Get or create the global semantic response cache (None when disabled)"""
+    global response_cache
+    if settings.RESPONSE_CACHE_ENTRIES <= 0:
+        return None
+    if response_cache is None:
+        response_cache = SemanticResponseCache(
+            max_entries=settings.RESPONSE_CACHE_ENTRIES,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            threshold=settings.RESPONSE_CACHE_SIMILARITY
+        )
+    return response_cache
+
+
+# Global instance
+image_analysis_cache = None
+
+def get_image_analysis_cache() -> Optional[ImageAnalysisCache]:
+    """Get or create the global image analysis cache (None when disabled)"""
+    global image_analysis_cache
+    if settings.IMAGE_CACHE_ENTRIES <= 0:
+        return None
+    if image_analysis_cache is None:
+        image_analysis_cache = ImageAnalysisCache(
+            max_entries=settings.IMAGE_CACHE_ENTRIES,
+            max_distance=settings.IMAGE_CACHE_MAX_DISTANCE
+        )
+    return image_analysis_cache
@@ -0,0 +1,80 @@
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from django.conf import settings
+from django.db import close_old_connections
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTurn:
+    """Stages of one chat turn, timed, with independent ones run concurrently
+
+    ``stage`` times work done in the calling thread; ``submit`` runs a
+    stage on the shared chat-turn pool, so independent I/O (the query
+    embedding, the medical context) overlaps with the rest of the turn.
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None):
+        self.executor = executor or get_chat_turn_executor()
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}  # stage -> milliseconds
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage ``name``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.timings[name] = (time.perf_counter() - started) * 1000
+
+    def run(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run a stage now, in this thread"""
+        with self.stage(name):
+            return fn(*args, **kwargs)
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> Future:
+        """Run a stage on the pool"""
+        def task():
+            try:
+                return self.run(name, fn, *args, **kwargs)
+            except Exception as e:
+                # Nobody may wait on a stage that is off the response path
+                logger.error(f"Chat turn stage {name} failed: {str(e)}")
+                raise
+            finally:
+                # Pool threads live outside the request cycle that normally does this
+                close_old_connections()
+        return self.executor.submit(task)
+
+    def finish(self) -> None:
+        with self._lock:
+            self.timings['total'] = (time.perf_counter() - self.started) * 1000
+        logger.debug(f"Chat turn stages: {self.server_timing()}")
+
+    def server_timing(self) -> str:
+        """Stage timings as a Server-Timing header value (shown by browser dev tools)"""
+        with self._lock:
+            return ", ".join(f"{name};dur={duration:.1f}" for name, duration in self.timings.items())
+
+
+# Global instance
+chat_turn_executor = None
+_executor_lock = threading.Lock()
+
+def get_chat_turn_executor() -> ThreadPoolExecutor:
+    """Get or create the thread pool shared by all chat turns in this process"""
+    global chat_turn_executor
+    with _executor_lock:
+        if chat_turn_executor is None:
+            chat_turn_executor = ThreadPoolExecutor(
+                max_workers=settings.CHAT_TURN_WORKERS,
+                thread_name_prefix='chat-turn'
+            )
+    return chat_turn_executor
@@ -0,0 +1,166 @@
+import math
+from collections import Counter
+from typing import List, Dict, Any, Optional
+from .lexical_index import tokenize
+from .text_chunker import count_tokens, truncate_to_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The prompt goes to gpt-4o, whose tokenizer is o200k_base
+CHAT_ENCODING = 'o200k_base'
+
+# Candidates at least this similar to an already chosen one are dropped as duplicates
+DUPLICATE_SIMILARITY = 0.9
+
+# A truncated last candidate must keep at least this many tokens to be worth including
+MIN_PART_TOKENS = 50
+
+
+def _overlap_length(left: str, right: str, limit: int = 4000) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``"""
+    for length in range(min(len(left), len(right), limit), 0, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _join(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge two neighbouring chunks of one document, keeping their shared text once"""
+    if first.get('end_offset') is not None and second.get('start_offset') is not None:
+        overlap = first['end_offset'] - second['start_offset']
+        if overlap >= len(second['text_content']):
+            text = first['text_content']
+        elif overlap >= 0:
+            text = first['text_content'] + second['text_content'][overlap:]
+        else:
+            text = first['text_content'] + " " + second['text_content']
+    else:
+        overlap = _overlap_length(first['text_content'], second['text_content'])
+        text = first['text_content'] + ("" if overlap else " ") + second['text_content'][overlap:]
+
+    end_offset = None
+    if first.get('end_offset') is not None and second.get('end_offset') is not None:
+        end_offset = max(first['end_offset'], second['end_offset'])
+    return {
+        **first,
+        'text_content': text,
+        'score': max(first['score'], second['score']),
+        'similarity': max((hit.get('similarity') for hit in (first, second) if hit.get('similarity') is not None),
+                          default=None),
+        'end_offset': end_offset,
+        'chunk_indexes': first['chunk_indexes'] + second['chunk_indexes'],
+    }
+
+
+def merge_adjacent_chunks(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge hits that are consecutive (hence overlapping) chunks of the same document
+
+    Chunks overlap by CHUNK_OVERLAP_TOKENS, so neighbouring hits would repeat
+    text in the prompt. The merged hit keeps the best score and lists its
+    chunks in ``chunk_indexes``. Results come back best first.
+    """
+    by_document = {}
+    for result in results:
+        by_document.setdefault(result['document_id'], []).append(result)
+
+    merged = []
+    for hits in by_document.values():
+        current = None
+        for hit in sorted(hits, key=lambda hit: hit['chunk_index']):
+            hit = {**hit, 'chunk_indexes': [hit['chunk_index']]}
+            if current is not None and hit['chunk_index'] <= current['chunk_indexes'][-1] + 1:
+                current = _join(current, hit)
+            else:
+                if current is not None:
+                    merged.append(current)
+                current = hit
+        merged.append(current)
+    return sorted(merged, key=lambda hit: -hit['score'])
+
+
+def _term_vector(text: str) -> Counter:
+    return Counter(tokenize(text))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b[term] for term, count in a.items())
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+def mmr_order(results: List[Dict[str, Any]], mmr_lambda: float = 0.7,
+              duplicate_similarity: float = DUPLICATE_SIMILARITY) -> List[Dict[str, Any]]:
+    """Order results by maximal marginal relevance, dropping near-duplicates
+
+    Each step picks the result maximizing
+    ``lambda * relevance - (1 - lambda) * max similarity to those picked``.
+    Relevance is the retrieval score scaled to [0, 1]; similarity is the
+    cosine of term-frequency vectors, so no embeddings are needed.
+    """
+    if not results:
+        return []
+    scores = [result['score'] for result in results]
+    low, high = min(scores), max(scores)
+    relevance = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+    vectors = [_term_vector(result['text_content']) for result in results]
+
+    remaining = list(range(len(results)))
+    max_similarity = [0.0] * len(results)
+    ordered = []
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * max_similarity[i])
+        remaining.remove(best)
+        ordered.append(results[best])
+        for i in list(remaining):
+            max_similarity[i] = max(max_similarity[i], _cosine(vectors[best], vectors[i]))
+            if max_similarity[i] >= duplicate_similarity:
+                remaining.remove(i)
+    return ordered
+
+
+def build_context(results: List[Dict[str, Any]], max_tokens: Optional[int] = None,
+                  mmr_lambda: float = 0.7) -> str:
+    """Prompt context from search results: merged, MMR-ordered and packed into ``max_tokens``
+
+    Parts are taken in MMR order while they fit; parts that don't are
+    skipped so smaller later ones can still fill the budget, and whatever
+    is left at the end goes to a truncated copy of the first skipped part.
+    Tokens are counted locally with the chat model encoding.
+    """
+    items = mmr_order(merge_adjacent_chunks(results), mmr_lambda)
+
+    def header(number, item):
+        # Only cosine similarity reads as relevance; BM25 and fusion scores only order the parts
+        if item.get('similarity') is None:
+            return f"Document {number}: {item['document_name']}\n"
+        return f"Document {number}: {item['document_name']} (Relevance: {item['similarity']:.2f})\n"
+
+    chosen = {}  # MMR position -> text
+    used = 0
+    skipped = []
+    for position, item in enumerate(items):
+        if max_tokens:
+            # + the joining newline; numbers below 1000 are one token, so the placeholder costs the same
+            cost = count_tokens(f"{header(1, item)}{item['text_content']}\n", CHAT_ENCODING) + 1
+            if used + cost > max_tokens:
+                skipped.append(position)
+                continue
+            used += cost
+        chosen[position] = item['text_content']
+
+    if skipped:
+        item = items[skipped[0]]
+        available = max_tokens - used - count_tokens(header(1, item), CHAT_ENCODING) - 2
+        if available >= MIN_PART_TOKENS:
+            chosen[skipped[0]] = truncate_to_tokens(item['text_content'], available, CHAT_ENCODING)
+
+    parts = [
+        f"{header(number, items[position])}{chosen[position]}\n"
+        for number, position in enumerate(sorted(chosen), 1)
+    ]
+    logger.debug(f"Packed {len(parts)} of {len(items)} context parts from {len(results)} results")
+    return "\n".join(parts)
@@ -1,9 +1,27 @@
 import PyPDF2
+import asyncio
+import hashlib
 import re
+import time
 import uuid
-from typing import List, Dict, Any
-from .models import UserDocument, DocumentChunk
-from .pinecone_utils import get_pinecone_manager
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . import async_clients
+from .caching import EmbeddingCache, get_embedding_cache, get_chunk_cache
+from .ingestion_pipeline import StreamingIngestionPipeline
+from . import lexical_index
+from .models import UserDocument, DocumentChunk, UserMedicalProfile
+from .pdf_extraction import get_pdf_extraction_pool
+from .vector_store import get_vector_store
+from .text_chunker import TextChunker, ChunkSpan
+from .uploads import store_upload
 import openai
 from decouple import config
 import logging
@@ -12,209 +30,910 @@ logger = logging.getLogger(__name__)
 
 openai.api_key = config('OPENAI_API_KEY')
 
+# Transient OpenAI errors worth retrying; anything else fails the batch immediately
+RETRYABLE_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+
+# search_user_documents modes
+RETRIEVAL_MODES = ('vector', 'lexical', 'hybrid')
+
+# Search results, and False for ``complete`` when a failed retriever was degraded to fewer (or no) results
+SearchResults = namedtuple('SearchResults', ['results', 'complete'])
+
+# Retrieval behind the medical context of image analysis (see get_medical_profile)
+MEDICAL_PROFILE_QUERY = "food safety"
+MEDICAL_PROFILE_TOP_K = 5
+
+
+class DocumentAlreadyIngested(ValueError):
+    """process_document was handed a document that already has a completed revision"""
+
+
+def chunk_content_hash(text: str) -> str:
+    """SHA-256 of a chunk's normalized text, used to match chunks across revisions"""
+    return hashlib.sha256(EmbeddingCache.normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def invalidate_medical_profile(user_id: str) -> None:
+    """Mark the user's cached medical context (and cached answers) stale after their documents change"""
+    UserMedicalProfile.objects.get_or_create(user_id=user_id)
+    UserMedicalProfile.objects.filter(user_id=user_id).update(document_version=F('document_version') + 1)
+
+
+def document_version(user_id: str) -> int:
+    """Counter bumped whenever the user's documents change (0 before the first upload)"""
+    return UserMedicalProfile.objects.filter(user_id=user_id).values_list('document_version', flat=True).first() or 0
+
+
+async def adocument_version(user_id: str) -> int:
+    """document_version for async views"""
+    return await UserMedicalProfile.objects.filter(user_id=user_id).values_list('document_version', flat=True).afirst() or 0
+
+
 class DocumentProcessor:
     """Process documents and store them in vector database"""
     
     def __init__(self):
-        self.pinecone_manager = get_pinecone_manager()
-        self.chunk_size = 1000  # Characters per chunk
-        self.chunk_overlap = 200  # Overlap between chunks
+        self.pinecone_manager = get_vector_store()
+        self.chunker = TextChunker(
+            max_tokens=settings.CHUNK_MAX_TOKENS,  # Tokens per chunk
+            overlap_tokens=settings.CHUNK_OVERLAP_TOKENS  # Overlap between chunks
+        )
+        self.embedding_model = settings.EMBEDDING_MODEL
+        self.embedding_batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.embedding_batch_max_tokens = settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.embedding_max_concurrency = settings.EMBEDDING_MAX_CONCURRENCY
+        self.embedding_max_retries = max(1, settings.EMBEDDING_MAX_RETRIES)  # Attempts per batch; 0 would make none
+        self.embedding_retry_backoff = settings.EMBEDDING_RETRY_BACKOFF
     
-    def extract_text_from_pdf(self, pdf_file) -> str:
-        """Extract text from PDF file"""
+    def vector_namespace(self, user_id: str) -> Optional[str]:
+        """Pinecone namespace for a user's vectors (None means the shared namespace)"""
+        if settings.PINECONE_USER_NAMESPACES:
+            return self.pinecone_manager.user_namespace(user_id)
+        return None
+    
+    def iter_pdf_pages(self, pdf_file) -> Iterator[str]:
+        """Yield the text of each PDF page in order
+        
+        Pages are parsed in the PDF extraction process pool when it is enabled.
+        """
         try:
+            pool = get_pdf_extraction_pool()
+            if pool is not None:
+                yield from pool.iter_pages(pdf_file)
+                return
+            
             pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
             for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+                yield page.extract_text() or ""
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise
     
+    def extract_text_from_pdf(self, pdf_file) -> str:
+        """Extract text from PDF file"""
+        return "\n".join(self.iter_pdf_pages(pdf_file))
+    
     def create_text_chunks(self, text: str) -> List[str]:
-        """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + self.chunk_size
-            
-            # If this is not the last chunk, try to break at a sentence boundary
-            if end < len(text):
-                # Look for sentence endings
-                sentence_endings = ['.', '!', '?', '\n\n']
-                for ending in sentence_endings:
-                    last_ending = text.rfind(ending, start, end)
-                    if last_ending > start + self.chunk_size * 0.7:  # Only break if we're not too early
-                        end = last_ending + 1
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # Move start position with overlap
-            start = end - self.chunk_overlap
-            if start >= len(text):
-                break
-        
-        return chunks
-    
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for text chunks using OpenAI"""
-        embeddings = []
-        
-        for text in texts:
+        """Split text into overlapping, token-budgeted chunks"""
+        return [text[span.start:span.end] for span in self.chunker.split(text)]
+    
+    def iter_text_chunks(self, pages: Iterable[str]) -> Iterator[Tuple[ChunkSpan, str]]:
+        """Streaming version of create_text_chunks
+        
+        Yields (span, text) pairs as soon as enough text has arrived. Span
+        offsets are into ``"\n".join(pages)``, i.e. the stored extracted_text.
+        """
+        def pieces():
+            for i, page_text in enumerate(pages):
+                yield page_text if i == 0 else "\n" + page_text
+        
+        return self.chunker.iter_chunks(pieces())
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Rough token count used for batch packing (~4 characters per token)"""
+        return len(text) // 4 + 1
+    
+    def _build_embedding_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into batches under the item and token limits"""
+        batches = []
+        current_batch = []
+        current_tokens = 0
+        
+        for i, text in enumerate(texts):
+            tokens = self._estimate_tokens(text)
+            if current_batch and (len(current_batch) >= self.embedding_batch_size or
+                                  current_tokens + tokens > self.embedding_batch_max_tokens):
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+            current_batch.append(i)
+            current_tokens += tokens
+        
+        if current_batch:
+            batches.append(current_batch)
+        
+        return batches
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch with a single request, retrying transient failures"""
+        for attempt in range(1, self.embedding_max_retries + 1):
             try:
                 response = openai.Embedding.create(
-                    input=text,
-                    model="text-embedding-ada-002"
+                    input=texts,
+                    model=self.embedding_model
                 )
-                embedding = response['data'][0]['embedding']
-                embeddings.append(embedding)
-            except Exception as e:
-                logger.error(f"Error generating embedding: {str(e)}")
-                raise
+                # The API may return items out of order; restore input order
+                data = sorted(response['data'], key=lambda item: item['index'])
+                return [item['embedding'] for item in data]
+            except RETRYABLE_OPENAI_ERRORS as e:
+                if attempt == self.embedding_max_retries:
+                    raise
+                delay = self.embedding_retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"Embedding batch failed (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+    
+    def generate_embeddings(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """Generate embeddings for text chunks, serving repeats from the embedding cache
+        
+        Bulk jobs pass ``use_cache=False`` so they don't evict the entries live traffic uses.
+        """
+        if not texts:
+            return []
+        
+        cache = get_embedding_cache() if use_cache else None
+        if cache is None:
+            return self._request_embeddings(texts)
+        
+        embeddings = cache.get_many(texts, self.embedding_model)
+        
+        # Embed each distinct uncached text once
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = self._request_embeddings(missing)
+            cache.set_many(missing, new_embeddings, self.embedding_model)
+            by_text = dict(zip(missing, new_embeddings))
+            embeddings = [
+                embedding if embedding is not None else by_text[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
         
         return embeddings
     
-    def store_document_vectors(self, user_id: str, document_name: str, 
-                             chunks: List[str], embeddings: List[List[float]], 
-                             document_type: str = 'other') -> UserDocument:
-        """Store document chunks in Pinecone and create database records"""
-        
-        # Create document record
-        document = UserDocument.objects.create(
-            user_id=user_id,
-            document_name=document_name,
-            document_type=document_type,
-            extracted_text="\n\n".join(chunks),
-            processing_status='processing'
-        )
+    def embed_query(self, query: str) -> List[float]:
+        """Embedding of a search query"""
+        return self.generate_embeddings([query])[0]
+    
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings using OpenAI
         
-        vector_ids = []
-        chunk_records = []
+        Texts are packed into multi-input requests and several batches are
+        sent concurrently. Embeddings are returned in the order of ``texts``.
+        """
+        embeddings = [None] * len(texts)
+        batches = self._build_embedding_batches(texts)
+        max_workers = max(1, min(self.embedding_max_concurrency, len(batches)))
         
+        executor = ThreadPoolExecutor(max_workers=max_workers)
         try:
-            # Prepare vectors for Pinecone
-            vectors = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                vector_id = f"doc_{document.id}_chunk_{i}_user_{user_id}"
-                
-                vector_data = {
-                    "id": vector_id,
-                    "values": embedding,
-                    "metadata": {
-                        "user_id": user_id,
-                        "document_id": str(document.id),
-                        "document_name": document_name,
-                        "document_type": document_type,
-                        "chunk_index": i,
-                        "text_content": chunk,
-                        "source": "user_document"
-                    }
-                }
-                vectors.append(vector_data)
-                
-                # Create chunk record
-                chunk_record = DocumentChunk(
-                    document=document,
-                    chunk_index=i,
-                    text_content=chunk,
-                    vector_id=vector_id
+            futures = {
+                executor.submit(self._embed_batch, [texts[i] for i in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_embeddings = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating embeddings for batch of {len(batch)} texts: {str(e)}")
+                    raise
+                for i, embedding in zip(batch, batch_embeddings):
+                    embeddings[i] = embedding
+        finally:
+            # Don't start queued batches once one has failed for good
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        return embeddings
+    
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        """_embed_batch without blocking the event loop"""
+        for attempt in range(1, self.embedding_max_retries + 1):
+            try:
+                response = await async_clients.create_embeddings(
+                    input=texts,
+                    model=self.embedding_model
                 )
-                chunk_records.append(chunk_record)
-                vector_ids.append(vector_id)
-            
-            # Store vectors in Pinecone
-            success = self.pinecone_manager.upsert_vectors(vectors)
-            
-            if success:
-                # Save chunk records to database
-                DocumentChunk.objects.bulk_create(chunk_records)
-                
-                # Update document with vector IDs
-                document.vector_ids = vector_ids
-                document.processing_status = 'completed'
-                document.save()
-                
-                logger.info(f"Successfully stored document {document.id} with {len(chunks)} chunks")
-                return document
-            else:
-                document.processing_status = 'failed'
-                document.save()
-                raise Exception("Failed to store vectors in Pinecone")
-                
+                # The API may return items out of order; restore input order
+                data = sorted(response['data'], key=lambda item: item['index'])
+                return [item['embedding'] for item in data]
+            except RETRYABLE_OPENAI_ERRORS as e:
+                if attempt == self.embedding_max_retries:
+                    raise
+                delay = self.embedding_retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"Embedding batch failed (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+    
+    async def agenerate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """generate_embeddings for async views: cache lookups run in a thread, requests don't block"""
+        if not texts:
+            return []
+        
+        cache = get_embedding_cache()
+        if cache is None:
+            return await self._arequest_embeddings(texts)
+        
+        embeddings = await sync_to_async(cache.get_many, thread_sensitive=False)(texts, self.embedding_model)
+        
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = await self._arequest_embeddings(missing)
+            await sync_to_async(cache.set_many, thread_sensitive=False)(missing, new_embeddings, self.embedding_model)
+            by_text = dict(zip(missing, new_embeddings))
+            embeddings = [
+                embedding if embedding is not None else by_text[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        
+        return embeddings
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """embed_query for async views"""
+        return (await self.agenerate_embeddings([query]))[0]
+    
+    async def _arequest_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """_request_embeddings with the batches as concurrent coroutines instead of threads"""
+        batches = self._build_embedding_batches(texts)
+        semaphore = asyncio.Semaphore(max(1, self.embedding_max_concurrency))
+        
+        async def embed(batch):
+            async with semaphore:
+                return await self._aembed_batch([texts[i] for i in batch])
+        
+        try:
+            results = await asyncio.gather(*(embed(batch) for batch in batches))
         except Exception as e:
-            document.processing_status = 'failed'
-            document.save()
-            logger.error(f"Error storing document vectors: {str(e)}")
+            logger.error(f"Error generating embeddings for {len(texts)} texts: {str(e)}")
             raise
+        
+        embeddings = [None] * len(texts)
+        for batch, batch_embeddings in zip(batches, results):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+    
+    def vector_metadata(self, document: UserDocument, chunk_index: int, chunk: str,
+                        span: Optional[ChunkSpan] = None) -> Dict[str, Any]:
+        """Pinecone metadata stored with a chunk's vector
+        
+        By default only IDs and small filterable fields are stored; search
+        results are hydrated from DocumentChunk rows. PINECONE_METADATA_TEXT
+        restores the full copy of the chunk text and document details.
+        """
+        metadata = {
+            "user_id": document.user_id,
+            "document_id": str(document.id),
+            "document_type": document.document_type,
+            "chunk_index": chunk_index,
+            "source": "user_document"
+        }
+        if settings.PINECONE_METADATA_TEXT:
+            metadata["document_name"] = document.document_name
+            metadata["text_content"] = chunk
+            if span is not None:
+                metadata["start_offset"] = span.start
+                metadata["end_offset"] = span.end
+        return metadata
+    
+    def build_chunk_vector(self, document: UserDocument, chunk_index: int, chunk: str,
+                           embedding: List[float],
+                           span: Optional[ChunkSpan] = None) -> Tuple[Dict[str, Any], DocumentChunk]:
+        """Build the Pinecone vector and the (unsaved) DocumentChunk for one chunk
+        
+        ``span`` locates the chunk in the document's extracted_text. Vectors
+        added by a later revision get the revision in their ID so they never
+        collide with the vectors of chunks kept from earlier revisions.
+        """
+        if document.revision:
+            vector_id = f"doc_{document.id}_r{document.revision}_chunk_{chunk_index}_user_{document.user_id}"
+        else:
+            vector_id = f"doc_{document.id}_chunk_{chunk_index}_user_{document.user_id}"
+        
+        vector_data = {
+            "id": vector_id,
+            "values": embedding,
+            "metadata": self.vector_metadata(document, chunk_index, chunk, span)
+        }
+        
+        chunk_record = DocumentChunk(
+            document=document,
+            chunk_index=chunk_index,
+            text_content=chunk,
+            vector_id=vector_id,
+            embedding_model=self.embedding_model,
+            start_offset=span.start if span else None,
+            end_offset=span.end if span else None,
+            token_count=span.token_count if span else 0,
+            content_hash=chunk_content_hash(chunk)
+        )
+        
+        return vector_data, chunk_record
     
     def process_document(self, user_id: str, pdf_file, document_name: str, 
-                        document_type: str = 'other') -> UserDocument:
-        """Complete document processing pipeline"""
+                        document_type: str = 'other',
+                        document: Optional[UserDocument] = None) -> UserDocument:
+        """Complete document processing pipeline
         
-        try:
-            # Extract text from PDF
-            text = self.extract_text_from_pdf(pdf_file)
-            
-            # Create text chunks
-            chunks = self.create_text_chunks(text)
-            
-            # Generate embeddings
-            embeddings = self.generate_embeddings(chunks)
-            
-            # Store in vector database
-            document = self.store_document_vectors(
+        Pages are extracted, chunked, embedded and upserted as a stream with
+        the stages overlapping (see StreamingIngestionPipeline), so vectors
+        are written before the whole PDF has been read.
+        """
+        
+        if document is None:
+            document = UserDocument.objects.create(
                 user_id=user_id,
                 document_name=document_name,
-                chunks=chunks,
-                embeddings=embeddings,
-                document_type=document_type
+                document_type=document_type,
+                processing_status='processing'
             )
+        elif document.vector_ids and document.chunks.exists():
+            # Re-running the pipeline would collide with the live chunks and then
+            # discard them; chunks left by a crashed attempt have no vector_ids yet
+            raise DocumentAlreadyIngested(f"Document {document.id} is already ingested")
+        
+        page_texts = []
+        
+        def pages():
+            for page_text in self.iter_pdf_pages(pdf_file):
+                page_texts.append(page_text)
+                yield page_text
+        
+        pipeline = StreamingIngestionPipeline(self, document)
+        try:
+            source = self._find_ingested_copy(document)
+            if source is not None:
+                # Same file already ingested (possibly by another user): reuse its
+                # text and chunks; embeddings come from the embedding cache
+                logger.info(f"Reusing chunks of document {source.id} for document {document.id}")
+                chunks = self._existing_chunks(source)
+                page_texts = [source.extracted_text]
+            else:
+                chunks = self.iter_text_chunks(pages())
             
+            vector_ids = pipeline.run(chunks)
+            if not vector_ids:
+                raise ValueError("No text could be extracted from the document")
+            
+            document.extracted_text = "\n".join(page_texts)
+            document.vector_ids = vector_ids
+            document.processing_status = 'completed'
+            document.processing_error = ''
+            document.processed_at = timezone.now()
+            # update_fields so a document deleted mid-ingestion is not re-created
+            document.save(update_fields=['extracted_text', 'vector_ids', 'processing_status',
+                                         'processing_error', 'processed_at'])
+            
+            self._rebuild_medical_profile(user_id)
+            logger.info(f"Successfully stored document {document.id} with {len(vector_ids)} chunks")
             return document
             
         except Exception as e:
             logger.error(f"Error processing document: {str(e)}")
+            self._discard_partial_ingestion(document, pipeline.stored_vector_ids)
             raise
     
-    def search_user_documents(self, user_id: str, query: str, top_k: int = 5) -> List[Dict]:
-        """Search user's documents for relevant information"""
+    def _find_ingested_copy(self, document: UserDocument) -> Optional[UserDocument]:
+        """A completed document with identical file content, from any user"""
+        if not document.content_hash:
+            return None
+        return (UserDocument.objects
+                .filter(content_hash=document.content_hash, processing_status='completed')
+                .exclude(id=document.id)
+                .order_by('-processed_at')
+                .first())
+    
+    def _existing_chunks(self, source: UserDocument) -> List[Tuple[Optional[ChunkSpan], str]]:
+        """(span, text) pairs of an ingested document's chunks, in order"""
+        rows = source.chunks.order_by('chunk_index').values_list(
+            'start_offset', 'end_offset', 'token_count', 'text_content'
+        )
+        return [
+            (ChunkSpan(start, end, tokens) if start is not None else None, text)
+            for start, end, tokens, text in rows
+        ]
+    
+    def _discard_partial_ingestion(self, document: UserDocument, vector_ids: List[str]) -> None:
+        """Remove vectors and chunks written before a failure so a retry starts clean"""
+        try:
+            if vector_ids:
+                self.pinecone_manager.delete_vectors(vector_ids, namespace=self.vector_namespace(document.user_id))
+            DocumentChunk.objects.filter(document_id=document.id).delete()
+        except Exception as e:
+            logger.error(f"Error cleaning up partial ingestion of document {document.id}: {str(e)}")
+        document.processing_status = 'failed'
+        UserDocument.objects.filter(id=document.id).update(processing_status='failed')
+    
+    def replace_document(self, user_id: str, document_id: str, pdf_file,
+                         document_name: Optional[str] = None) -> Tuple[UserDocument, Dict[str, int]]:
+        """Replace a document's file with a revised version, re-embedding only what changed
+        
+        The new text is re-chunked and each chunk is matched to an existing
+        DocumentChunk by content hash. Matched chunks keep their vectors and
+        are only re-ordered; new chunks are embedded and upserted; vectors of
+        chunks that no longer occur are deleted. Vector metadata of kept
+        chunks is left as is, so the DocumentChunk rows are authoritative for
+        chunk order and offsets.
         
+        Raises UserDocument.DoesNotExist if the user has no such document and
+        ValueError if it is still being ingested. Returns (document, stats).
+        """
+        document = UserDocument.objects.get(id=document_id, user_id=user_id)
+        
+        # Claim the document so a concurrent replace can't interleave. 'replacing'
+        # rather than 'processing': a stale replace is reset to 'completed' by
+        # requeue_stale_documents, never handed to the ingestion queue
+        claimed = UserDocument.objects.filter(id=document.id, processing_status='completed').update(
+            processing_status='replacing',
+            processing_started_at=timezone.now()
+        )
+        if not claimed:
+            raise ValueError(f"Document is {document.processing_status}; it can only be replaced once ingested")
+        
+        namespace = self.vector_namespace(user_id)
+        storage_path = None
+        new_vector_ids = []
         try:
-            # Generate query embedding
-            query_embedding = self.generate_embeddings([query])[0]
+            storage_path, content_hash, file_size = store_upload(
+                user_id, pdf_file, document_name or document.document_name
+            )
+            if content_hash == document.content_hash:
+                default_storage.delete(storage_path)
+                UserDocument.objects.filter(id=document.id).update(processing_status='completed')
+                chunk_count = len(document.vector_ids)
+                return document, {'kept': chunk_count, 'added': 0, 'removed': 0}
+            
+            with default_storage.open(storage_path, 'rb') as stored_file:
+                page_texts = list(self.iter_pdf_pages(stored_file))
+            extracted_text = "\n".join(page_texts)
+            new_chunks = list(self.iter_text_chunks(page_texts))
+            if not new_chunks:
+                raise ValueError("No text could be extracted from the document")
+            
+            # Existing chunks by content hash (a repeated chunk can match several rows)
+            existing = {}
+            for chunk in document.chunks.order_by('chunk_index'):
+                key = chunk.content_hash or chunk_content_hash(chunk.text_content)
+                existing.setdefault(key, []).append(chunk)
+            
+            kept = []    # (new index, span, text, existing row)
+            added = []   # (new index, span, text)
+            for i, (span, text) in enumerate(new_chunks):
+                matches = existing.get(chunk_content_hash(text))
+                if matches:
+                    kept.append((i, span, text, matches.pop(0)))
+                else:
+                    added.append((i, span, text))
+            removed = [chunk for matches in existing.values() for chunk in matches]
+            
+            document.revision += 1
+            if document_name:
+                document.document_name = document_name
+            
+            # Write new vectors first: until the rows are swapped below, a
+            # failure leaves the previous revision fully intact
+            vector_ids = {}
+            new_records = []
+            if added:
+                embeddings = self.generate_embeddings([text for _, _, text in added])
+                vectors = []
+                for (index, span, text), embedding in zip(added, embeddings):
+                    vector, chunk_record = self.build_chunk_vector(document, index, text, embedding, span)
+                    vectors.append(vector)
+                    new_records.append(chunk_record)
+                    vector_ids[index] = vector['id']
+                new_vector_ids = list(vector_ids.values())
+                results = self.pinecone_manager.upsert_vectors(vectors, namespace=namespace)
+                if not self.pinecone_manager.upsert_succeeded(results):
+                    raise Exception("Failed to store vectors in Pinecone")
+            
+            for index, span, text, chunk in kept:
+                vector_ids[index] = chunk.vector_id
+                chunk.chunk_index = index
+                chunk.text_content = text
+                chunk.start_offset = span.start
+                chunk.end_offset = span.end
+                chunk.token_count = span.token_count
+                chunk.content_hash = chunk_content_hash(text)
+            
+            old_file_path = document.file_path
+            document.file_path = storage_path
+            document.file_size = file_size
+            document.content_hash = content_hash
+            document.extracted_text = extracted_text
+            document.vector_ids = [vector_ids[i] for i in sorted(vector_ids)]
+            document.processing_status = 'completed'
+            document.processing_error = ''
+            document.processed_at = timezone.now()
+            
+            with transaction.atomic():
+                DocumentChunk.objects.filter(id__in=[chunk.id for chunk in removed]).delete()
+                kept_rows = [chunk for _, _, _, chunk in kept]
+                # Park kept rows on negative indexes first so re-ordering can't
+                # collide with (document, chunk_index) uniqueness
+                final_indexes = [chunk.chunk_index for chunk in kept_rows]
+                for chunk in kept_rows:
+                    chunk.chunk_index = -1 - chunk.chunk_index
+                DocumentChunk.objects.bulk_update(kept_rows, ['chunk_index'])
+                for chunk, index in zip(kept_rows, final_indexes):
+                    chunk.chunk_index = index
+                DocumentChunk.objects.bulk_update(
+                    kept_rows,
+                    ['chunk_index', 'text_content', 'start_offset', 'end_offset', 'token_count', 'content_hash']
+                )
+                lexical_index.bulk_create_chunks(new_records)
+                document.save(update_fields=['document_name', 'revision', 'file_path', 'file_size',
+                                             'content_hash', 'extracted_text', 'vector_ids',
+                                             'processing_status', 'processing_error', 'processed_at'])
+            
+            # Kept chunks may have a new index or document name
+            self.invalidate_cached_chunks(chunk.vector_id for chunk in kept_rows + removed)
             
-            # Search in Pinecone with user filter
-            results = self.pinecone_manager.query_vectors(
+            # The new revision is live; stale vectors and the old file are now garbage
+            try:
+                if removed:
+                    self.pinecone_manager.delete_vectors([chunk.vector_id for chunk in removed], namespace=namespace)
+                if old_file_path and default_storage.exists(old_file_path):
+                    default_storage.delete(old_file_path)
+            except Exception as e:
+                logger.error(f"Error cleaning up previous revision of document {document.id}: {str(e)}")
+            
+            self._rebuild_medical_profile(user_id)
+            stats = {'kept': len(kept), 'added': len(added), 'removed': len(removed)}
+            logger.info(f"Replaced document {document.id} (revision {document.revision}): "
+                        f"{stats['kept']} chunks kept, {stats['added']} added, {stats['removed']} removed")
+            return document, stats
+            
+        except Exception as e:
+            logger.error(f"Error replacing document {document.id}: {str(e)}")
+            try:
+                if new_vector_ids:
+                    self.pinecone_manager.delete_vectors(new_vector_ids, namespace=self.vector_namespace(user_id))
+                if storage_path and default_storage.exists(storage_path):
+                    default_storage.delete(storage_path)
+            except Exception as cleanup_error:
+                logger.error(f"Error cleaning up failed replacement of document {document.id}: {str(cleanup_error)}")
+            UserDocument.objects.filter(id=document.id).update(processing_status='completed')
+            raise
+    
+    def search_user_documents(self, user_id: str, query: str, top_k: int = 5,
+                              mode: Optional[str] = None, strict: bool = False,
+                              query_embedding: Union[List[float], Future, None] = None) -> List[Dict]:
+        """Search user's documents for relevant information
+        
+        ``mode`` (default RETRIEVAL_MODE) is 'vector' for dense retrieval,
+        'lexical' for BM25 over the chunk postings, which never calls the
+        embedding API, or 'hybrid' to fuse both rankings with reciprocal rank
+        fusion. Exact tokens such as drug names, lab codes and units are what
+        dense retrieval tends to miss. In hybrid mode a failed embedding call
+        degrades to the lexical results. With ``strict``, errors are raised
+        instead (for results that get cached). ``query_embedding`` is the
+        query's embedding if already computed, or a Future of it still in
+        flight; BM25 then runs while it is awaited.
+        """
+        return self.search_with_status(user_id, query, top_k, mode, strict, query_embedding).results
+    
+    def search_with_status(self, user_id: str, query: str, top_k: int = 5,
+                           mode: Optional[str] = None, strict: bool = False,
+                           query_embedding: Union[List[float], Future, None] = None) -> SearchResults:
+        """search_user_documents, also reporting whether the results are complete
+        
+        Answers built on incomplete results must not be cached.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        
+        try:
+            if mode == 'vector':
+                matches = self._vector_search(user_id, query, top_k, query_embedding)
+                return SearchResults(self._with_similarity(self.hydrate_matches(matches), matches), True)
+            
+            candidates = max(top_k, settings.RETRIEVAL_CANDIDATES)
+            lexical_matches = lexical_index.search(user_id, query, top_k=candidates)
+            if mode == 'lexical':
+                return SearchResults(self._with_similarity(self.hydrate_matches(lexical_matches[:top_k]), []), True)
+            
+            complete = True
+            try:
+                vector_matches = self._vector_search(user_id, query, candidates, query_embedding)
+            except Exception as e:
+                if strict:
+                    raise
+                logger.error(f"Vector search failed, using lexical results only: {str(e)}")
+                vector_matches = []
+                complete = False
+            fused = lexical_index.reciprocal_rank_fusion([vector_matches, lexical_matches], k=settings.RRF_K)
+            return SearchResults(self._with_similarity(self.hydrate_matches(fused[:top_k]), vector_matches), complete)
+            
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Error searching user documents: {str(e)}")
+            return SearchResults([], False)
+    
+    async def asearch_user_documents(self, user_id: str, query: str, top_k: int = 5,
+                                     mode: Optional[str] = None, strict: bool = False,
+                                     query_embedding: Union[List[float], asyncio.Future, None] = None) -> List[Dict]:
+        """search_user_documents for async views
+        
+        The embedding and vector query don't block the event loop; ORM work
+        runs in a thread. In hybrid mode BM25 and the vector search run
+        concurrently. ``query_embedding`` may be a task computing it.
+        """
+        return (await self.asearch_with_status(user_id, query, top_k, mode, strict, query_embedding)).results
+    
+    async def asearch_with_status(self, user_id: str, query: str, top_k: int = 5,
+                                  mode: Optional[str] = None, strict: bool = False,
+                                  query_embedding: Union[List[float], asyncio.Future, None] = None) -> SearchResults:
+        """search_with_status for async views"""
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        
+        lexical_search = sync_to_async(lexical_index.search)
+        hydrate_matches = sync_to_async(self.hydrate_matches)
+        try:
+            if mode == 'vector':
+                matches = await self._avector_search(user_id, query, top_k, query_embedding)
+                return SearchResults(self._with_similarity(await hydrate_matches(matches), matches), True)
+            
+            if mode == 'lexical':
+                matches = await lexical_search(user_id, query, top_k=top_k)
+                return SearchResults(self._with_similarity(await hydrate_matches(matches), []), True)
+            
+            candidates = max(top_k, settings.RETRIEVAL_CANDIDATES)
+            lexical_matches, vector_matches = await asyncio.gather(
+                lexical_search(user_id, query, top_k=candidates),
+                self._avector_search(user_id, query, candidates, query_embedding),
+                return_exceptions=True
+            )
+            if isinstance(lexical_matches, Exception):
+                raise lexical_matches
+            complete = True
+            if isinstance(vector_matches, Exception):
+                if strict:
+                    raise vector_matches
+                logger.error(f"Vector search failed, using lexical results only: {str(vector_matches)}")
+                vector_matches = []
+                complete = False
+            fused = lexical_index.reciprocal_rank_fusion([vector_matches, lexical_matches], k=settings.RRF_K)
+            return SearchResults(self._with_similarity(await hydrate_matches(fused[:top_k]), vector_matches), complete)
+            
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Error searching user documents: {str(e)}")
+            return SearchResults([], False)
+    
+    async def _avector_search(self, user_id: str, query: str, top_k: int,
+                              query_embedding: Union[List[float], asyncio.Future, None] = None):
+        """_vector_search for async views"""
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
+        elif isinstance(query_embedding, asyncio.Future):
+            query_embedding = await query_embedding
+        
+        if settings.PINECONE_USER_NAMESPACES:
+            return await self.pinecone_manager.aquery_vectors(
                 query_vector=query_embedding,
                 top_k=top_k,
                 include_metadata=True,
-                filter={"user_id": user_id}
+                namespace=self.vector_namespace(user_id),
+                raise_errors=True
             )
-            
-            # Format results
-            formatted_results = []
-            for match in results:
-                formatted_results.append({
-                    'id': match.id,
-                    'score': match.score,
-                    'text_content': match.metadata.get('text_content', ''),
-                    'document_name': match.metadata.get('document_name', ''),
-                    'document_type': match.metadata.get('document_type', ''),
-                    'chunk_index': match.metadata.get('chunk_index', 0),
-                    'metadata': match.metadata
-                })
-            
-            return formatted_results
-            
+        
+        return await self.pinecone_manager.aquery_vectors(
+            query_vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter={"user_id": user_id},
+            raise_errors=True
+        )
+    
+    def _vector_search(self, user_id: str, query: str, top_k: int,
+                       query_embedding: Union[List[float], Future, None] = None):
+        """Dense top-k matches for a query (embeds the query unless given its embedding)
+        
+        Embedding and vector store errors are raised; non-strict searches degrade on them.
+        """
+        
+        # Generate query embedding
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        elif isinstance(query_embedding, Future):
+            query_embedding = query_embedding.result()
+        
+        if settings.PINECONE_USER_NAMESPACES:
+            # Only the user's own partition is scanned; no metadata filter needed
+            return self.pinecone_manager.query_vectors(
+                query_vector=query_embedding,
+                top_k=top_k,
+                include_metadata=True,
+                namespace=self.vector_namespace(user_id),
+                raise_errors=True
+            )
+
+        # Search in Pinecone with user filter
+        return self.pinecone_manager.query_vectors(
+            query_vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter={"user_id": user_id},
+            raise_errors=True
+        )
+    
+    @staticmethod
+    def _with_similarity(results: List[Dict], vector_matches) -> List[Dict]:
+        """Attach each hit's vector (cosine) score as ``similarity``, None for lexical-only hits
+        
+        ``score`` orders the results but is a BM25 or fusion score outside
+        vector mode; only ``similarity`` is shown in the prompt.
+        """
+        similarity = {match.id: match.score for match in vector_matches}
+        for result in results:
+            result['similarity'] = similarity.get(result['id'])
+        return results
+    
+    def hydrate_matches(self, matches) -> List[Dict]:
+        """Format vector matches with their chunk text and document details
+        
+        Chunks come from the chunk cache, then from one DocumentChunk query
+        for all misses. Legacy vectors that still carry text in their
+        metadata are used as is when their chunk row is gone; matches with
+        neither (vectors of deleted documents) are dropped.
+        """
+        cache = get_chunk_cache()
+        chunks = {}
+        missing = []
+        for match in matches:
+            chunk = cache.get(match.id) if cache is not None else None
+            if chunk is None:
+                missing.append(match.id)
+            else:
+                chunks[match.id] = chunk
+        
+        if missing:
+            rows = (DocumentChunk.objects
+                    .filter(vector_id__in=missing)
+                    .select_related('document')
+                    .only('vector_id', 'chunk_index', 'text_content', 'start_offset', 'end_offset',
+                          'document__id', 'document__document_name', 'document__document_type'))
+            for row in rows:
+                chunk = {
+                    'text_content': row.text_content,
+                    'document_id': str(row.document.id),
+                    'document_name': row.document.document_name,
+                    'document_type': row.document.document_type,
+                    'chunk_index': row.chunk_index,
+                    'start_offset': row.start_offset,
+                    'end_offset': row.end_offset,
+                }
+                chunks[row.vector_id] = chunk
+                if cache is not None:
+                    cache.set(row.vector_id, chunk)
+        
+        # Format results
+        formatted_results = []
+        for match in matches:
+            metadata = match.metadata or {}
+            chunk = chunks.get(match.id)
+            if chunk is None:
+                if 'text_content' not in metadata:
+                    continue
+                chunk = {
+                    'text_content': metadata.get('text_content', ''),
+                    'document_id': metadata.get('document_id', ''),
+                    'document_name': metadata.get('document_name', ''),
+                    'document_type': metadata.get('document_type', ''),
+                    'chunk_index': metadata.get('chunk_index', 0),
+                    'start_offset': metadata.get('start_offset'),
+                    'end_offset': metadata.get('end_offset'),
+                }
+            formatted_results.append({
+                'id': match.id,
+                'score': match.score,
+                **chunk,
+                'metadata': metadata
+            })
+        
+        return formatted_results
+    
+    def get_medical_profile(self, user_id: str) -> List[Dict]:
+        """The user's medical context chunks, retrieved once per change to their documents
+        
+        Served from UserMedicalProfile while no document has been uploaded,
+        ingested or deleted since it was built, which skips the embedding call
+        and the vector query. Otherwise it is rebuilt first.
+        """
+        profile, _ = UserMedicalProfile.objects.get_or_create(user_id=user_id)
+        if profile.is_current:
+            return profile.context_chunks
+        try:
+            return self.refresh_medical_profile(user_id, profile)
         except Exception as e:
-            logger.error(f"Error searching user documents: {str(e)}")
+            logger.error(f"Error building medical profile for user {user_id}: {str(e)}")
             return []
     
+    def refresh_medical_profile(self, user_id: str,
+                                profile: Optional[UserMedicalProfile] = None) -> List[Dict]:
+        """Retrieve the user's medical context and cache it at the current document version"""
+        if profile is None:
+            profile, _ = UserMedicalProfile.objects.get_or_create(user_id=user_id)
+        version = profile.document_version
+        
+        results = self.search_user_documents(user_id, MEDICAL_PROFILE_QUERY,
+                                             top_k=MEDICAL_PROFILE_TOP_K, strict=True)
+        context_chunks = self._profile_context_chunks(results)
+        
+        # Only store if no document changed while retrieving; otherwise the next request rebuilds
+        UserMedicalProfile.objects.filter(user_id=user_id, document_version=version).update(
+            context_chunks=context_chunks,
+            built_version=version,
+            built_at=timezone.now()
+        )
+        return context_chunks
+    
+    async def aget_medical_profile(self, user_id: str) -> List[Dict]:
+        """get_medical_profile for async views"""
+        profile, _ = await UserMedicalProfile.objects.aget_or_create(user_id=user_id)
+        if profile.is_current:
+            return profile.context_chunks
+        try:
+            version = profile.document_version
+            results = await self.asearch_user_documents(user_id, MEDICAL_PROFILE_QUERY,
+                                                        top_k=MEDICAL_PROFILE_TOP_K, strict=True)
+            context_chunks = self._profile_context_chunks(results)
+            await UserMedicalProfile.objects.filter(user_id=user_id, document_version=version).aupdate(
+                context_chunks=context_chunks,
+                built_version=version,
+                built_at=timezone.now()
+            )
+            return context_chunks
+        except Exception as e:
+            logger.error(f"Error building medical profile for user {user_id}: {str(e)}")
+            return []
+    
+    @staticmethod
+    def _profile_context_chunks(results: List[Dict]) -> List[Dict]:
+        """The JSON-serializable part of search results stored in UserMedicalProfile"""
+        return [
+            {**{key: result[key] for key in ('id', 'score', 'text_content', 'document_id', 'document_name',
+                                             'document_type', 'chunk_index', 'start_offset', 'end_offset')},
+             'similarity': result.get('similarity')}
+            for result in results
+        ]
+    
+    def _rebuild_medical_profile(self, user_id: str) -> None:
+        """Invalidate and re-retrieve the medical context after an ingestion (errors only logged)"""
+        invalidate_medical_profile(user_id)
+        try:
+            self.refresh_medical_profile(user_id)
+        except Exception as e:
+            logger.error(f"Error rebuilding medical profile for user {user_id}: {str(e)}")
+    
+    def invalidate_cached_chunks(self, vector_ids: Iterable[str]) -> None:
+        """Drop chunks from this process's chunk cache after they change"""
+        cache = get_chunk_cache()
+        if cache is not None:
+            for vector_id in vector_ids:
+                cache.delete(vector_id)
+    
     def get_user_documents(self, user_id: str) -> List[UserDocument]:
         """Get all documents for a user"""
         return UserDocument.objects.filter(
@@ -228,11 +947,20 @@ class DocumentProcessor:
             document = UserDocument.objects.get(id=document_id, user_id=user_id)
             
             # Delete vectors from Pinecone
-            if document.vector_ids:
+            if settings.PINECONE_USER_NAMESPACES:
+                # Every revision's vector IDs start with doc_<id>_
+                self.pinecone_manager.delete_by_prefix(f"doc_{document.id}_", namespace=self.vector_namespace(user_id))
+            elif document.vector_ids:
                 self.pinecone_manager.delete_vectors(document.vector_ids)
+            self.invalidate_cached_chunks(document.vector_ids)
+            
+            # Delete the stored upload
+            if document.file_path and default_storage.exists(document.file_path):
+                default_storage.delete(document.file_path)
             
             # Delete from database
             document.delete()
+            invalidate_medical_profile(user_id)
             
             logger.info(f"Successfully deleted document {document_id} for user {user_id}")
             return True
@@ -243,3 +971,26 @@ class DocumentProcessor:
         except Exception as e:
             logger.error(f"Error deleting document: {str(e)}")
             return False
+    
+    def delete_all_user_documents(self, user_id: str) -> int:
+        """Delete all of a user's documents, vectors and stored uploads; returns the document count"""
+        documents = list(UserDocument.objects.filter(user_id=user_id))
+        
+        if settings.PINECONE_USER_NAMESPACES:
+            if not self.pinecone_manager.delete_namespace(self.vector_namespace(user_id)):
+                raise Exception("Failed to delete the user's vectors")
+        else:
+            vector_ids = [vector_id for document in documents for vector_id in document.vector_ids]
+            for start in range(0, len(vector_ids), 1000):
+                if not self.pinecone_manager.delete_vectors(vector_ids[start:start + 1000]):
+                    raise Exception("Failed to delete the user's vectors")
+        
+        for document in documents:
+            self.invalidate_cached_chunks(document.vector_ids)
+            if document.file_path and default_storage.exists(document.file_path):
+                default_storage.delete(document.file_path)
+        UserDocument.objects.filter(user_id=user_id).delete()
+        invalidate_medical_profile(user_id)
+        
+        logger.info(f"Deleted {len(documents)} documents for user {user_id}")
+        return len(documents)
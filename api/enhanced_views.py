@@ -1,23 +1,152 @@
 import openai
-import base64
+import time
 import uuid
+from concurrent.futures import Future
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
 from decouple import config
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .caching import get_response_cache, get_image_analysis_cache
+from .chat_turn import ChatTurn
 from .firebase_auth import require_auth
-from .document_processor import DocumentProcessor
-from .models import UserDocument, UserChatSession, ChatMessage
+from .image_preprocessing import ImageRejected, ImagePreprocessingTimeout, prepare_image_upload, image_data_url
+from .context_packing import build_context
+from .document_processor import DocumentProcessor, RETRIEVAL_MODES, document_version
+from .ingestion_queue import enqueue_document, get_ingestion_worker_pool, wait_for_document
+from .message_buffer import get_chat_message_buffer
+from .models import UserDocument, UserChatSession
+from .streaming import EventStreamRenderer, wants_event_stream, stream_chat_completion
 import logging
 
 logger = logging.getLogger(__name__)
 
 openai.api_key = config('OPENAI_API_KEY')
 
+# Replies that need no model call
+DOCUMENTS_QUEUED_RESPONSE = "Your documents are being processed. I'll use them to answer your questions once they're ready."
+EMPTY_REQUEST_RESPONSE = "Please provide a message or image to analyze."
+
+
+def determine_document_type(filename: str) -> str:
+    """Determine document type based on filename"""
+    filename_lower = filename.lower()
+    
+    if any(keyword in filename_lower for keyword in ['blood', 'lab', 'test', 'result']):
+        return 'lab_result'
+    elif any(keyword in filename_lower for keyword in ['prescription', 'medication', 'rx']):
+        return 'prescription'
+    elif any(keyword in filename_lower for keyword in ['xray', 'mri', 'ct', 'imaging', 'scan']):
+        return 'imaging'
+    elif any(keyword in filename_lower for keyword in ['report', 'medical', 'health']):
+        return 'medical_report'
+    else:
+        return 'other'
+
+
+def build_prompt_context(search_results: list) -> str:
+    """Build context string from search results (de-duplicated and packed into the token budget)"""
+    return build_context(
+        search_results,
+        max_tokens=settings.RAG_CONTEXT_MAX_TOKENS,
+        mmr_lambda=settings.RAG_MMR_LAMBDA
+    )
+
+
+def rag_messages(query: str, search_results: list) -> list:
+    """Chat messages answering a text query from the retrieved document chunks"""
+    if not search_results:
+        # No relevant documents found - provide general response
+        return [
+            {"role": "system", "content": "You are a helpful medical assistant."},
+            {"role": "user", "content": query}
+        ]
+    
+    # Build context from retrieved documents
+    context = build_prompt_context(search_results)
+    
+    prompt = f"""Based on the user's medical documents, answer the following question:
+
+Question: {query}
+
+Relevant information from documents:
+{context}
+
+Please provide a comprehensive answer based on the information from the user's documents. If the documents don't contain enough information to answer the question, say so clearly."""
+    
+    return [
+        {"role": "system", "content": "You are a helpful medical Bestfriend. Use the provided document context to answer questions accurately. Give response as if one bestie is talking to another bestie."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def image_messages(medical_chunks: list, image_base64: str) -> list:
+    """Chat messages asking whether the pictured food is safe given the user's medical context"""
+    medical_context = build_prompt_context(medical_chunks)
+
+    prompt = f"""
+                The user has the following medical context:
+                {medical_context}
+
+                Analyze the uploaded food image and tell if it is safe for the user to eat based on their medical reports. Also, provide one more relevant health tip.
+                """
+
+    image_content = [
+        {"type": "text", "text": prompt},
+        {"type": "image_url", "image_url": {"url": image_base64}}
+    ]
+    return [
+        {"role": "system", "content": "You are a helpful medical nutritionist bestfriend. Use the user's medical context to analyze food images and provide safety advice. Give response as if one bestie is talking to another bestie."},
+        {"role": "user", "content": image_content}
+    ]
+
+
+def cache_hit_metadata(cached: tuple) -> dict:
+    """``cache`` field of a reply served from the semantic response cache"""
+    entry, similarity = cached
+    return {
+        'hit': True,
+        'similarity': round(similarity, 4),
+        'cached_query': entry.query,
+        'age_seconds': round(time.time() - entry.created_at, 1)
+    }
+
+
+def image_cache_hit_metadata(cached: tuple, fingerprint) -> dict:
+    """``cache`` field of an image analysis served from the image analysis cache"""
+    entry, distance = cached
+    return {
+        'hit': True,
+        'match': 'exact' if entry.fingerprint.sha256 == fingerprint.sha256 else 'perceptual',
+        'distance': distance,
+        'age_seconds': round(time.time() - entry.created_at, 1)
+    }
+
+
+def stream_metadata(session_id: str, user_id: str, sources: list, queued_documents: list = None) -> dict:
+    """First event of a streamed reply: the session and the retrieved sources"""
+    metadata = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'sources': [{
+            'document_id': result['document_id'],
+            'document_name': result['document_name'],
+            'chunk_index': result['chunk_index'],
+            'score': float(result['score'])
+        } for result in sources]
+    }
+    if queued_documents:
+        metadata['documents'] = queued_documents
+    return metadata
+
+
 class EnhancedChatView(APIView):
     """Enhanced chat view with Firebase auth, document processing, and RAG"""
     parser_classes = (MultiPartParser, FormParser, JSONParser)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer, EventStreamRenderer)
     
     def __init__(self):
         super().__init__()
@@ -25,57 +154,107 @@ class EnhancedChatView(APIView):
     
     @require_auth
     def post(self, request):
-        """Handle chat requests with authentication and RAG"""
+        """Handle chat requests with authentication and RAG
+
+        With ``stream`` set (or ``Accept: text/event-stream``) the reply is
+        streamed as server-sent events instead, see _stream_response.
+
+        The turn's stages are timed and overlapped (see ChatTurn): the query
+        embedding (or, for images, the medical context and preprocessing)
+        is started as soon as the request is parsed and runs while the
+        session is looked up.
+        Chat messages go to the write-behind buffer (see ChatMessageBuffer),
+        so no insert is on the response path. Stage timings are returned in
+        the Server-Timing header.
+        """
         try:
+            turn = ChatTurn()
             user_id = request.user_id
             user_message = request.data.get('message', '').strip()
             image_file = request.FILES.get('image', None)
             medical_report_files = request.FILES.getlist('medical_report', None)
             session_id = request.data.get('session_id') or str(uuid.uuid4())
+            retrieval_mode = request.data.get('retrieval_mode') or None
+            
+            if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+                return Response({
+                    'error': f'retrieval_mode must be one of: {", ".join(RETRIEVAL_MODES)}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Network calls that only need the parsed request go out first
+            query_embedding = None
+            medical_profile = None
+            prepared_image = None
+            if image_file:
+                medical_profile = turn.submit('medical_context', self.document_processor.get_medical_profile, user_id)
+                prepared_image = turn.submit('image_prepare', prepare_image_upload, image_file)
+            elif user_message and (retrieval_mode or settings.RETRIEVAL_MODE) != 'lexical':
+                query_embedding = turn.submit('embed', self.document_processor.embed_query, user_message)
             
             # Get or create chat session
-            session, created = UserChatSession.objects.get_or_create(
+            session, created = turn.run(
+                'session',
+                UserChatSession.objects.get_or_create,
                 session_id=session_id,
                 user_id=user_id,
                 defaults={'is_active': True}
             )
             ##################################################################
-            # Accept multiple files
+            # Accept multiple files; ingestion runs in the background queue
+            queued_documents = []
             if medical_report_files:
                 for medical_report_file in medical_report_files:
                     document_name = medical_report_file.name
                     document_type = self._determine_document_type(document_name)
                     try:
-                        # Process and store document
-                        document = self.document_processor.process_document(
+                        document, queued = enqueue_document(
                             user_id=user_id,
-                            pdf_file=medical_report_file,
+                            uploaded_file=medical_report_file,
                             document_name=document_name,
                             document_type=document_type
                         )
                         # Store system message about document upload
-                        ChatMessage.objects.create(
+                        if queued:
+                            content = f'Document "{document_name}" uploaded and queued for processing.'
+                        else:
+                            content = f'Document "{document_name}" was already uploaded as "{document.document_name}".'
+                        get_chat_message_buffer().add(
                             session=session,
                             message_type='system',
-                            content=f'Document "{document_name}" uploaded and processed successfully.',
-                            metadata={'document_id': str(document.id)}
+                            content=content,
+                            metadata={'document_id': str(document.id), 'duplicate': not queued}
                         )
-                        logger.info(f"Document processed for user {user_id}: {document_name}")
+                        queued_documents.append({
+                            'id': str(document.id),
+                            'document_name': document.document_name,
+                            'processing_status': document.processing_status,
+                            'duplicate': not queued
+                        })
                     except Exception as e:
-                        logger.error(f"Error processing document: {str(e)}")
+                        logger.error(f"Error queuing document: {str(e)}")
                         return Response({
-                            'error': f'Failed to process document: {str(e)}'
+                            'error': f'Failed to upload document: {str(e)}'
                         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             ##################################################################
             
             # Prepare user content
             user_content = []
+            image_base64 = None
+            image_fingerprint = None
             if user_message:
                 user_content.append({"type": "text", "text": user_message})
             
             if image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-                image_base64 = f"data:{image_file.content_type};base64,{image_data}"
+                try:
+                    prepared_image = prepared_image.result()
+                except ImageRejected as e:
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                except ImagePreprocessingTimeout:
+                    return Response({
+                        'error': 'The image could not be processed in time; please try again'
+                    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                image_base64 = image_data_url(prepared_image)
+                image_fingerprint = prepared_image.fingerprint
                 user_content.append({"type": "image_url", "image_url": {"url": image_base64}})
                 
                 # Add default image prompt if no text provided
@@ -86,69 +265,62 @@ class EnhancedChatView(APIView):
                     })
             
             # Store user message
-            ChatMessage.objects.create(
+            get_chat_message_buffer().add(
                 session=session,
                 message_type='user',
                 content=user_message or "Image analysis requested",
                 metadata={'has_image': bool(image_file)}
             )
             
+            if wants_event_stream(request):
+                stream = self._stream_response(
+                    user_id, user_message, image_base64, session,
+                    retrieval_mode, queued_documents,
+                    query_embedding=query_embedding, medical_profile=medical_profile,
+                    image_fingerprint=image_fingerprint, turn=turn
+                )
+                turn.finish()
+                stream['Server-Timing'] = turn.server_timing()
+                return stream
+            
             # Generate AI response with RAG if applicable
+            cache_info = None
             if user_message and not image_file:
                 # Text query - use RAG if user has documents
-                response = self._generate_rag_response(user_id, user_message, session)
+                response, cache_info = self._generate_rag_response(
+                    user_id, user_message, session, retrieval_mode,
+                    query_embedding=query_embedding, turn=turn
+                )
             elif image_file:
                 # Image query - use medical context for safety advice
-                # 1. Get medical context for user
-                medical_chunks = self.document_processor.search_user_documents(
-                    user_id=user_id,
-                    query="food safety",  # Use a generic query to get relevant medical info
-                    top_k=5
+                response, cache_info = self._generate_image_analysis(
+                    user_id, image_base64, image_fingerprint, medical_profile, turn
                 )
-                medical_context = self._build_context_from_results(medical_chunks)
-
-                # 2. Build prompt for OpenAI
-                prompt = f"""
-                The user has the following medical context:
-                {medical_context}
-
-                Analyze the uploaded food image and tell if it is safe for the user to eat based on their medical reports. Also, provide one more relevant health tip.
-                """
-
-                # 3. Prepare user content for OpenAI
-                image_content = [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": image_base64}}
-                ]
-
-                # 4. Get AI response
-                try:
-                    ai_response = openai.ChatCompletion.create(
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": "You are a helpful medical nutritionist bestfriend. Use the user's medical context to analyze food images and provide safety advice. Give response as if one bestie is talking to another bestie."},
-                            {"role": "user", "content": image_content}
-                        ]
-                    )
-                    response = ai_response.choices[0].message["content"]
-                except Exception as e:
-                    logger.error(f"Error generating image+medical response: {str(e)}")
-                    response = f"I apologize, but I encountered an error while analyzing the image: {str(e)}"
+            elif queued_documents:
+                response = DOCUMENTS_QUEUED_RESPONSE
             else:
-                response = "Please provide a message or image to analyze."
+                response = EMPTY_REQUEST_RESPONSE
             
             # Store assistant response
-            ChatMessage.objects.create(
+            get_chat_message_buffer().add(
                 session=session,
                 message_type='assistant',
                 content=response
             )
             
-            return Response({
+            response_data = {
                 'response': response,
                 'session_id': session_id,
                 'user_id': user_id
-            }, status=status.HTTP_200_OK)
+            }
+            if queued_documents:
+                response_data['documents'] = queued_documents
+            if cache_info is not None:
+                response_data['cache'] = cache_info
+            
+            turn.finish()
+            return Response(response_data, status=status.HTTP_200_OK,
+                            headers={'Server-Timing': turn.server_timing()})
             
         except Exception as e:
             logger.error(f"Error in enhanced chat: {str(e)}")
@@ -158,80 +330,204 @@ class EnhancedChatView(APIView):
     
     def _determine_document_type(self, filename: str) -> str:
         """Determine document type based on filename"""
-        filename_lower = filename.lower()
-        
-        if any(keyword in filename_lower for keyword in ['blood', 'lab', 'test', 'result']):
-            return 'lab_result'
-        elif any(keyword in filename_lower for keyword in ['prescription', 'medication', 'rx']):
-            return 'prescription'
-        elif any(keyword in filename_lower for keyword in ['xray', 'mri', 'ct', 'imaging', 'scan']):
-            return 'imaging'
-        elif any(keyword in filename_lower for keyword in ['report', 'medical', 'health']):
-            return 'medical_report'
-        else:
-            return 'other'
+        return determine_document_type(filename)
     
-    def _generate_rag_response(self, user_id: str, query: str, session: UserChatSession) -> str:
-        """Generate response using RAG (Retrieval-Augmented Generation)"""
-        try:
-            # Search user's documents
-            search_results = self.document_processor.search_user_documents(
-                user_id=user_id,
-                query=query,
-                top_k=3
+    def _stream_response(self, user_id: str, user_message: str, image_base64: str,
+                         session: UserChatSession, retrieval_mode: str = None,
+                         queued_documents: list = None, query_embedding=None,
+                         medical_profile=None, image_fingerprint=None, turn: ChatTurn = None):
+        """Stream the reply as server-sent events, retrieval metadata first
+
+        The assistant ChatMessage is stored when the stream completes, fails
+        or the client disconnects; ``completed`` in its metadata tells the
+        cases apart.
+        """
+        turn = turn or ChatTurn()
+        messages = None
+        sources = []
+        fixed_response = ""
+        cache_key, image_cache_key, cache_info = None, None, None
+        if user_message and not image_base64:
+            cache_key, cached = self._lookup_cached_response(user_id, retrieval_mode, query_embedding, turn)
+            if cached is not None:
+                fixed_response = cached[0].response
+                cache_info = cache_hit_metadata(cached)
+            else:
+                with turn.stage('retrieve'):
+                    messages, sources, complete = self._build_rag_messages(
+                        user_id, user_message, retrieval_mode, query_embedding
+                    )
+                if cache_key is not None:
+                    cache_info = {'hit': False}
+                if not complete:
+                    cache_key = None  # Don't cache an answer to degraded retrieval
+        elif image_base64:
+            image_cache_key, cached = self._lookup_cached_analysis(user_id, image_fingerprint, turn)
+            if cached is not None:
+                fixed_response = cached[0].response
+                cache_info = image_cache_hit_metadata(cached, image_cache_key[1])
+            else:
+                with turn.stage('retrieve'):
+                    messages, sources = self._build_image_messages(user_id, image_base64, medical_profile)
+                if image_cache_key is not None:
+                    cache_info = {'hit': False}
+        elif queued_documents:
+            fixed_response = DOCUMENTS_QUEUED_RESPONSE
+        else:
+            fixed_response = EMPTY_REQUEST_RESPONSE
+        
+        metadata = stream_metadata(session.session_id, user_id, sources, queued_documents)
+        if cache_info is not None:
+            metadata['cache'] = cache_info
+        
+        def on_finish(text: str, completed: bool) -> dict:
+            if completed and messages is not None and cache_key is not None:
+                get_response_cache().set(user_id, *cache_key, user_message, text)
+            if completed and messages is not None and image_cache_key is not None:
+                get_image_analysis_cache().set(user_id, *image_cache_key, text)
+            message = get_chat_message_buffer().add(
+                session=session,
+                message_type='assistant',
+                content=text,
+                metadata={'streamed': True, 'completed': completed}
             )
-            
-            if search_results:
-                # Build context from retrieved documents
-                context = self._build_context_from_results(search_results)
-                
-                # Generate response with context
-                prompt = f"""Based on the user's medical documents, answer the following question:
+            return {'message_id': str(message.id)}
+        
+        return stream_chat_completion(messages, metadata, on_finish, fixed_response=fixed_response)
+    
+    def _build_rag_messages(self, user_id: str, query: str, retrieval_mode: str = None,
+                            query_embedding=None) -> tuple:
+        """Chat messages for a text query, the search results used, and whether those are complete
 
-Question: {query}
+        ``query_embedding`` may be a Future of the query's embedding, started earlier in the turn.
+        """
+        # Search user's documents
+        search_results, complete = self.document_processor.search_with_status(
+            user_id=user_id,
+            query=query,
+            top_k=settings.RAG_TOP_K,
+            mode=retrieval_mode,
+            query_embedding=query_embedding
+        )
+        
+        return rag_messages(query, search_results), search_results, complete
+    
+    def _build_image_messages(self, user_id: str, image_base64: str, medical_profile=None) -> tuple:
+        """Chat messages for a food image, with the user's medical context, and the chunks used
 
-Relevant information from documents:
-{context}
+        ``medical_profile`` may be a Future of get_medical_profile, started earlier in the turn.
+        """
+        # Medical context for the user (cached until their documents change)
+        if medical_profile is not None:
+            medical_chunks = medical_profile.result()
+        else:
+            medical_chunks = self.document_processor.get_medical_profile(user_id)
+        return image_messages(medical_chunks, image_base64), medical_chunks
+    
+    def _lookup_cached_response(self, user_id: str, retrieval_mode: str, query_embedding,
+                                turn: ChatTurn) -> tuple:
+        """Look a text query up in the semantic response cache
 
-Please provide a comprehensive answer based on the information from the user's documents. If the documents don't contain enough information to answer the question, say so clearly."""
-                
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful medical Bestfriend. Use the provided document context to answer questions accurately. Give response as if one bestie is talking to another bestie."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                
-                return response.choices[0].message["content"]
-            else:
-                # No relevant documents found - provide general response
+        Returns the cache key (embedding, document version, mode) to store
+        the answer under, None when the cache is disabled or the query isn't
+        embedded (lexical mode), and the hit as (CachedResponse, similarity)
+        or None.
+        """
+        cache = get_response_cache()
+        if cache is None or query_embedding is None:
+            return None, None
+        with turn.stage('cache'):
+            try:
+                embedding = query_embedding.result() if isinstance(query_embedding, Future) else query_embedding
+            except Exception:
+                # Retrieval reports the failed embedding (and falls back to BM25 in hybrid mode)
+                return None, None
+            cache_key = (embedding, document_version(user_id), retrieval_mode or settings.RETRIEVAL_MODE)
+            return cache_key, cache.get(user_id, *cache_key)
+    
+    def _generate_rag_response(self, user_id: str, query: str, session: UserChatSession,
+                               retrieval_mode: str = None, query_embedding=None,
+                               turn: ChatTurn = None) -> tuple:
+        """Generate response using RAG (Retrieval-Augmented Generation)
+
+        Repeat questions are answered from the semantic response cache.
+        Returns the answer and the reply's ``cache`` field (None if the
+        cache wasn't consulted).
+        """
+        turn = turn or ChatTurn()
+        try:
+            cache_key, cached = self._lookup_cached_response(user_id, retrieval_mode, query_embedding, turn)
+            if cached is not None:
+                return cached[0].response, cache_hit_metadata(cached)
+            
+            with turn.stage('retrieve'):
+                messages, _, complete = self._build_rag_messages(user_id, query, retrieval_mode, query_embedding)
+            with turn.stage('completion'):
                 response = openai.ChatCompletion.create(
                     model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful medical assistant."},
-                        {"role": "user", "content": query}
-                    ]
+                    messages=messages
                 )
-                
-                return response.choices[0].message["content"]
+            
+            answer = response.choices[0].message["content"]
+            if cache_key is None:
+                return answer, None
+            if complete:
+                # An answer to degraded retrieval (e.g. a vector store outage) is not reused
+                get_response_cache().set(user_id, *cache_key, query, answer)
+            return answer, {'hit': False}
                 
         except Exception as e:
             logger.error(f"Error generating RAG response: {str(e)}")
-            return f"I apologize, but I encountered an error while processing your request: {str(e)}"
+            return f"I apologize, but I encountered an error while processing your request: {str(e)}", None
     
-    def _build_context_from_results(self, search_results: list) -> str:
-        """Build context string from search results"""
-        context_parts = []
+    def _lookup_cached_analysis(self, user_id: str, image_fingerprint, turn: ChatTurn) -> tuple:
+        """Look a food image up in the image analysis cache
+
+        Returns the cache key (document version, fingerprint), None when
+        the cache is disabled, and the hit as (CachedAnalysis, Hamming
+        distance) or None.
+        """
+        cache = get_image_analysis_cache()
+        if cache is None or image_fingerprint is None:
+            return None, None
+        with turn.stage('cache'):
+            cache_key = (document_version(user_id), image_fingerprint)
+            return cache_key, cache.get(user_id, *cache_key)
+    
+    def _generate_image_analysis(self, user_id: str, image_base64: str, image_fingerprint=None,
+                                 medical_profile=None, turn: ChatTurn = None) -> tuple:
+        """Analyse a food image against the user's medical context
+
+        A photo the user already sent (or a re-encoded copy of it) is
+        answered from the image analysis cache. Returns the analysis and the
+        reply's ``cache`` field (None if the cache wasn't consulted).
+        """
+        turn = turn or ChatTurn()
+        cache_key, cached = self._lookup_cached_analysis(user_id, image_fingerprint, turn)
+        if cached is not None:
+            return cached[0].response, image_cache_hit_metadata(cached, cache_key[1])
         
-        for i, result in enumerate(search_results, 1):
-            document_name = result['document_name']
-            text_content = result['text_content']
-            score = result['score']
-            
-            context_parts.append(f"Document {i}: {document_name} (Relevance: {score:.2f})\n{text_content}\n")
+        with turn.stage('retrieve'):
+            messages, _ = self._build_image_messages(user_id, image_base64, medical_profile)
+        try:
+            with turn.stage('completion'):
+                ai_response = openai.ChatCompletion.create(
+                    model="gpt-4o",
+                    messages=messages
+                )
+            response = ai_response.choices[0].message["content"]
+        except Exception as e:
+            logger.error(f"Error generating image+medical response: {str(e)}")
+            return f"I apologize, but I encountered an error while analyzing the image: {str(e)}", None
         
-        return "\n".join(context_parts)
+        if cache_key is None:
+            return response, None
+        get_image_analysis_cache().set(user_id, *cache_key, response)
+        return response, {'hit': False}
+    
+    def _build_context_from_results(self, search_results: list) -> str:
+        """Build context string from search results (de-duplicated and packed into the token budget)"""
+        return build_prompt_context(search_results)
     
     def _generate_image_response(self, user_content: list, session: UserChatSession) -> str:
         """Generate response for image analysis (without medical context)"""
@@ -289,11 +585,63 @@ class DocumentManagementView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @require_auth
-    def delete(self, request, document_id):
-        """Delete a user's document"""
+    def put(self, request, document_id):
+        """Replace a document with a revised file, re-embedding only changed chunks"""
+        try:
+            user_id = request.user_id
+            medical_report_file = request.FILES.get('medical_report', None)
+
+            if not medical_report_file:
+                return Response({
+                    'error': 'A medical_report file is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            document, changes = self.document_processor.replace_document(
+                user_id,
+                document_id,
+                medical_report_file,
+                document_name=request.data.get('document_name') or medical_report_file.name
+            )
+
+            return Response({
+                'message': 'Document replaced successfully',
+                'document': {
+                    'id': str(document.id),
+                    'document_name': document.document_name,
+                    'revision': document.revision,
+                    'processing_status': document.processing_status,
+                    'chunk_count': len(document.vector_ids)
+                },
+                'changes': changes
+            }, status=status.HTTP_200_OK)
+
+        except UserDocument.DoesNotExist:
+            return Response({
+                'error': 'Document not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error replacing document: {str(e)}")
+            return Response({
+                'error': f'Error replacing document: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @require_auth
+    def delete(self, request, document_id=None):
+        """Delete a user's document, or all of them (DELETE /api/documents/)"""
         try:
             user_id = request.user_id
             
+            if document_id is None:
+                deleted = self.document_processor.delete_all_user_documents(user_id)
+                return Response({
+                    'message': f'Deleted {deleted} documents',
+                    'deleted': deleted
+                }, status=status.HTTP_200_OK)
+            
             success = self.document_processor.delete_user_document(user_id, document_id)
             
             if success:
@@ -321,6 +669,8 @@ class ChatHistoryView(APIView):
         try:
             user_id = request.user_id
             session_id = request.GET.get('session_id')
+            # Read this process's own buffered writes (other workers' can lag by CHAT_MESSAGE_FLUSH_INTERVAL)
+            get_chat_message_buffer().flush()
             
             if session_id:
                 # Get specific session
@@ -374,4 +724,50 @@ class ChatHistoryView(APIView):
             logger.error(f"Error getting chat history: {str(e)}")
             return Response({
                 'error': f'Error retrieving chat history: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class DocumentStatusView(APIView):
+    """View for polling the ingestion status of an uploaded document"""
+    
+    @require_auth
+    def get(self, request, document_id):
+        """Get a document's processing status, optionally long-polling with ?wait=<seconds>"""
+        try:
+            user_id = request.user_id
+            
+            try:
+                document = UserDocument.objects.get(id=document_id, user_id=user_id)
+            except (UserDocument.DoesNotExist, ValueError, ValidationError):
+                return Response({
+                    'error': 'Document not found'
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            try:
+                wait = float(request.GET.get('wait', 0))
+            except ValueError:
+                wait = 0
+            wait = max(0, min(wait, settings.INGESTION_STATUS_MAX_WAIT))
+            
+            if settings.INGESTION_RUN_IN_PROCESS and document.processing_status == 'pending':
+                # Pick up jobs left over from before a restart
+                get_ingestion_worker_pool().start()
+            
+            if wait:
+                document = wait_for_document(document, wait)
+            
+            return Response({
+                'id': str(document.id),
+                'document_name': document.document_name,
+                'processing_status': document.processing_status,
+                'processing_error': document.processing_error,
+                'processing_attempts': document.processing_attempts,
+                'processed_at': document.processed_at.isoformat() if document.processed_at else None,
+                'chunk_count': len(document.vector_ids)
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"Error getting document status: {str(e)}")
+            return Response({
+                'error': f'Error retrieving document status: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
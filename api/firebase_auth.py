@@ -1,6 +1,8 @@
 import firebase_admin
+from asgiref.sync import sync_to_async
 from firebase_admin import credentials, auth
 from django.conf import settings
+from django.http import JsonResponse
 from rest_framework import status
 from rest_framework.response import Response
 import logging
@@ -113,3 +115,20 @@ def require_auth(view_func):
         return view_func(self, request, *args, **kwargs)
     
     return wrapper
+
+
+def async_require_auth(view_func):
+    """require_auth for async views; token verification runs in a worker thread"""
+    async def wrapper(self, request, *args, **kwargs):
+        user_info, error_response = await sync_to_async(get_user_from_request, thread_sensitive=False)(request)
+        
+        if error_response:
+            return JsonResponse(error_response.data, status=error_response.status_code)
+        
+        # Add user info to request
+        request.user_info = user_info
+        request.user_id = user_info['uid']
+        
+        return await view_func(self, request, *args, **kwargs)
+    
+    return wrapper
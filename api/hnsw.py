@@ -0,0 +1,226 @@
+import heapq
+import math
+import os
+import pickle
+import random
+from typing import List, Tuple, Callable, Hashable, Optional, Dict, Any
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HNSWIndex:
+    """Hierarchical Navigable Small World graph for approximate cosine search
+
+    Vectors are unit-normalized, so similarity is a dot product. Every node
+    is linked to up to ``m`` neighbours per layer (``2 * m`` on layer 0),
+    chosen with the diversity heuristic from the HNSW paper.
+    ``ef_construction`` and ``ef_search`` trade build/query time for recall.
+    Deletes are tombstones: deleted nodes still route searches but are never
+    returned, and ``compact()`` rebuilds the graph without them.
+    """
+
+    def __init__(self, dimension: int, m: int = 16, ef_construction: int = 100,
+                 ef_search: int = 64, seed: Optional[int] = None):
+        self.dimension = dimension
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_multiplier = 1 / math.log(m)
+        self._rng = random.Random(seed)
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.count = 0
+        self.labels = []       # Node -> label
+        self.nodes = {}        # Label -> live node
+        self.links = []        # Node -> per-layer neighbour lists
+        self.deleted = set()   # Tombstoned nodes
+        self.entry_point = None
+        self.max_level = -1
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, label: Hashable) -> bool:
+        return label in self.nodes
+
+    @property
+    def tombstone_ratio(self) -> float:
+        return len(self.deleted) / self.count if self.count else 0.0
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dimension)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int,
+                      level: int) -> List[Tuple[float, int]]:
+        """Best-first search of one layer; returns up to ``ef`` (similarity, node) pairs"""
+        visited = set(entry_points)
+        similarities = (self.vectors[entry_points] @ query).tolist()
+        candidates = [(-s, n) for s, n in zip(similarities, entry_points)]
+        results = [(s, n) for s, n in zip(similarities, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative < results[0][0]:
+                break
+            neighbours = [n for n in self.links[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for n, s in zip(neighbours, (self.vectors[neighbours] @ query).tolist()):
+                if len(results) < ef or s > results[0][0]:
+                    heapq.heappush(candidates, (-s, n))
+                    heapq.heappush(results, (s, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], limit: int) -> List[int]:
+        """Keep candidates closer to the base than to any already selected neighbour"""
+        candidates = sorted(candidates, reverse=True)
+        selected = []
+        for similarity, node in candidates:
+            if len(selected) >= limit:
+                break
+            if selected and float(np.max(self.vectors[selected] @ self.vectors[node])) > similarity:
+                continue
+            selected.append(node)
+        return selected
+
+    def add(self, label: Hashable, vector) -> None:
+        """Insert a vector (replacing any live vector with the same label)"""
+        if label in self.nodes:
+            self.delete(label)
+
+        if self.count == len(self.vectors):
+            grown = np.zeros((max(1024, 2 * len(self.vectors)), self.dimension), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+
+        query = self._normalize(vector)
+        node = self.count
+        self.vectors[node] = query
+        self.count += 1
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_multiplier)
+        self.labels.append(label)
+        self.links.append([[] for _ in range(level + 1)])
+        self.nodes[label] = node
+
+        if self.entry_point is None:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry_points = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            entry_points = [max(self._search_layer(query, entry_points, 1, layer))[1]]
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(query, entry_points, self.ef_construction, layer)
+            limit = self.m0 if layer == 0 else self.m
+            neighbours = self._select_neighbours(found, self.m)
+            self.links[node][layer] = neighbours
+            for neighbour in neighbours:
+                links = self.links[neighbour][layer]
+                links.append(node)
+                if len(links) > limit:
+                    similarities = (self.vectors[links] @ self.vectors[neighbour]).tolist()
+                    self.links[neighbour][layer] = self._select_neighbours(list(zip(similarities, links)), limit)
+            entry_points = [n for _, n in found]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def delete(self, label: Hashable) -> bool:
+        """Tombstone a label; returns False if it isn't indexed"""
+        node = self.nodes.pop(label, None)
+        if node is None:
+            return False
+        self.deleted.add(node)
+        return True
+
+    def search(self, vector, k: int, ef: Optional[int] = None,
+               accept: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[Hashable, float]]:
+        """Approximate top-k (label, cosine similarity), best first
+
+        ``accept`` filters labels; with a selective filter fewer than ``k``
+        results may come back, so callers should fall back to an exact scan.
+        """
+        if self.entry_point is None or k <= 0:
+            return []
+        query = self._normalize(vector)
+        entry_points = [self.entry_point]
+        for layer in range(self.max_level, 0, -1):
+            entry_points = [max(self._search_layer(query, entry_points, 1, layer))[1]]
+
+        ef = max(ef or self.ef_search, k)
+        found = sorted(self._search_layer(query, entry_points, ef, 0), reverse=True)
+
+        results = []
+        for similarity, node in found:
+            if node in self.deleted:
+                continue
+            label = self.labels[node]
+            if accept is not None and not accept(label):
+                continue
+            results.append((label, similarity))
+            if len(results) == k:
+                break
+        return results
+
+    def compact(self) -> None:
+        """Rebuild the graph from live nodes only, dropping tombstones"""
+        live = [(self.labels[node], self.vectors[node].copy()) for node in sorted(self.nodes.values())]
+        self.__init__(self.dimension, self.m, self.ef_construction, self.ef_search)
+        for label, vector in live:
+            self.add(label, vector)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'vectors': len(self.nodes),
+            'tombstones': len(self.deleted),
+            'max_level': self.max_level,
+            'm': self.m,
+            'ef_construction': self.ef_construction,
+            'ef_search': self.ef_search,
+            'vector_bytes': self.count * self.dimension * 4,
+        }
+
+    def save(self, path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+        """Persist the index (and caller bookkeeping in ``extra``) atomically"""
+        state = {
+            'params': (self.dimension, self.m, self.ef_construction, self.ef_search),
+            'vectors': self.vectors[:self.count],
+            'labels': self.labels,
+            'links': self.links,
+            'deleted': self.deleted,
+            'entry_point': self.entry_point,
+            'max_level': self.max_level,
+            'extra': extra or {},
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple['HNSWIndex', Dict[str, Any]]:
+        """Load an index written by save(); returns (index, extra). Only load trusted files."""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls(*state['params'])
+        index.vectors = np.array(state['vectors'], dtype=np.float32)
+        index.count = len(index.vectors)
+        index.labels = state['labels']
+        index.links = state['links']
+        index.deleted = state['deleted']
+        index.nodes = {label: node for node, label in enumerate(index.labels) if node not in index.deleted}
+        index.entry_point = state['entry_point']
+        index.max_level = state['max_level']
+        return index, state['extra']
@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import io
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Tuple, Union
+from django.conf import settings
+from .images import Image, ImageOps, ImageFingerprint, image_dhash
+import logging
+
+logger = logging.getLogger(__name__)
+
+# An upload ready to send to the vision model
+PreparedImage = namedtuple('PreparedImage', ['data', 'content_type', 'fingerprint', 'original_size'])
+
+
+class ImageRejected(Exception):
+    """The upload is too large (in bytes or pixels) to process"""
+
+
+class ImagePreprocessingTimeout(Exception):
+    """An image preprocessing job ran past its wall-clock limit"""
+
+
+def _read_source(source: Union[str, bytes]) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def _sha256(source: Union[str, bytes]) -> str:
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _prepare(source: Union[str, bytes], content_type: str, max_edge: int,
+             quality: int, max_pixels: int) -> Tuple[bytes, str, str, Optional[int]]:
+    """Worker job: (JPEG bytes, content type, SHA-256 of the original, dHash)
+
+    ``source`` is a file path or the upload's bytes. Files Pillow can't
+    decode are passed through unchanged, as before preprocessing existed.
+    """
+    sha256 = _sha256(source)
+    if Image is None:
+        return _read_source(source), content_type, sha256, None
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            # Header only so far: refuse decompression bombs before decoding
+            if image.width * image.height > max_pixels:
+                raise ImageRejected(f"Image is {image.width}x{image.height}; at most {max_pixels} pixels are accepted")
+            # JPEGs decode at the smallest 1/2, 1/4 or 1/8 scale that still covers the target size
+            scale = min(1.0, max_edge / max(image.size))
+            image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+            image = ImageOps.exif_transpose(image)  # Orientation is lost with the EXIF data
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            phash = image_dhash(image)
+            output = io.BytesIO()
+            # No exif/icc arguments: location and device metadata are not sent on
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+    except ImageRejected:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e))
+    except Exception as e:
+        # Unreadable headers and truncated or corrupt pixel data alike
+        logger.warning(f"Could not decode image, sending it unchanged: {str(e)}")
+        return _read_source(source), content_type, sha256, None
+    return output.getvalue(), 'image/jpeg', sha256, phash
+
+
+class ImagePreprocessingPool:
+    """Decode, downscale and re-encode uploaded images in worker processes
+
+    Phone photos are often 4-12 MB; the vision model sees at most a couple
+    of thousand pixels per edge. Doing the CPU-heavy decode and resize in
+    separate processes keeps it off the request threads and keeps the full
+    decoded bitmap out of the web worker's memory. If a job takes longer
+    than ``timeout`` seconds its workers are terminated and the pool rebuilt.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout  # Includes waiting behind other uploads and worker start-up
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web worker is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logger.warning("Terminating image preprocessing pool after a worker stopped responding")
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, *args) -> Tuple[bytes, str, str, Optional[int]]:
+        """Run one _prepare job in the pool"""
+        executor = self._get_executor()
+        future = executor.submit(_prepare, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._reset_executor(executor)
+            raise ImagePreprocessingTimeout("Image preprocessing worker stopped responding")
+
+
+def prepare_image_upload(uploaded_file) -> PreparedImage:
+    """Downscale and re-encode an uploaded image for a vision call, and fingerprint it
+
+    Uploads Django spooled to disk are handed to the worker by path, so the
+    original bytes are never held by the request; only the re-encoded JPEG
+    (typically a few hundred KB) comes back. Raises ImageRejected for
+    uploads over IMAGE_MAX_UPLOAD_BYTES or IMAGE_MAX_PIXELS, and
+    ImagePreprocessingTimeout if the pool doesn't finish within
+    IMAGE_PREPROCESS_TIMEOUT.
+    """
+    if uploaded_file.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Image is {uploaded_file.size} bytes; at most {settings.IMAGE_MAX_UPLOAD_BYTES} are accepted")
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        source = uploaded_file.temporary_file_path()
+    else:
+        uploaded_file.seek(0)
+        source = uploaded_file.read()
+    args = (source, uploaded_file.content_type, settings.IMAGE_MAX_EDGE,
+            settings.IMAGE_JPEG_QUALITY, settings.IMAGE_MAX_PIXELS)
+    pool = get_image_preprocessing_pool()
+    data, content_type, sha256, phash = pool.run(*args) if pool is not None else _prepare(*args)
+    return PreparedImage(data, content_type, ImageFingerprint(sha256, phash), uploaded_file.size)
+
+
+def image_data_url(image: PreparedImage) -> str:
+    """The image as a data URL for an ``image_url`` message part"""
+    return f"data:{image.content_type};base64,{base64.b64encode(image.data).decode('utf-8')}"
+
+
+# Global instance
+image_preprocessing_pool = None
+
+def get_image_preprocessing_pool() -> Optional[ImagePreprocessingPool]:
+    """Get or create the global image preprocessing pool (None when disabled)"""
+    global image_preprocessing_pool
+    if settings.IMAGE_PREPROCESS_WORKERS <= 0:
+        return None
+    if image_preprocessing_pool is None:
+        image_preprocessing_pool = ImagePreprocessingPool(
+            max_workers=settings.IMAGE_PREPROCESS_WORKERS,
+            timeout=settings.IMAGE_PREPROCESS_TIMEOUT
+        )
+    return image_preprocessing_pool
@@ -0,0 +1,29 @@
+from collections import namedtuple
+import numpy as np
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow images only match byte for byte
+    Image = None
+
+# Exact and perceptual identity of an uploaded image (phash is None if it couldn't be decoded)
+ImageFingerprint = namedtuple('ImageFingerprint', ['sha256', 'phash'])
+
+DHASH_SIZE = 8  # 8x8 gradient bits = 64-bit hash
+
+
+def image_dhash(image) -> int:
+    """64-bit difference hash (dHash) of a decoded, upright PIL image
+
+    Compares the brightness of neighbouring pixels in a tiny grayscale copy,
+    so the same photo re-encoded, rescaled or recompressed by the client
+    hashes to the same or a nearby value.
+    """
+    small = image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from typing import List, Iterable, Tuple
+from django.conf import settings
+from django.db import connection
+from . import lexical_index
+from .models import UserDocument
+from .text_chunker import ChunkSpan
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input
+_END = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has already failed"""
+
+
+class StreamingIngestionPipeline:
+    """Overlapping chunk -> embed -> upsert stages connected by bounded queues
+
+    The caller's thread pulls chunks from a (lazy) chunk iterator and groups
+    them into batches. Embedding worker threads turn batches into vectors and
+    a single writer thread upserts them to the vector store and saves the
+    DocumentChunk rows. Because every queue is bounded, at most
+    ``queue_size`` batches wait between stages, so memory is bounded by the
+    window rather than by the document size.
+    """
+
+    def __init__(self, processor, document: UserDocument,
+                 batch_size: int = None, queue_size: int = None, embed_workers: int = None):
+        self.processor = processor
+        self.document = document
+        self.batch_size = batch_size or settings.INGESTION_PIPELINE_BATCH_SIZE
+        self.queue_size = queue_size or settings.INGESTION_PIPELINE_QUEUE_SIZE
+        self.embed_workers = embed_workers or settings.EMBEDDING_MAX_CONCURRENCY
+        self._embed_queue = queue.Queue(maxsize=self.queue_size)
+        self._upsert_queue = queue.Queue(maxsize=self.queue_size)
+        self._failed = threading.Event()
+        self._errors = []
+        self._vector_ids = {}
+        self.chunk_count = 0
+        self.time_to_first_vector = None
+        self._started = None
+
+    def run(self, chunks: Iterable[Tuple[ChunkSpan, str]]) -> List[str]:
+        """Run all stages over (span, text) chunks and return the vector IDs in chunk order"""
+        started = self._started = time.monotonic()
+
+        embedders = [
+            threading.Thread(target=self._embed_stage, name=f"ingest-embed-{i}", daemon=True)
+            for i in range(self.embed_workers)
+        ]
+        writer = threading.Thread(target=self._upsert_stage, name="ingest-upsert", daemon=True)
+        for thread in embedders + [writer]:
+            thread.start()
+
+        try:
+            batch = []
+            for span, chunk in chunks:
+                batch.append((self.chunk_count, span, chunk))
+                self.chunk_count += 1
+                if len(batch) >= self.batch_size:
+                    self._put(self._embed_queue, batch)
+                    batch = []
+            if batch:
+                self._put(self._embed_queue, batch)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in embedders:
+                self._put(self._embed_queue, _END, force=True)
+            for thread in embedders:
+                thread.join()
+            self._put(self._upsert_queue, _END, force=True)
+            writer.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        logger.info(f"Ingested {self.chunk_count} chunks for document {self.document.id} in "
+                    f"{time.monotonic() - started:.2f}s (first vector after "
+                    f"{self.time_to_first_vector or 0:.2f}s)")
+        return [self._vector_ids[i] for i in sorted(self._vector_ids)]
+
+    @property
+    def stored_vector_ids(self) -> List[str]:
+        """Vector IDs sent to the vector store so far (used to clean up after a failure)"""
+        return list(self._vector_ids.values())
+
+    def _fail(self, error: Exception) -> None:
+        self._errors.append(error)
+        self._failed.set()
+
+    def _put(self, q: queue.Queue, item, force: bool = False) -> None:
+        """Blocking put that gives up once another stage has failed
+
+        ``force`` is used for end markers: consumers keep draining (and
+        discarding) after a failure, so a plain blocking put always completes.
+        """
+        if force:
+            q.put(item)
+            return
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _embed_stage(self) -> None:
+        while True:
+            batch = self._embed_queue.get()
+            if batch is _END:
+                return
+            if self._failed.is_set():
+                continue
+            try:
+                texts = [chunk for _, _, chunk in batch]
+                embeddings = self.processor.generate_embeddings(texts)
+                self._put(self._upsert_queue, (batch, embeddings))
+            except PipelineAborted:
+                continue
+            except Exception as e:
+                self._fail(e)
+
+    def _upsert_stage(self) -> None:
+        try:
+            while True:
+                item = self._upsert_queue.get()
+                if item is _END:
+                    return
+                if self._failed.is_set():
+                    continue
+                try:
+                    self._write_batch(*item)
+                except Exception as e:
+                    self._fail(e)
+        finally:
+            # This thread opened its own DB connection
+            connection.close()
+
+    def _write_batch(self, batch: List[Tuple[int, ChunkSpan, str]], embeddings: List[List[float]]) -> None:
+        vectors = []
+        chunk_records = []
+        for (index, span, chunk), embedding in zip(batch, embeddings):
+            vector, chunk_record = self.processor.build_chunk_vector(self.document, index, chunk, embedding, span)
+            vectors.append(vector)
+            chunk_records.append(chunk_record)
+
+        # Record IDs before upserting: a partially failed upsert still leaves vectors to clean up
+        for (index, _, _), vector in zip(batch, vectors):
+            self._vector_ids[index] = vector['id']
+        pinecone_manager = self.processor.pinecone_manager
+        results = pinecone_manager.upsert_vectors(vectors, namespace=self.processor.vector_namespace(self.document.user_id))
+        if not pinecone_manager.upsert_succeeded(results):
+            raise Exception("Failed to store vectors in Pinecone")
+        lexical_index.bulk_create_chunks(chunk_records)
+
+        if self.time_to_first_vector is None:
+            self.time_to_first_vector = time.monotonic() - self._started
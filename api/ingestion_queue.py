@@ -0,0 +1,234 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .document_processor import DocumentAlreadyIngested, DocumentProcessor, invalidate_medical_profile
+from .models import UserDocument
+from .uploads import store_upload
+import logging
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+def find_duplicate_document(user_id: str, content_hash: str) -> Optional[UserDocument]:
+    """The user's existing upload of the same file, unless that ingestion failed"""
+    return (UserDocument.objects
+            .filter(user_id=user_id, content_hash=content_hash)
+            .exclude(processing_status='failed')
+            .order_by('upload_date')
+            .first())
+
+
+def enqueue_document(user_id: str, uploaded_file, document_name: str,
+                     document_type: str = 'other') -> Tuple[UserDocument, bool]:
+    """Persist an upload and queue it for background ingestion
+
+    The file is hashed while it streams to storage. If the user already has
+    the same file, the new copy is discarded and the existing document is
+    returned instead. Returns (document, queued).
+    """
+    storage_path, content_hash, file_size = store_upload(user_id, uploaded_file, document_name)
+
+    existing = find_duplicate_document(user_id, content_hash)
+    if existing is not None:
+        default_storage.delete(storage_path)
+        logger.info(f"Duplicate upload of document {existing.id} by user {user_id}: {document_name}")
+        return existing, False
+
+    document = UserDocument.objects.create(
+        user_id=user_id,
+        document_name=document_name,
+        document_type=document_type,
+        file_path=storage_path,
+        file_size=file_size,
+        content_hash=content_hash,
+        processing_status='pending'
+    )
+
+    invalidate_medical_profile(user_id)
+    logger.info(f"Queued document {document.id} for user {user_id}: {document_name}")
+
+    if settings.INGESTION_RUN_IN_PROCESS:
+        get_ingestion_worker_pool().start()
+    get_ingestion_worker_pool().notify()
+
+    return document, True
+
+
+def claim_next_document() -> Optional[UserDocument]:
+    """Atomically claim the oldest pending document
+
+    The claim is a conditional UPDATE, so several threads or processes can
+    drain the same table without a broker or row locks.
+    """
+    while True:
+        document_id = (UserDocument.objects
+                       .filter(processing_status='pending')
+                       .order_by('upload_date')
+                       .values_list('id', flat=True)
+                       .first())
+        if document_id is None:
+            return None
+
+        claimed = UserDocument.objects.filter(
+            id=document_id,
+            processing_status='pending'
+        ).update(
+            processing_status='processing',
+            processing_started_at=timezone.now(),
+            processing_attempts=F('processing_attempts') + 1
+        )
+        if claimed:
+            return UserDocument.objects.get(id=document_id)
+        # Another worker won the race; try the next one
+
+
+def requeue_stale_documents() -> int:
+    """Return documents stuck in 'processing' (e.g. a worker died) to the queue
+
+    A replace that died keeps its previous revision, so 'replacing'
+    documents go back to 'completed' instead.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.INGESTION_JOB_TIMEOUT)
+    restored = UserDocument.objects.filter(
+        processing_status='replacing',
+        processing_started_at__lt=cutoff
+    ).update(processing_status='completed')
+    stale = UserDocument.objects.filter(
+        processing_status='processing',
+        processing_started_at__lt=cutoff
+    )
+    failed = stale.filter(processing_attempts__gte=settings.INGESTION_MAX_ATTEMPTS).update(
+        processing_status='failed',
+        processing_error='Ingestion timed out',
+        processed_at=timezone.now()
+    )
+    requeued = stale.filter(processing_attempts__lt=settings.INGESTION_MAX_ATTEMPTS).update(
+        processing_status='pending'
+    )
+    if failed or requeued or restored:
+        logger.warning(f"Requeued {requeued} and failed {failed} stale ingestion jobs, "
+                       f"restored {restored} stale replacements")
+    return requeued
+
+
+def run_document_job(document: UserDocument, processor: DocumentProcessor) -> None:
+    """Run the ingestion pipeline for one claimed document"""
+    try:
+        with default_storage.open(document.file_path, 'rb') as pdf_file:
+            processor.process_document(
+                user_id=document.user_id,
+                pdf_file=pdf_file,
+                document_name=document.document_name,
+                document_type=document.document_type,
+                document=document
+            )
+        logger.info(f"Ingested document {document.id} (attempt {document.processing_attempts})")
+    except DocumentAlreadyIngested as e:
+        UserDocument.objects.filter(id=document.id).update(processing_status='completed')
+        logger.warning(f"Skipped ingestion job: {str(e)}")
+    except Exception as e:
+        retry = document.processing_attempts < settings.INGESTION_MAX_ATTEMPTS
+        UserDocument.objects.filter(id=document.id).update(
+            processing_status='pending' if retry else 'failed',
+            processing_error=str(e)[:2000],
+            processed_at=None if retry else timezone.now()
+        )
+        logger.error(f"Error ingesting document {document.id} (attempt {document.processing_attempts}, "
+                     f"{'will retry' if retry else 'giving up'}): {str(e)}")
+
+
+def wait_for_document(document: UserDocument, timeout: float) -> UserDocument:
+    """Long-poll helper: block until the document reaches a terminal state or timeout"""
+    deadline = time.monotonic() + timeout
+    while document.processing_status not in TERMINAL_STATUSES and time.monotonic() < deadline:
+        time.sleep(settings.INGESTION_STATUS_POLL_INTERVAL)
+        document.refresh_from_db()
+    return document
+
+
+class IngestionWorkerPool:
+    """Pool of worker threads that drain pending documents from the database"""
+
+    def __init__(self, num_workers: int, poll_interval: float):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"ingestion-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.num_workers} ingestion workers")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask workers to exit after their current job and wait for them"""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers because a new document was queued"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        processor = None
+        last_stale_check = 0.0
+        while not self._stopping.is_set():
+            try:
+                close_old_connections()
+                if time.monotonic() - last_stale_check > self.poll_interval * 10:
+                    requeue_stale_documents()
+                    last_stale_check = time.monotonic()
+
+                document = claim_next_document()
+                if document is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+
+                if processor is None:
+                    processor = DocumentProcessor()
+                run_document_job(document, processor)
+            except Exception as e:
+                logger.error(f"Ingestion worker error: {str(e)}")
+                self._stopping.wait(self.poll_interval)
+            finally:
+                close_old_connections()
+
+
+# Global instance
+ingestion_worker_pool = None
+
+def get_ingestion_worker_pool() -> IngestionWorkerPool:
+    """Get or create the global ingestion worker pool"""
+    global ingestion_worker_pool
+    if ingestion_worker_pool is None:
+        ingestion_worker_pool = IngestionWorkerPool(
+            num_workers=settings.INGESTION_WORKERS,
+            poll_interval=settings.INGESTION_POLL_INTERVAL
+        )
+    return ingestion_worker_pool
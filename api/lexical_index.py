@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Iterable, Sequence
+from django.db import transaction
+from django.db.models import Avg, Count
+from .local_vector_store import VectorMatch
+from .models import DocumentChunk, ChunkTerm
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and compounds like "hba1c", "5.7", "mg/dl", "covid-19", "vitamin_d3"
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._/+-][a-z0-9]+)*")
+COMPOUND_SPLIT_RE = re.compile(r"[._/+-]")
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been before being between both but by
+can could did do does doing during each few for from had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other
+our out over own same she should so some such than that the their them then there these they this
+those through to too under until up very was we were what when where which while who whom why will
+with would you your
+""".split())
+
+MAX_TERM_LENGTH = 64  # ChunkTerm.term max_length
+
+# BM25 parameters (Robertson/Sparck Jones defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased index terms, keeping compounds whole and also adding their parts
+
+    "HbA1c 5.7%" gives ["hba1c", "5.7", "5", "7"], so a query for the exact
+    lab value and one for its parts both match.
+    """
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS or len(token) > MAX_TERM_LENGTH:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in COMPOUND_SPLIT_RE.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+def _postings(chunk: DocumentChunk, user_id: str) -> List[ChunkTerm]:
+    counts = Counter(tokenize(chunk.text_content))
+    chunk.term_count = sum(counts.values())
+    return [ChunkTerm(chunk=chunk, user_id=user_id, term=term, term_frequency=frequency)
+            for term, frequency in counts.items()]
+
+
+def bulk_create_chunks(chunk_records: Sequence[DocumentChunk]) -> None:
+    """Insert DocumentChunk rows together with their postings
+
+    Use instead of DocumentChunk.objects.bulk_create so the lexical index
+    stays in step; postings are deleted with their chunk by the cascade.
+    """
+    postings = []
+    for chunk in chunk_records:
+        postings.extend(_postings(chunk, chunk.document.user_id))
+    with transaction.atomic():
+        DocumentChunk.objects.bulk_create(chunk_records)
+        ChunkTerm.objects.bulk_create(postings, batch_size=1000)
+
+
+def reindex_chunks(chunks: Sequence[DocumentChunk]) -> int:
+    """Rebuild postings of existing chunks (``document`` must be loaded); returns postings written"""
+    postings = []
+    for chunk in chunks:
+        postings.extend(_postings(chunk, chunk.document.user_id))
+    with transaction.atomic():
+        ChunkTerm.objects.filter(chunk__in=[chunk.id for chunk in chunks]).delete()
+        DocumentChunk.objects.bulk_update(chunks, ['term_count'])
+        ChunkTerm.objects.bulk_create(postings, batch_size=1000)
+    return len(postings)
+
+
+def search(user_id: str, query: str, top_k: int = 5) -> List[VectorMatch]:
+    """BM25 top-k over a user's chunks, as matches keyed by vector ID (best first)
+
+    Two queries: corpus statistics for the user, and the postings of the
+    query terms. No embedding call is involved.
+    """
+    terms = set(tokenize(query))
+    if not terms or top_k <= 0:
+        return []
+
+    postings = list(ChunkTerm.objects
+                    .filter(user_id=user_id, term__in=terms)
+                    .values_list('chunk__vector_id', 'term', 'term_frequency', 'chunk__term_count'))
+    if not postings:
+        return []
+
+    # Count and average length of the user's indexed chunks
+    stats = (DocumentChunk.objects
+             .filter(document__user_id=user_id, term_count__gt=0)
+             .aggregate(chunks=Count('id'), average_length=Avg('term_count')))
+    chunk_count = stats['chunks'] or 1
+    average_length = stats['average_length'] or 1
+
+    document_frequency = Counter(term for _, term, _, _ in postings)
+    scores = Counter()
+    for vector_id, term, frequency, length in postings:
+        idf = math.log(1 + (chunk_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+        scores[vector_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+    return [VectorMatch(id=vector_id, score=score, metadata={})
+            for vector_id, score in scores.most_common(top_k)]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence], k: int = 60) -> List[VectorMatch]:
+    """Fuse ranked match lists: each contributes 1 / (k + rank) per ID (Cormack et al., 2009)
+
+    Scores are rank-based, so BM25 and cosine scales never need
+    calibrating. The first non-empty metadata seen for an ID is kept.
+    """
+    scores: Dict[str, float] = {}
+    metadata: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, 1):
+            scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (k + rank)
+            if not metadata.get(match.id):
+                metadata[match.id] = match.metadata or {}
+    return [VectorMatch(id=vector_id, score=score, metadata=metadata[vector_id])
+            for vector_id, score in sorted(scores.items(), key=lambda item: -item[1])]
@@ -0,0 +1,772 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .hnsw import HNSWIndex
+from .quantization import make_quantizer
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Same attributes the callers use on Pinecone query matches
+VectorMatch = namedtuple('VectorMatch', ['id', 'score', 'metadata'])
+
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def _matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $gt(e), $lt(e), $and, $or)"""
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == '$or':
+            if not any(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for op, operand in condition.items():
+            if op == '$eq':
+                ok = value == operand
+            elif op == '$ne':
+                ok = value != operand
+            elif op == '$in':
+                ok = value in operand
+            elif op == '$nin':
+                ok = value not in operand
+            elif value is None:
+                ok = False
+            elif op == '$gt':
+                ok = value > operand
+            elif op == '$gte':
+                ok = value >= operand
+            elif op == '$lt':
+                ok = value < operand
+            elif op == '$lte':
+                ok = value <= operand
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if not ok:
+                return False
+    return True
+
+
+class _Namespace:
+    """One namespace on disk: a float32 memmap of unit vectors plus an append-only log
+
+    Row ``i`` of ``vectors.f32`` holds a vector; ``log.jsonl`` records which
+    ID and metadata own each row (``put``) and which IDs were removed
+    (``del``). Writers serialize on an flock, so several worker processes can
+    share a namespace; readers replay any new log lines before each call.
+
+    Namespaces with at least ``hnsw_params['min_vectors']`` vectors also get
+    an HNSW graph (``hnsw.pkl``), built and kept in sync by a background
+    thread. Rows changed since the last sync are scanned exactly and merged
+    in, so approximate results never serve stale vectors.
+
+    With ``quantization_params['method']`` set to ``int8`` or ``pq``, compact
+    codes of every row are kept in RAM and scanned instead of the memmap;
+    only a shortlist of ``rerank_factor * k`` rows is re-scored at full
+    precision, so the float32 file can stay mostly paged out.
+    """
+
+    def __init__(self, directory: str, dimension: int, hnsw_params: Optional[Dict[str, int]] = None,
+                 quantization_params: Optional[Dict[str, Any]] = None):
+        self.directory = directory
+        self.dimension = dimension
+        self.hnsw_params = hnsw_params or {'min_vectors': 0}
+        self.quantization_params = quantization_params or {'method': 'none'}
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self.log_path = os.path.join(directory, 'log.jsonl')
+        self.lock_path = os.path.join(directory, '.lock')
+        self.hnsw_path = os.path.join(directory, 'hnsw.pkl')
+        self.codebooks_path = os.path.join(directory, 'pq_codebooks.npy')
+        self.lock = threading.RLock()
+        self.hnsw_lock = threading.Lock()
+        self._hnsw_worker = None
+        self._generation = 0
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.ids = []          # Row -> vector ID, None for a free row
+        self.metadata = []     # Row -> metadata
+        self.versions = []     # Row -> log offset of its put, -1 for a free row
+        self.rows = {}         # Vector ID -> row
+        self.free_rows = set()
+        self.matrix = None
+        self._live = None      # Cached boolean mask of occupied rows
+        self._log_offset = 0
+        self._log_inode = None
+        self._vectors_size = -1
+        # Row numbers change on compaction, so any HNSW graph is invalidated
+        self._generation += 1
+        self.hnsw = None
+        self.hnsw_versions = {}  # Row -> version currently in the graph
+        self.dirty_rows = set()  # Rows whose graph entry is out of date
+        self.syncing_rows = set()
+        # Compact codes are rebuilt from the memmap; trained PQ codebooks come from disk
+        self.quantizer = make_quantizer(self.quantization_params['method'], self.dimension,
+                                        self.quantization_params.get('pq_subspaces', 96))
+        self.unencoded_rows = set()
+
+    @contextmanager
+    def write_lock(self):
+        """Thread and process exclusive section; state is refreshed on entry"""
+        with self.lock:
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self) -> None:
+        """Apply log lines written since the last call (by this or another process)"""
+        try:
+            log_file = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            if self._log_inode is not None:
+                self._reset()
+            return
+
+        with log_file:
+            inode = os.fstat(log_file.fileno()).st_ino
+            if inode != self._log_inode:
+                # First load, or the namespace was compacted by another process
+                self._reset()
+                self._log_inode = inode
+            log_file.seek(self._log_offset)
+            data = log_file.read()
+
+        # Only complete lines; a concurrent append may still be in progress
+        end = data.rfind(b'\n') + 1
+        offset = self._log_offset
+        for line in data[:end].split(b'\n')[:-1]:
+            if line:
+                self._apply(json.loads(line), offset)
+            offset += len(line) + 1
+        self._log_offset += end
+        self._map_vectors()
+
+    def _apply(self, entry: Dict[str, Any], offset: int) -> None:
+        self._live = None
+        vector_id = entry['id']
+        old_row = self.rows.pop(vector_id, None)
+        if old_row is not None:
+            self.ids[old_row] = None
+            self.metadata[old_row] = None
+            self.versions[old_row] = -1
+            self.free_rows.add(old_row)
+            if self.hnsw is not None:
+                self.dirty_rows.add(old_row)
+        if entry['op'] != 'put':
+            return
+
+        row = entry['row']
+        if row >= len(self.ids):
+            grow = row + 1 - len(self.ids)
+            self.free_rows.update(range(len(self.ids), row))
+            self.ids.extend([None] * grow)
+            self.metadata.extend([None] * grow)
+            self.versions.extend([-1] * grow)
+        self.free_rows.discard(row)
+        self.ids[row] = vector_id
+        self.metadata[row] = entry.get('metadata') or {}
+        self.versions[row] = offset
+        self.rows[vector_id] = row
+        if self.hnsw is not None:
+            self.dirty_rows.add(row)
+        if self.quantizer is not None:
+            self.unencoded_rows.add(row)
+
+    def _map_vectors(self) -> None:
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if size == self._vectors_size:
+            return
+        self._vectors_size = size
+        capacity = size // (4 * self.dimension)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r+',
+                                shape=(capacity, self.dimension)) if capacity else None
+
+    def ensure_capacity(self, rows: int) -> None:
+        capacity = self.matrix.shape[0] if self.matrix is not None else 0
+        if rows <= capacity:
+            return
+        # Grow geometrically so appends stay amortized O(1)
+        new_capacity = max(rows, capacity * 2, 1024)
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self._map_vectors()
+
+    def append_log(self, entries: List[Dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(entry, separators=(',', ':')) + "\n" for entry in entries)
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload.encode('utf-8'))
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    @property
+    def row_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.rows)
+
+    def live_mask(self) -> np.ndarray:
+        if self._live is None:
+            self._live = np.fromiter((vector_id is not None for vector_id in self.ids),
+                                     dtype=bool, count=len(self.ids))
+        return self._live
+
+    def _candidate_rows(self, filter: Optional[Dict] = None, rows: Optional[List[int]] = None) -> np.ndarray:
+        """Live rows matching ``filter``, out of all rows or out of ``rows``"""
+        if rows is None:
+            mask = self.live_mask()
+            if filter:
+                mask = mask & np.fromiter(
+                    (metadata is not None and _matches_filter(metadata, filter) for metadata in self.metadata),
+                    dtype=bool, count=self.row_count
+                )
+            candidates = np.flatnonzero(mask)
+        else:
+            candidates = np.array([
+                row for row in rows
+                if row < self.row_count and self.ids[row] is not None
+                and (not filter or _matches_filter(self.metadata[row], filter))
+            ], dtype=np.int64)
+        return candidates
+
+    @staticmethod
+    def _top(candidates: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def exact_top_k(self, query: np.ndarray, k: int, filter: Optional[Dict] = None,
+                    rows: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """Exact (row, score) top-k over all rows, or over ``rows`` only"""
+        candidates = self._candidate_rows(filter, rows)
+        if not len(candidates):
+            return []
+
+        if len(candidates) == self.row_count:
+            scores = self.matrix[:self.row_count] @ query
+        else:
+            scores = self.matrix[candidates] @ query
+        return self._top(candidates, scores, k)
+
+    def quantized_top_k(self, query: np.ndarray, k: int,
+                        filter: Optional[Dict] = None) -> Optional[List[Tuple[int, float]]]:
+        """Scan compact codes, then re-rank a shortlist at full precision (caller holds ``lock``)
+
+        Returns None when quantization is off or PQ codebooks are not trained yet.
+        """
+        if not self._sync_codes():
+            return None
+        candidates = self._candidate_rows(filter)
+        if not len(candidates):
+            return []
+
+        if len(candidates) == self.row_count:
+            approximate = self.quantizer.scores(query)[:self.row_count]
+        else:
+            approximate = self.quantizer.scores(query, candidates)
+        shortlist = min(len(candidates), k * self.quantization_params.get('rerank_factor', 10))
+        if shortlist < len(candidates):
+            keep = np.argpartition(-approximate, shortlist - 1)[:shortlist]
+            candidates = candidates[np.sort(keep)]
+        return self._top(candidates, self.matrix[candidates] @ query, k)
+
+    def _sync_codes(self) -> bool:
+        """Encode rows written since the last query; False if codes can't be used yet"""
+        if self.quantizer is None:
+            return False
+        if not self.quantizer.trained and not self._train_quantizer():
+            return False
+        rows = sorted(row for row in self.unencoded_rows if row < self.row_count and self.ids[row] is not None)
+        self.quantizer.reserve(self.row_count)
+        for start in range(0, len(rows), 4096):
+            batch = rows[start:start + 4096]
+            self.quantizer.set(batch, self.matrix[batch])
+        self.unencoded_rows = set()
+        return True
+
+    def _train_quantizer(self) -> bool:
+        """Load or train PQ codebooks; they survive compaction since they don't depend on rows"""
+        if self.quantizer.load_codebooks(self.codebooks_path):
+            return True
+        if self.live_count < self.quantization_params.get('pq_train_min', 4096):
+            return False
+        live = np.flatnonzero(self.live_mask())
+        sample = np.random.default_rng(0).choice(live, size=min(len(live), 8192), replace=False)
+        self.quantizer.train(self.matrix[np.sort(sample)])
+        self.quantizer.save_codebooks(self.codebooks_path)
+        logger.info(f"Trained PQ codebooks on {len(sample)} vectors in {self.directory}")
+        return True
+
+    def approximate_top_k(self, query: np.ndarray, k: int,
+                          filter: Optional[Dict] = None) -> Optional[List[Tuple[int, float]]]:
+        """HNSW (row, score) top-k, or None when no graph is ready (caller holds ``lock``)
+
+        Rows not yet synced into the graph are scored exactly and merged in.
+        """
+        self._start_hnsw_worker()
+        if self.hnsw is None:
+            return None
+
+        stale = self.dirty_rows | self.syncing_rows
+
+        def accept(row):
+            return row not in stale and (not filter or _matches_filter(self.metadata[row], filter))
+
+        with self.hnsw_lock:
+            found = self.hnsw.search(query, k, ef=self.hnsw_params['ef_search'], accept=accept)
+        if filter and len(found) < k:
+            # Selective filter: the graph neighbourhood ran out of matches
+            return None
+
+        merged = found + self.exact_top_k(query, k, filter, rows=list(stale)) if stale else found
+        return sorted(merged, key=lambda item: -item[1])[:k]
+
+    def _start_hnsw_worker(self) -> None:
+        """Load, build or sync the HNSW graph in the background when there is work"""
+        if self.hnsw_params['min_vectors'] <= 0 or self.live_count < self.hnsw_params['min_vectors']:
+            return
+        if self._hnsw_worker is not None and self._hnsw_worker.is_alive():
+            return
+        if self.hnsw is not None and not self.dirty_rows:
+            return
+        self._hnsw_worker = threading.Thread(
+            target=self._hnsw_work, args=(self._generation,),
+            name=f"hnsw-{os.path.basename(self.directory)}", daemon=True
+        )
+        self._hnsw_worker.start()
+
+    def _new_hnsw(self) -> HNSWIndex:
+        return HNSWIndex(self.dimension, m=self.hnsw_params['m'],
+                         ef_construction=self.hnsw_params['ef_construction'],
+                         ef_search=self.hnsw_params['ef_search'])
+
+    def _hnsw_work(self, generation: int) -> None:
+        try:
+            built = False  # A new graph is saved even if no rows changed while it was built
+            if self.hnsw is None:
+                index, versions = self._load_hnsw()
+                if index is None:
+                    index, versions = self._build_hnsw()
+                    built = True
+                with self.lock:
+                    if generation != self._generation:
+                        return
+                    # Anything written since the snapshot is synced below
+                    self.dirty_rows = {
+                        row for row in set(versions) | set(range(self.row_count))
+                        if versions.get(row, -1) != (self.versions[row] if row < self.row_count else -1)
+                    }
+                    self.hnsw, self.hnsw_versions = index, versions
+
+            changed = self._sync_hnsw(generation)
+
+            if self.hnsw.tombstone_ratio > 0.25:
+                index, versions = self._build_hnsw()
+                with self.lock:
+                    if generation != self._generation:
+                        return
+                    self.dirty_rows |= {
+                        row for row in set(versions) | set(range(self.row_count))
+                        if versions.get(row, -1) != (self.versions[row] if row < self.row_count else -1)
+                    }
+                    self.hnsw, self.hnsw_versions = index, versions
+                built = True
+                changed += self._sync_hnsw(generation)
+
+            if built or changed:
+                self._save_hnsw(generation)
+        except Exception as e:
+            logger.error(f"Error maintaining HNSW index for {self.directory}: {str(e)}")
+
+    def _build_hnsw(self) -> Tuple[HNSWIndex, Dict[int, int]]:
+        """Build a graph from a snapshot of the live rows (without holding ``lock``)"""
+        with self.lock:
+            rows = [row for row, vector_id in enumerate(self.ids) if vector_id is not None]
+            versions = {row: self.versions[row] for row in rows}
+            vectors = np.array(self.matrix[rows]) if rows else None
+        index = self._new_hnsw()
+        for row, vector in zip(rows, vectors if vectors is not None else []):
+            index.add(row, vector)
+        logger.info(f"Built HNSW index over {len(rows)} vectors in {self.directory}")
+        return index, versions
+
+    def _sync_hnsw(self, generation: int) -> int:
+        """Apply dirty rows to the graph in small batches; returns rows applied"""
+        applied = 0
+        while True:
+            with self.lock:
+                if generation != self._generation or not self.dirty_rows:
+                    self.syncing_rows = set()
+                    return applied
+                batch = [self.dirty_rows.pop() for _ in range(min(32, len(self.dirty_rows)))]
+                self.syncing_rows = set(batch)
+                work = [
+                    (row, self.versions[row], np.array(self.matrix[row]))
+                    if row < self.row_count and self.ids[row] is not None else (row, -1, None)
+                    for row in batch
+                ]
+            with self.hnsw_lock:
+                for row, version, vector in work:
+                    self.hnsw.delete(row)
+                    if vector is not None:
+                        self.hnsw.add(row, vector)
+                        self.hnsw_versions[row] = version
+                    else:
+                        self.hnsw_versions.pop(row, None)
+            applied += len(work)
+
+    def _load_hnsw(self) -> Tuple[Optional[HNSWIndex], Dict[int, int]]:
+        if not os.path.exists(self.hnsw_path):
+            return None, {}
+        index, extra = HNSWIndex.load(self.hnsw_path)
+        params = (index.m, index.ef_construction)
+        if extra.get('log_inode') != self._log_inode or params != (self.hnsw_params['m'], self.hnsw_params['ef_construction']):
+            return None, {}
+        index.ef_search = self.hnsw_params['ef_search']
+        return index, extra['versions']
+
+    def _save_hnsw(self, generation: int) -> None:
+        with self.lock:
+            if generation != self._generation:
+                return
+            extra = {'log_inode': self._log_inode, 'versions': dict(self.hnsw_versions)}
+        with self.hnsw_lock:
+            self.hnsw.save(self.hnsw_path, extra=extra)
+
+    def compact(self) -> None:
+        """Rewrite the namespace without free rows (caller holds the write lock)"""
+        live_rows = [row for row, vector_id in enumerate(self.ids) if vector_id is not None]
+        vectors_tmp = self.vectors_path + '.tmp'
+        log_tmp = self.log_path + '.tmp'
+
+        matrix = np.asarray(self.matrix[live_rows]) if live_rows else np.zeros((0, self.dimension), np.float32)
+        matrix.astype(np.float32).tofile(vectors_tmp)
+        with open(log_tmp, 'w') as f:
+            for new_row, row in enumerate(live_rows):
+                f.write(json.dumps({'op': 'put', 'id': self.ids[row], 'row': new_row,
+                                    'metadata': self.metadata[row]}, separators=(',', ':')) + "\n")
+
+        # Vectors first: readers only re-map after noticing the new log
+        os.replace(vectors_tmp, self.vectors_path)
+        os.replace(log_tmp, self.log_path)
+        if os.path.exists(self.hnsw_path):
+            os.remove(self.hnsw_path)
+        self._reset()
+        self.refresh()
+
+
+class LocalVectorStore:
+    """Vector store on local disk with the PineconeManager interface
+
+    Each namespace (one per user when PINECONE_USER_NAMESPACES is on) is a
+    memory-mapped float32 matrix of unit-normalized vectors. Queries are an
+    exact cosine top-k: one matrix-vector product over the namespace plus a
+    metadata filter mask. Namespaces past ``hnsw_min_vectors`` (e.g. a shared
+    namespace for cross-user search) are queried through an HNSW graph
+    instead. ``quantization`` ('int8' or 'pq') keeps compact codes in RAM for
+    the scan and re-ranks a shortlist from the memmap. No network round-trip,
+    and it works offline.
+    """
+
+    def __init__(self, path: str, dimension: int, namespace: Optional[str] = None,
+                 hnsw_min_vectors: int = 0, hnsw_m: int = 16,
+                 hnsw_ef_construction: int = 100, hnsw_ef_search: int = 64,
+                 quantization: str = 'none', pq_subspaces: int = 96,
+                 rerank_factor: int = 10, pq_train_min: int = 4096):
+        self.path = path
+        self.dimension = dimension
+        self.namespace = settings.PINECONE_NAMESPACE if namespace is None else namespace
+        self.hnsw_params = {
+            'min_vectors': hnsw_min_vectors,
+            'm': hnsw_m,
+            'ef_construction': hnsw_ef_construction,
+            'ef_search': hnsw_ef_search,
+        }
+        self.quantization_params = {
+            'method': quantization,
+            'pq_subspaces': pq_subspaces,
+            'rerank_factor': rerank_factor,
+            'pq_train_min': pq_train_min,
+        }
+        # Fail fast on a bad method or subspace count
+        make_quantizer(quantization, dimension, pq_subspaces)
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def create_index_if_not_exists(self):
+        """Nothing to create; namespaces are created on first write"""
+
+    def user_namespace(self, user_id: str) -> str:
+        """Namespace holding one user's vectors (nested under the configured namespace)"""
+        return f"{self.namespace}_user_{user_id}" if self.namespace else f"user_{user_id}"
+
+    def _directory_name(self, namespace: str) -> str:
+        if not namespace:
+            return '__default__'
+        safe = _SAFE_NAME_RE.sub('_', namespace)
+        if safe != namespace:
+            # Keep sanitized names from colliding
+            safe = f"{safe}-{hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:8]}"
+        return safe
+
+    def _get_namespace(self, namespace: Optional[str]) -> _Namespace:
+        namespace = self.namespace if namespace is None else namespace
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None:
+                store = _Namespace(os.path.join(self.path, self._directory_name(namespace)),
+                                   self.dimension, self.hnsw_params, self.quantization_params)
+                self._namespaces[namespace] = store
+            return store
+
+    @staticmethod
+    def upsert_succeeded(results: List[Dict[str, Any]]) -> bool:
+        """True if every batch of an upsert_vectors call was stored"""
+        return bool(results) and all(result['success'] for result in results)
+
+    def upsert_vectors(self, vectors: List[Dict[str, Any]],
+                       namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Upsert vectors; returns a single batch result like PineconeManager.upsert_vectors"""
+        if not vectors:
+            logger.warning("No vectors provided for upsert")
+            return []
+
+        result = {'batch': 0, 'count': len(vectors), 'success': False, 'attempts': 1, 'error': None}
+        try:
+            values = np.asarray([vector['values'] for vector in vectors], dtype=np.float32)
+            if values.ndim != 2 or values.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dimensional vectors, got shape {values.shape}")
+            norms = np.linalg.norm(values, axis=1, keepdims=True)
+            values /= np.where(norms == 0, 1, norms)
+
+            store = self._get_namespace(namespace)
+            with store.write_lock():
+                free_rows = sorted(store.free_rows)
+                next_row = store.row_count
+                rows = []
+                for vector in vectors:
+                    row = store.rows.get(vector['id'])
+                    if row is None:
+                        if free_rows:
+                            row = free_rows.pop(0)
+                        else:
+                            row = next_row
+                            next_row += 1
+                    rows.append(row)
+
+                store.ensure_capacity(max(rows) + 1)
+                # Vectors are durable before the log entries that point at them
+                store.matrix[rows] = values
+                store.matrix.flush()
+                store.append_log([
+                    {'op': 'put', 'id': vector['id'], 'row': row, 'metadata': vector.get('metadata') or {}}
+                    for vector, row in zip(vectors, rows)
+                ])
+
+            result['success'] = True
+            logger.info(f"Successfully upserted {len(vectors)} vectors")
+        except Exception as e:
+            result['error'] = str(e)
+            logger.error(f"Error upserting vectors: {str(e)}")
+        return [result]
+
+    def query_vectors(self, query_vector: List[float], top_k: int = 5,
+                      include_metadata: bool = True, filter: Optional[Dict] = None,
+                      namespace: Optional[str] = None, raise_errors: bool = False) -> List[VectorMatch]:
+        """Cosine top-k over the namespace (HNSW for large namespaces, else a quantized or exact scan)
+
+        Errors are logged and return [] unless ``raise_errors``.
+        """
+        try:
+            store = self._get_namespace(namespace)
+            with store.lock:
+                store.refresh()
+                if not store.live_count:
+                    return []
+
+                query = np.asarray(query_vector, dtype=np.float32)
+                query /= np.linalg.norm(query) or 1
+
+                top = store.approximate_top_k(query, top_k, filter)
+                if top is None:
+                    top = store.quantized_top_k(query, top_k, filter)
+                if top is None:
+                    top = store.exact_top_k(query, top_k, filter)
+
+                return [
+                    VectorMatch(
+                        id=store.ids[row],
+                        score=score,
+                        metadata=store.metadata[row] if include_metadata else {}
+                    )
+                    for row, score in top
+                ]
+
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error querying vectors: {str(e)}")
+            return []
+
+    async def aquery_vectors(self, query_vector: List[float], top_k: int = 5,
+                             include_metadata: bool = True, filter: Optional[Dict] = None,
+                             namespace: Optional[str] = None, raise_errors: bool = False) -> List[VectorMatch]:
+        """query_vectors for async views; the scan runs in a worker thread off the event loop"""
+        return await sync_to_async(self.query_vectors, thread_sensitive=False)(
+            query_vector, top_k=top_k, include_metadata=include_metadata, filter=filter, namespace=namespace,
+            raise_errors=raise_errors
+        )
+
+    def delete_vectors(self, ids: List[str], namespace: Optional[str] = None) -> bool:
+        """Delete vectors by ID"""
+        try:
+            if not ids:
+                logger.warning("No IDs provided for deletion")
+                return False
+
+            store = self._get_namespace(namespace)
+            with store.write_lock():
+                entries = [{'op': 'del', 'id': vector_id} for vector_id in ids if vector_id in store.rows]
+                if entries:
+                    store.append_log(entries)
+                if store.row_count > 1024 and len(store.free_rows) > store.live_count:
+                    store.compact()
+            logger.info(f"Successfully deleted {len(ids)} vectors")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error deleting vectors: {str(e)}")
+            return False
+
+    def delete_by_prefix(self, prefix: str, namespace: Optional[str] = None) -> int:
+        """Delete every vector whose ID starts with ``prefix``; returns the number deleted"""
+        store = self._get_namespace(namespace)
+        with store.lock:
+            store.refresh()
+            ids = [vector_id for vector_id in store.rows if vector_id.startswith(prefix)]
+        if ids and not self.delete_vectors(ids, namespace=namespace):
+            raise Exception(f"Failed to delete vectors with prefix {prefix}")
+        return len(ids)
+
+    def delete_namespace(self, namespace: str) -> bool:
+        """Delete every vector in a namespace"""
+        try:
+            store = self._get_namespace(namespace)
+            with store.write_lock():
+                for path in (store.log_path, store.vectors_path, store.hnsw_path, store.codebooks_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                store._reset()
+            logger.info(f"Successfully deleted namespace: {namespace}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting namespace: {str(e)}")
+            return False
+
+    def fetch_vectors(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch stored vectors by ID (values are unit-normalized)"""
+        store = self._get_namespace(namespace)
+        with store.lock:
+            store.refresh()
+            return {
+                vector_id: {
+                    'id': vector_id,
+                    'values': store.matrix[store.rows[vector_id]].tolist(),
+                    'metadata': store.metadata[store.rows[vector_id]]
+                }
+                for vector_id in ids if vector_id in store.rows
+            }
+
+    def get_index_stats(self) -> Dict[str, Any]:
+        """Vector counts per namespace and on-disk size, shaped like Pinecone's stats"""
+        try:
+            namespaces = {}
+            total_bytes = 0
+            with self._lock:
+                loaded = {self._directory_name(namespace): store for namespace, store in self._namespaces.items()}
+            for name in sorted(os.listdir(self.path)):
+                directory = os.path.join(self.path, name)
+                if not os.path.isdir(directory):
+                    continue
+                store = _Namespace(directory, self.dimension)
+                store.refresh()
+                bytes_on_disk = sum(
+                    os.path.getsize(path) for path in (store.vectors_path, store.log_path) if os.path.exists(path)
+                )
+                namespaces['' if name == '__default__' else name] = {
+                    'vector_count': store.live_count,
+                    'bytes_on_disk': bytes_on_disk,
+                }
+                stats = namespaces['' if name == '__default__' else name]
+                if name in loaded and loaded[name].hnsw is not None:
+                    stats['hnsw'] = loaded[name].hnsw.stats()
+                if name in loaded and loaded[name].quantizer is not None and loaded[name].quantizer.trained:
+                    quantizer = loaded[name].quantizer
+                    float32_bytes = loaded[name].row_count * self.dimension * 4
+                    stats['quantization'] = {
+                        'method': quantizer.method,
+                        'resident_bytes': quantizer.nbytes,
+                        'float32_bytes': float32_bytes,
+                        'compression': round(float32_bytes / quantizer.nbytes, 1) if quantizer.nbytes else None,
+                    }
+                total_bytes += bytes_on_disk
+            return {
+                'dimension': self.dimension,
+                'namespaces': namespaces,
+                'total_vector_count': sum(ns['vector_count'] for ns in namespaces.values()),
+                'bytes_on_disk': total_bytes,
+                'quantization': self.quantization_params['method'],
+                'resident_quantized_bytes': sum(
+                    ns['quantization']['resident_bytes'] for ns in namespaces.values() if 'quantization' in ns
+                ),
+            }
+        except Exception as e:
+            logger.error(f"Error getting index stats: {str(e)}")
+            return {}
+
+
+# Global instance
+local_vector_store = None
+
+def get_local_vector_store() -> LocalVectorStore:
+    """Get or create the global local vector store"""
+    global local_vector_store
+    if local_vector_store is None:
+        local_vector_store = LocalVectorStore(
+            path=settings.LOCAL_VECTOR_STORE_PATH,
+            dimension=settings.EMBEDDING_DIMENSION,
+            hnsw_min_vectors=settings.LOCAL_VECTOR_STORE_HNSW_MIN_VECTORS,
+            hnsw_m=settings.HNSW_M,
+            hnsw_ef_construction=settings.HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search=settings.HNSW_EF_SEARCH,
+            quantization=settings.LOCAL_VECTOR_STORE_QUANTIZATION,
+            pq_subspaces=settings.LOCAL_VECTOR_STORE_PQ_SUBSPACES,
+            rerank_factor=settings.LOCAL_VECTOR_STORE_RERANK_FACTOR
+        )
+    return local_vector_store
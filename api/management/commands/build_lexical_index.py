@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from api.lexical_index import reindex_chunks
+from api.models import DocumentChunk, ChunkTerm
+
+
+class Command(BaseCommand):
+    help = (
+        "Build BM25 postings for document chunks ingested before the lexical index existed. "
+        "New chunks are indexed as they are created, so this only needs to run once. "
+        "Chunks without postings are indexed; --rebuild re-indexes every chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only index this user')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Re-index all chunks, e.g. after changing the tokenizer')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Chunks indexed per transaction')
+
+    def handle(self, *args, **options):
+        chunks = DocumentChunk.objects.select_related('document').only(
+            'id', 'text_content', 'term_count', 'document__user_id'
+        ).order_by('id')
+        if options['user']:
+            chunks = chunks.filter(document__user_id=options['user'])
+        if not options['rebuild']:
+            chunks = chunks.exclude(id__in=ChunkTerm.objects.values('chunk_id'))
+
+        indexed = postings = 0
+        batch = []
+        for chunk in chunks.iterator(chunk_size=options['batch_size']):
+            batch.append(chunk)
+            if len(batch) >= options['batch_size']:
+                postings += reindex_chunks(batch)
+                indexed += len(batch)
+                batch = []
+                self.stdout.write(f"{indexed} chunks indexed")
+        if batch:
+            postings += reindex_chunks(batch)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} chunks ({postings} postings)"))
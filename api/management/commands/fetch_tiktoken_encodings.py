@@ -0,0 +1,23 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.text_chunker import TOKEN_ENCODINGS
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the tiktoken encodings used for token counting into TIKTOKEN_CACHE_DIR. "
+        "Run it at build time: without the files tiktoken fetches them on first use, and "
+        "where that fails token counts fall back to an approximation."
+    )
+
+    def handle(self, *args, **options):
+        import tiktoken
+
+        os.makedirs(settings.TIKTOKEN_CACHE_DIR, exist_ok=True)
+        for name in TOKEN_ENCODINGS:
+            try:
+                tiktoken.get_encoding(name)
+            except Exception as e:
+                raise CommandError(f"Could not load tiktoken encoding {name}: {str(e)}")
+            self.stdout.write(f"{name} cached in {settings.TIKTOKEN_CACHE_DIR}")
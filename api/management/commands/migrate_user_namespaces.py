@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.models import DocumentChunk
+from api.vector_store import get_vector_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy document vectors from the shared vector-store namespace into per-user namespaces. "
+        "Run it once, set PINECONE_USER_NAMESPACES=True and restart, run it again to copy "
+        "documents ingested in between, then run it with --delete-source. Copies are "
+        "idempotent, so the command can be re-run after an interruption."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only migrate this user')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Vectors fetched and upserted per request')
+        parser.add_argument('--delete-source', action='store_true',
+                            help='Delete vectors from the shared namespace once copied')
+
+    def handle(self, *args, **options):
+        manager = get_vector_store()
+        batch_size = options['batch_size']
+
+        chunks = DocumentChunk.objects.order_by('document__user_id', 'id')
+        if options['user']:
+            chunks = chunks.filter(document__user_id=options['user'])
+
+        copied = missing = 0
+        batch, batch_user = [], None
+        for vector_id, user_id in chunks.values_list('vector_id', 'document__user_id').iterator(chunk_size=batch_size * 10):
+            if batch and (user_id != batch_user or len(batch) >= batch_size):
+                moved, absent = self._move_batch(manager, batch, batch_user, options['delete_source'])
+                copied, missing = copied + moved, missing + absent
+                batch = []
+            batch.append(vector_id)
+            batch_user = user_id
+
+        if batch:
+            moved, absent = self._move_batch(manager, batch, batch_user, options['delete_source'])
+            copied, missing = copied + moved, missing + absent
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {copied} vectors into per-user namespaces "
+            f"({missing} not found in the shared namespace)"
+        ))
+        if not settings.PINECONE_USER_NAMESPACES:
+            self.stdout.write("Set PINECONE_USER_NAMESPACES=True and restart, then run this command again.")
+
+    def _move_batch(self, manager, vector_ids, user_id, delete_source):
+        vectors = manager.fetch_vectors(vector_ids, namespace=manager.namespace)
+        if vectors:
+            results = manager.upsert_vectors(list(vectors.values()), namespace=manager.user_namespace(user_id))
+            if not manager.upsert_succeeded(results):
+                raise CommandError(f"Failed to copy vectors for user {user_id}; re-run to resume")
+            if delete_source:
+                manager.delete_vectors(list(vectors), namespace=manager.namespace)
+        return len(vectors), len(vector_ids) - len(vectors)
@@ -0,0 +1,216 @@
+import signal
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from api.document_processor import DocumentProcessor
+from api.models import DocumentChunk, EmbeddingMigration
+from api.pinecone_utils import PineconeManager
+from api.text_chunker import ChunkSpan
+
+
+class RateBudget:
+    """Token buckets for requests and tokens per minute, refilled continuously"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.capacity = {'requests': requests_per_minute, 'tokens': tokens_per_minute}
+        self.level = dict(self.capacity)
+        self.updated = time.monotonic()
+
+    def acquire(self, requests: int, tokens: int) -> float:
+        """Block until the budget covers the cost; returns seconds waited"""
+        cost = {'requests': requests, 'tokens': tokens}
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            for key, capacity in self.capacity.items():
+                self.level[key] = min(capacity, self.level[key] + capacity * (now - self.updated) / 60)
+            self.updated = now
+
+            # A cost above capacity is let through from a full bucket (leaving it negative)
+            shortfall = max(
+                (min(cost[key], capacity) - self.level[key]) / capacity * 60
+                for key, capacity in self.capacity.items()
+            )
+            if shortfall <= 0:
+                for key in cost:
+                    self.level[key] -= cost[key]
+                return waited
+            time.sleep(shortfall)
+            waited += shortfall
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed every document chunk with a new embedding model into a new Pinecone index "
+        "or namespace. Progress is checkpointed under --name, so re-running the same command "
+        "resumes where it stopped. Use --cutover once the backfill has caught up, deploy the "
+        "printed settings, then run once more to copy chunks ingested in between. Vectors of "
+        "documents deleted during the backfill are not removed from the target."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', required=True,
+                            help='Checkpoint name; re-use it to resume')
+        parser.add_argument('--model', help='Target embedding model (required for a new run)')
+        parser.add_argument('--dimension', type=int, help='Target embedding dimension')
+        parser.add_argument('--index', default=settings.PINECONE_INDEX_NAME,
+                            help='Target Pinecone index (created if missing)')
+        parser.add_argument('--namespace', default='',
+                            help='Target Pinecone namespace')
+        parser.add_argument('--batch-size', type=int, default=settings.REEMBED_BATCH_SIZE,
+                            help='Chunks embedded, upserted and checkpointed together')
+        parser.add_argument('--requests-per-minute', type=int, default=settings.REEMBED_REQUESTS_PER_MINUTE)
+        parser.add_argument('--tokens-per-minute', type=int, default=settings.REEMBED_TOKENS_PER_MINUTE)
+        parser.add_argument('--cutover', action='store_true',
+                            help='After catching up, mark chunks as re-embedded and print the settings to deploy')
+
+    def handle(self, *args, **options):
+        if settings.VECTOR_STORE_BACKEND != 'pinecone':
+            raise CommandError(f"Re-embedding writes to a new Pinecone index; not supported with "
+                               f"VECTOR_STORE_BACKEND={settings.VECTOR_STORE_BACKEND}")
+        migration = self._get_migration(options)
+        if migration.status == 'cut_over':
+            self.stdout.write(f"Migration '{migration.name}' was cut over; copying chunks ingested since")
+
+        processor = DocumentProcessor()
+        processor.embedding_model = migration.target_model
+        target = PineconeManager(
+            index_name=migration.target_index,
+            dimension=migration.dimension,
+            namespace=migration.target_namespace
+        )
+        budget = RateBudget(options['requests_per_minute'], options['tokens_per_minute'])
+
+        stop_event = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping after the current batch (progress is checkpointed)...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        finished = self._backfill(migration, processor, target, budget, options['batch_size'], stop_event)
+        if not finished:
+            self.stdout.write(f"Stopped after {migration.chunks_done} chunks; re-run to resume")
+            return
+
+        if migration.status == 'running':
+            migration.status = 'backfilled'
+            migration.save(update_fields=['status', 'updated_at'])
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete: {migration.chunks_done} chunks re-embedded"))
+
+        if options['cutover'] and migration.status != 'cut_over':
+            self._cut_over(migration)
+
+    def _get_migration(self, options) -> EmbeddingMigration:
+        migration = EmbeddingMigration.objects.filter(name=options['name']).first()
+        if migration is not None:
+            return migration
+
+        if not options['model']:
+            raise CommandError("--model is required to start a new migration")
+        if (options['index'], options['namespace']) == (settings.PINECONE_INDEX_NAME, settings.PINECONE_NAMESPACE):
+            raise CommandError("Target index/namespace is the live one; choose a new --index or --namespace")
+
+        return EmbeddingMigration.objects.create(
+            name=options['name'],
+            target_model=options['model'],
+            target_index=options['index'],
+            target_namespace=options['namespace'],
+            dimension=options['dimension'] or settings.EMBEDDING_DIMENSION
+        )
+
+    def _backfill(self, migration, processor, target, budget, batch_size, stop_event) -> bool:
+        """Stream chunks after the checkpoint in (created_at, id) order; False if interrupted"""
+        queryset = (DocumentChunk.objects
+                    .select_related('document')
+                    .exclude(embedding_model=migration.target_model)
+                    .order_by('created_at', 'id'))
+        if migration.cursor_created_at is not None:
+            queryset = queryset.filter(
+                Q(created_at__gt=migration.cursor_created_at) |
+                Q(created_at=migration.cursor_created_at, id__gt=migration.cursor_id)
+            )
+
+        started = time.monotonic()
+        done = 0
+        batch = []
+        for chunk in queryset.iterator(chunk_size=batch_size):
+            batch.append(chunk)
+            if len(batch) < batch_size:
+                continue
+            self._write_batch(migration, processor, target, budget, batch)
+            done += len(batch)
+            batch = []
+            self.stdout.write(f"{migration.chunks_done} chunks re-embedded "
+                              f"({done / (time.monotonic() - started):.0f}/s)")
+            if stop_event.is_set():
+                return False
+
+        if batch:
+            self._write_batch(migration, processor, target, budget, batch)
+        return True
+
+    def _write_batch(self, migration, processor, target, budget, batch) -> None:
+        texts = [chunk.text_content for chunk in batch]
+        requests = -(-len(texts) // settings.EMBEDDING_BATCH_SIZE)
+        tokens = sum(chunk.token_count or len(chunk.text_content) // 4 + 1 for chunk in batch)
+        budget.acquire(requests, tokens)
+
+        # Target-model vectors would only evict the live model's entries from the shared cache
+        embeddings = processor.generate_embeddings(texts, use_cache=False)
+        if len(embeddings[0]) != migration.dimension:
+            raise CommandError(f"{migration.target_model} returned {len(embeddings[0])}-dimensional "
+                               f"embeddings, expected {migration.dimension}")
+
+        vectors = {}  # Target namespace -> vectors
+        for chunk, embedding in zip(batch, embeddings):
+            span = None
+            if chunk.start_offset is not None:
+                span = ChunkSpan(chunk.start_offset, chunk.end_offset, chunk.token_count)
+            namespace = target.user_namespace(chunk.document.user_id) if settings.PINECONE_USER_NAMESPACES else None
+            vectors.setdefault(namespace, []).append({
+                'id': chunk.vector_id,
+                'values': embedding,
+                'metadata': processor.vector_metadata(chunk.document, chunk.chunk_index, chunk.text_content, span)
+            })
+        for namespace, namespace_vectors in vectors.items():
+            if not target.upsert_succeeded(target.upsert_vectors(namespace_vectors, namespace=namespace)):
+                raise CommandError("Failed to store vectors in the target index; re-run to resume")
+
+        if migration.status == 'cut_over':
+            # Catch-up after the cut-over: these chunks are now served by the target
+            DocumentChunk.objects.filter(id__in=[chunk.id for chunk in batch]).update(
+                embedding_model=migration.target_model
+            )
+
+        # Checkpoint only after the batch is durable, so a crash re-does at most one batch
+        migration.cursor_created_at = batch[-1].created_at
+        migration.cursor_id = batch[-1].id
+        migration.chunks_done += len(batch)
+        migration.save(update_fields=['cursor_created_at', 'cursor_id', 'chunks_done', 'updated_at'])
+
+    def _cut_over(self, migration: EmbeddingMigration) -> None:
+        # Only relabel chunks the backfill has copied; anything newer is left for the catch-up run
+        updated = 0
+        if migration.cursor_created_at is not None:
+            updated = (DocumentChunk.objects
+                       .exclude(embedding_model=migration.target_model)
+                       .filter(Q(created_at__lt=migration.cursor_created_at) |
+                               Q(created_at=migration.cursor_created_at, id__lte=migration.cursor_id))
+                       .update(embedding_model=migration.target_model))
+        migration.status = 'cut_over'
+        migration.completed_at = timezone.now()
+        migration.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+        self.stdout.write(self.style.SUCCESS(f"Cut over {updated} chunks to {migration.target_model}. Deploy:"))
+        self.stdout.write(f"  EMBEDDING_MODEL={migration.target_model}")
+        self.stdout.write(f"  EMBEDDING_DIMENSION={migration.dimension}")
+        self.stdout.write(f"  PINECONE_INDEX_NAME={migration.target_index}")
+        self.stdout.write(f"  PINECONE_NAMESPACE={migration.target_namespace}")
+        self.stdout.write(f"then run this command again with --name {migration.name} "
+                          f"to copy chunks ingested before the restart.")
@@ -0,0 +1,35 @@
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.ingestion_queue import IngestionWorkerPool
+
+
+class Command(BaseCommand):
+    help = "Run a dedicated pool of document ingestion workers that drains the upload queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.INGESTION_WORKERS,
+                            help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=settings.INGESTION_POLL_INTERVAL,
+                            help='Seconds between queue checks when idle')
+
+    def handle(self, *args, **options):
+        pool = IngestionWorkerPool(
+            num_workers=options['workers'],
+            poll_interval=options['poll_interval']
+        )
+        stop_event = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping ingestion workers after their current jobs...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f"Ingestion workers running ({options['workers']} threads)"))
+        stop_event.wait()
+        pool.stop()
+        self.stdout.write(self.style.SUCCESS("Ingestion workers stopped"))
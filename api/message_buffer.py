@@ -0,0 +1,142 @@
+import atexit
+import threading
+from typing import List, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import ChatMessage, UserChatSession
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageBuffer:
+    """Write-behind buffer for ChatMessage inserts
+
+    ``add`` returns the unsaved message (its ID and timestamp are already
+    set) and a background thread inserts the pending messages with one
+    ``bulk_create`` every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` are waiting. On SQLite that is one transaction and one
+    fsync per batch instead of per message. A crash loses at most the last
+    ``flush_interval`` seconds of messages; a normal interpreter exit
+    flushes. Readers that must see their own writes call ``flush`` first;
+    the buffer is per process, so that doesn't cover other workers' writes.
+    With ``flush_interval`` 0, messages are written through.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[ChatMessage] = []
+        self._lock = threading.Lock()  # Guards _pending
+        self._flush_lock = threading.Lock()  # One flush at a time, so batches land in order
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, **fields) -> ChatMessage:
+        """Queue a ChatMessage insert; takes the same fields as objects.create"""
+        message = self._new_message(fields)
+        if self.flush_interval <= 0:
+            message.save(force_insert=True)
+        else:
+            self._enqueue(message)
+        return message
+
+    async def aadd(self, **fields) -> ChatMessage:
+        """add for async views (only write-through mode touches the database)"""
+        message = self._new_message(fields)
+        if self.flush_interval <= 0:
+            await message.asave(force_insert=True)
+        else:
+            self._enqueue(message)
+        return message
+
+    def _new_message(self, fields) -> ChatMessage:
+        fields.setdefault('timestamp', timezone.now())
+        return ChatMessage(**fields)
+
+    def _enqueue(self, message: ChatMessage) -> None:
+        with self._lock:
+            self._pending.append(message)
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None or not self._thread.is_alive():
+                # Also restarts the flusher in a process forked after it started
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Insert everything pending now; returns the number of messages written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            written = 0
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                try:
+                    written += self._write(batch)
+                except Exception as e:
+                    logger.error(f"Lost {len(batch)} chat messages: {str(e)}")
+            return written
+
+    def stop(self) -> None:
+        """Stop the flusher thread and write what is left"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='chat-message-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _write(self, batch: List[ChatMessage]) -> int:
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+            return len(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} chat messages, retrying without deleted sessions: {str(e)}")
+        # A session deleted while its messages waited fails the whole batch
+        live_sessions = set(UserChatSession.objects.filter(
+            id__in={message.session_id for message in batch}
+        ).values_list('id', flat=True))
+        batch_for_live = [message for message in batch if message.session_id in live_sessions]
+        if len(batch_for_live) < len(batch):
+            logger.warning(f"Dropped {len(batch) - len(batch_for_live)} chat messages of deleted sessions")
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(batch_for_live)
+        return len(batch_for_live)
+
+
+# Global instance
+chat_message_buffer: Optional[ChatMessageBuffer] = None
+_buffer_lock = threading.Lock()
+
+def get_chat_message_buffer() -> ChatMessageBuffer:
+    """Get or create the global chat message buffer (flushed when the process exits)"""
+    global chat_message_buffer
+    with _buffer_lock:
+        if chat_message_buffer is None:
+            chat_message_buffer = ChatMessageBuffer(
+                flush_interval=settings.CHAT_MESSAGE_FLUSH_INTERVAL,
+                batch_size=settings.CHAT_MESSAGE_BATCH_SIZE
+            )
+            atexit.register(chat_message_buffer.stop)
+    return chat_message_buffer
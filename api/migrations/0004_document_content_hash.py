@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_chunk_spans'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='userdocument',
+            index=models.Index(fields=['user_id', 'content_hash'], name='user_docume_user_id_6488b4_idx'),
+        ),
+    ]
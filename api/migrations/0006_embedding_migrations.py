@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_document_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('target_model', models.CharField(max_length=100)),
+                ('target_index', models.CharField(max_length=100)),
+                ('target_namespace', models.CharField(blank=True, max_length=100)),
+                ('dimension', models.IntegerField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('backfilled', 'Backfilled'), ('cut_over', 'Cut Over')], default='running', max_length=20)),
+                ('cursor_created_at', models.DateTimeField(blank=True, null=True)),
+                ('cursor_id', models.UUIDField(blank=True, null=True)),
+                ('chunks_done', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'embedding_migrations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['created_at', 'id'], name='document_ch_created_98c8c0_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_embedding_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='term_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ChunkTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=128)),
+                ('term', models.CharField(max_length=64)),
+                ('term_frequency', models.IntegerField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='api.documentchunk')),
+            ],
+            options={
+                'db_table': 'chunk_terms',
+                'indexes': [models.Index(fields=['user_id', 'term'], name='chunk_terms_user_id_4a77b3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_lexical_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMedicalProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=128, unique=True)),
+                ('context_chunks', models.JSONField(default=list)),
+                ('document_version', models.IntegerField(default=0)),
+                ('built_version', models.IntegerField(default=-1)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'user_medical_profiles',
+            },
+        ),
+    ]
@@ -20,9 +20,15 @@ class UserDocument(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True)
     file_path = models.CharField(max_length=500, blank=True, null=True)  # Optional file storage
     file_size = models.IntegerField(default=0)  # File size in bytes
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the uploaded file
     vector_ids = models.JSONField(default=list)  # Store Pinecone vector IDs for this document
     extracted_text = models.TextField(blank=True)  # Store extracted text content
-    processing_status = models.CharField(max_length=20, default='pending')  # pending, processing, completed, failed
+    processing_status = models.CharField(max_length=20, default='pending')  # pending, processing, completed, failed, replacing
+    processing_error = models.TextField(blank=True)  # Last ingestion error, if any
+    processing_attempts = models.IntegerField(default=0)  # Number of times a worker claimed this document
+    processing_started_at = models.DateTimeField(blank=True, null=True)  # When the current attempt was claimed
+    processed_at = models.DateTimeField(blank=True, null=True)  # When ingestion finished (completed or failed)
+    revision = models.IntegerField(default=0)  # Bumped each time the file is replaced
     
     class Meta:
         db_table = 'user_documents'
@@ -30,6 +36,8 @@ class UserDocument(models.Model):
             models.Index(fields=['user_id']),
             models.Index(fields=['upload_date']),
             models.Index(fields=['document_type']),
+            models.Index(fields=['processing_status', 'upload_date']),
+            models.Index(fields=['user_id', 'content_hash']),
         ]
     
     def __str__(self):
@@ -44,6 +52,11 @@ class DocumentChunk(models.Model):
     text_content = models.TextField()
     vector_id = models.CharField(max_length=255, unique=True)  # Pinecone vector ID
     embedding_model = models.CharField(max_length=50, default='text-embedding-ada-002')
+    start_offset = models.IntegerField(blank=True, null=True)  # Span of the chunk in the document's extracted_text
+    end_offset = models.IntegerField(blank=True, null=True)
+    token_count = models.IntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True)  # SHA-256 of the normalized chunk text
+    term_count = models.IntegerField(default=0)  # Indexed terms (BM25 document length)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -51,12 +64,82 @@ class DocumentChunk(models.Model):
         indexes = [
             models.Index(fields=['document']),
             models.Index(fields=['vector_id']),
+            models.Index(fields=['created_at', 'id']),
         ]
         unique_together = ['document', 'chunk_index']
     
     def __str__(self):
         return f"Chunk {self.chunk_index} of {self.document.document_name}"
 
+class ChunkTerm(models.Model):
+    """Inverted-index posting: a term occurring in a chunk (see api.lexical_index)"""
+    
+    chunk = models.ForeignKey(DocumentChunk, on_delete=models.CASCADE, related_name='terms')
+    user_id = models.CharField(max_length=128)  # Denormalized so a user's postings are one index range
+    term = models.CharField(max_length=64)
+    term_frequency = models.IntegerField()
+    
+    class Meta:
+        db_table = 'chunk_terms'
+        indexes = [
+            models.Index(fields=['user_id', 'term']),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} x{self.term_frequency} in {self.chunk_id}"
+
+class UserMedicalProfile(models.Model):
+    """Medical context retrieved from a user's documents, cached until they change
+    
+    ``document_version`` is bumped on every upload, ingestion or delete; the
+    cached chunks are current while ``built_version`` matches it.
+    """
+    
+    user_id = models.CharField(max_length=128, unique=True)  # Firebase UID
+    context_chunks = models.JSONField(default=list)  # Search results the context is built from
+    document_version = models.IntegerField(default=0)
+    built_version = models.IntegerField(default=-1)  # document_version the chunks were retrieved at
+    built_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'user_medical_profiles'
+    
+    @property
+    def is_current(self) -> bool:
+        return self.built_version == self.document_version
+    
+    def __str__(self):
+        return f"Medical profile of {self.user_id} (v{self.document_version})"
+
+class EmbeddingMigration(models.Model):
+    """Checkpoint of a bulk re-embedding run (see the reembed_chunks command)"""
+    
+    STATUSES = [
+        ('running', 'Running'),
+        ('backfilled', 'Backfilled'),
+        ('cut_over', 'Cut Over'),
+    ]
+    
+    name = models.CharField(max_length=100, unique=True)
+    target_model = models.CharField(max_length=100)
+    target_index = models.CharField(max_length=100)
+    target_namespace = models.CharField(max_length=100, blank=True)
+    dimension = models.IntegerField()
+    status = models.CharField(max_length=20, choices=STATUSES, default='running')
+    # Keyset cursor: the last chunk written, in (created_at, id) order
+    cursor_created_at = models.DateTimeField(blank=True, null=True)
+    cursor_id = models.UUIDField(blank=True, null=True)
+    chunks_done = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'embedding_migrations'
+    
+    def __str__(self):
+        return f"{self.name} -> {self.target_model} ({self.status})"
+
 class UserChatSession(models.Model):
     """Model to store user chat sessions"""
     
@@ -91,7 +174,7 @@ class ChatMessage(models.Model):
     session = models.ForeignKey(UserChatSession, on_delete=models.CASCADE, related_name='messages')
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Set when created, not when a buffered insert lands
     metadata = models.JSONField(default=dict)  # Store additional info like used documents, etc.
     
     class Meta:
@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import List, Iterator, Optional
+import PyPDF2
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PdfExtractionTimeout(Exception):
+    """A PDF extraction job ran past its wall-clock limit"""
+
+
+class _AlarmExpired(BaseException):
+    # BaseException so PyPDF2's broad ``except Exception`` blocks can't swallow it
+    pass
+
+
+def _raise_alarm(signum, frame):
+    raise _AlarmExpired()
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """Abort the enclosed block after ``seconds`` using SIGALRM (POSIX only)"""
+    if not seconds or not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    except _AlarmExpired:
+        raise PdfExtractionTimeout(f"PDF extraction job exceeded {seconds}s") from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _count_pages(path: str, timeout: float) -> int:
+    """Worker job: number of pages in the PDF"""
+    with _time_limit(timeout):
+        return len(PyPDF2.PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, stop: int, timeout: float) -> List[str]:
+    """Worker job: text of pages [start, stop)"""
+    with _time_limit(timeout):
+        reader = PyPDF2.PdfReader(path)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+@contextmanager
+def _local_pdf_path(pdf_file):
+    """Yield a filesystem path for ``pdf_file`` so workers can open it themselves
+
+    Files already on local disk are used in place; anything else (in-memory
+    uploads, remote storage) is spilled to a temporary file once.
+    """
+    name = getattr(pdf_file, 'name', None)
+    if hasattr(pdf_file, 'temporary_file_path'):
+        yield pdf_file.temporary_file_path()
+        return
+    if isinstance(name, str) and os.path.isfile(name):
+        yield name
+        return
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        if hasattr(pdf_file, 'seek'):
+            pdf_file.seek(0)
+        shutil.copyfileobj(pdf_file, tmp)
+    try:
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+
+class PdfExtractionPool:
+    """Parse PDFs in a pool of worker processes
+
+    Text extraction in PyPDF2 is pure-Python and CPU-bound, so threads
+    serialize on the GIL. Each PDF is split into page-range jobs that run in
+    parallel across cores and are yielded back in page order. Every job is
+    limited to ``timeout`` seconds inside the worker; if a worker stops
+    responding altogether the pool is torn down and rebuilt.
+    """
+
+    def __init__(self, max_workers: int, pages_per_job: int, timeout: float):
+        self.max_workers = max_workers
+        self.pages_per_job = pages_per_job
+        self.timeout = timeout
+        # Backstop for hangs the in-worker alarm cannot interrupt (e.g. inside C code);
+        # includes headroom for worker start-up and jobs queued from other documents
+        self.backstop_timeout = timeout * 2 + 30
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web worker is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Kill a wedged pool so its workers cannot stay pinned"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logger.warning("Terminating PDF extraction pool after a worker stopped responding")
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _result(self, executor: ProcessPoolExecutor, future):
+        try:
+            return future.result(timeout=self.backstop_timeout)
+        except FutureTimeoutError:
+            self._reset_executor(executor)
+            raise PdfExtractionTimeout("PDF extraction worker stopped responding")
+
+    def iter_pages(self, pdf_file) -> Iterator[str]:
+        """Yield page texts of ``pdf_file`` in order, extracting ranges in parallel"""
+        with _local_pdf_path(pdf_file) as path:
+            executor = self._get_executor()
+            page_count = self._result(executor, executor.submit(_count_pages, path, self.timeout))
+
+            ranges = deque(
+                (start, min(start + self.pages_per_job, page_count))
+                for start in range(0, page_count, self.pages_per_job)
+            )
+            in_flight = deque()
+            try:
+                while ranges or in_flight:
+                    # Keep at most one job per worker in flight for this document
+                    while ranges and len(in_flight) < self.max_workers:
+                        start, stop = ranges.popleft()
+                        in_flight.append(executor.submit(_extract_page_range, path, start, stop, self.timeout))
+                    yield from self._result(executor, in_flight.popleft())
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+
+# Global instance
+pdf_extraction_pool = None
+
+def get_pdf_extraction_pool() -> Optional[PdfExtractionPool]:
+    """Get or create the global PDF extraction pool (None when disabled)"""
+    global pdf_extraction_pool
+    if settings.PDF_EXTRACTION_WORKERS <= 0:
+        return None
+    if pdf_extraction_pool is None:
+        pdf_extraction_pool = PdfExtractionPool(
+            max_workers=settings.PDF_EXTRACTION_WORKERS,
+            pages_per_job=settings.PDF_EXTRACTION_PAGES_PER_JOB,
+            timeout=settings.PDF_EXTRACTION_TIMEOUT
+        )
+    return pdf_extraction_pool
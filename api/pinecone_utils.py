@@ -1,18 +1,32 @@
+import json
 import os
+import time
 import pinecone
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from typing import List, Dict, Any, Optional
+from .async_clients import get_http_session
+from .local_vector_store import VectorMatch
 import logging
 
 logger = logging.getLogger(__name__)
 
 class PineconeManager:
-    def __init__(self):
+    def __init__(self, index_name: Optional[str] = None, dimension: Optional[int] = None,
+                 namespace: Optional[str] = None):
         self.api_key = settings.PINECONE_API_KEY
         self.environment = settings.PINECONE_ENVIRONMENT
-        self.index_name = settings.PINECONE_INDEX_NAME
+        self.index_name = index_name or settings.PINECONE_INDEX_NAME
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.namespace = settings.PINECONE_NAMESPACE if namespace is None else namespace
+        self.upsert_batch_size = settings.PINECONE_UPSERT_BATCH_SIZE
+        self.upsert_max_bytes = settings.PINECONE_UPSERT_MAX_BYTES
+        self.upsert_max_concurrency = settings.PINECONE_UPSERT_MAX_CONCURRENCY
+        self.upsert_max_retries = settings.PINECONE_UPSERT_MAX_RETRIES
+        self.upsert_retry_backoff = settings.PINECONE_UPSERT_RETRY_BACKOFF
         self.pc = None
         self.index = None
+        self.index_host = settings.PINECONE_INDEX_HOST
         self._initialize_pinecone()
         # Ensure index is created and accessible
         self.create_index_if_not_exists()
@@ -31,10 +45,10 @@ class PineconeManager:
         try:
             # Check if index exists
             if not self.pc.has_index(self.index_name):
-                # Create index for OpenAI embeddings (ada-002, 1536 dims)
+                # Create index sized for the configured embedding model
                 self.pc.create_index(
                     name=self.index_name,
-                    dimension=1536,
+                    dimension=self.dimension,
                     metric="cosine",
                     spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
                     
@@ -45,35 +59,112 @@ class PineconeManager:
                 logger.info(f"Index {self.index_name} already exists")
             # Get the index
             self.index = self.pc.Index(self.index_name)
+            if not self.index_host:
+                self.index_host = self.pc.describe_index(self.index_name).host
             logger.info(f"Successfully connected to index: {self.index_name}")
         except Exception as e:
             logger.error(f"Error creating index: {str(e)}")
             raise
 
     
-    def upsert_vectors(self, vectors: List[Dict[str, Any]]) -> bool:
-        """Upsert vectors to Pinecone index"""
+    def _build_upsert_batches(self, vectors: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split vectors into batches under both the vector-count and request-size limits"""
+        batches = []
+        current_batch = []
+        current_bytes = 0
+        
+        for vector in vectors:
+            size = len(json.dumps(vector, separators=(',', ':')))
+            if current_batch and (len(current_batch) >= self.upsert_batch_size or
+                                  current_bytes + size > self.upsert_max_bytes):
+                batches.append(current_batch)
+                current_batch = []
+                current_bytes = 0
+            if size > self.upsert_max_bytes:
+                logger.warning(f"Vector {vector.get('id')} is {size} bytes, over the {self.upsert_max_bytes} byte request limit")
+            current_batch.append(vector)
+            current_bytes += size
+        
+        if current_batch:
+            batches.append(current_batch)
+        
+        return batches
+    
+    def user_namespace(self, user_id: str) -> str:
+        """Namespace holding one user's vectors (nested under the configured namespace)"""
+        return f"{self.namespace}_user_{user_id}" if self.namespace else f"user_{user_id}"
+    
+    def _resolve_namespace(self, namespace: Optional[str]) -> str:
+        return self.namespace if namespace is None else namespace
+    
+    def _upsert_batch(self, batch_number: int, vectors: List[Dict[str, Any]], namespace: str) -> Dict[str, Any]:
+        """Upsert one batch, retrying transient failures with exponential backoff"""
+        result = {'batch': batch_number, 'count': len(vectors), 'success': False, 'attempts': 0, 'error': None}
+        for attempt in range(1, self.upsert_max_retries + 1):
+            result['attempts'] = attempt
+            try:
+                self.index.upsert(vectors=vectors, namespace=namespace)
+                result['success'] = True
+                result['error'] = None
+                return result
+            except Exception as e:
+                result['error'] = str(e)
+                # Client errors other than rate limiting won't succeed on retry
+                status_code = getattr(e, 'status', None)
+                retryable = status_code is None or status_code == 429 or status_code >= 500
+                if not retryable or attempt == self.upsert_max_retries:
+                    break
+                delay = self.upsert_retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"Upsert batch {batch_number} failed (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+        
+        logger.error(f"Error upserting batch {batch_number} of {len(vectors)} vectors: {result['error']}")
+        return result
+    
+    @staticmethod
+    def upsert_succeeded(results: List[Dict[str, Any]]) -> bool:
+        """True if every batch of an upsert_vectors call was stored"""
+        return bool(results) and all(result['success'] for result in results)
+    
+    def upsert_vectors(self, vectors: List[Dict[str, Any]],
+                       namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Upsert vectors to Pinecone index
+        
+        Vectors are split by count and serialized size and the batches are
+        sent concurrently. Returns one result per batch, in order:
+        ``{'batch', 'count', 'success', 'attempts', 'error'}``.
+        """
+        namespace = self._resolve_namespace(namespace)
+        if not vectors:
+            logger.warning("No vectors provided for upsert")
+            return []
+        
         try:
-            if not vectors:
-                logger.warning("No vectors provided for upsert")
-                return False
-            
             # Ensure index is available
             if self.index is None:
                 logger.error("Index is not initialized")
                 self.create_index_if_not_exists()
-                
-            self.index.upsert(vectors=vectors)
-            logger.info(f"Successfully upserted {len(vectors)} vectors")
-            return True
-            
         except Exception as e:
-            logger.error(f"Error upserting vectors: {str(e)}")
-            return False
+            return [{'batch': 0, 'count': len(vectors), 'success': False, 'attempts': 0, 'error': str(e)}]
+        
+        batches = self._build_upsert_batches(vectors)
+        max_workers = max(1, min(self.upsert_max_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._upsert_batch, range(len(batches)), batches,
+                                        [namespace] * len(batches)))
+        
+        upserted = sum(result['count'] for result in results if result['success'])
+        if upserted == len(vectors):
+            logger.info(f"Successfully upserted {len(vectors)} vectors in {len(batches)} batches")
+        else:
+            logger.error(f"Upserted {upserted} of {len(vectors)} vectors; "
+                         f"{sum(1 for result in results if not result['success'])} of {len(batches)} batches failed")
+        return results
     
     def query_vectors(self, query_vector: List[float], top_k: int = 5, 
-                     include_metadata: bool = True, filter: Optional[Dict] = None) -> List[Dict]:
-        """Query vectors from Pinecone index"""
+                     include_metadata: bool = True, filter: Optional[Dict] = None,
+                     namespace: Optional[str] = None, raise_errors: bool = False) -> List[Dict]:
+        """Query vectors from Pinecone index (errors return [] unless ``raise_errors``)"""
         try:
             # Ensure index is available
             if self.index is None:
@@ -84,16 +175,47 @@ class PineconeManager:
                 vector=query_vector,
                 top_k=top_k,
                 include_metadata=include_metadata,
-                filter=filter
+                filter=filter,
+                namespace=self._resolve_namespace(namespace)
             )
             
             return query_response.matches
             
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Error querying vectors: {str(e)}")
             return []
     
-    def delete_vectors(self, ids: List[str]) -> bool:
+    async def aquery_vectors(self, query_vector: List[float], top_k: int = 5,
+                             include_metadata: bool = True, filter: Optional[Dict] = None,
+                             namespace: Optional[str] = None, raise_errors: bool = False) -> List[VectorMatch]:
+        """query_vectors for async views, sent to the index's REST query endpoint without blocking"""
+        payload = {
+            'vector': query_vector,
+            'topK': top_k,
+            'includeMetadata': include_metadata,
+            'namespace': self._resolve_namespace(namespace)
+        }
+        if filter:
+            payload['filter'] = filter
+        host = self.index_host if self.index_host.startswith('http') else f"https://{self.index_host}"
+        try:
+            async with get_http_session().post(f"{host}/query", json=payload,
+                                               headers={'Api-Key': self.api_key}) as response:
+                response.raise_for_status()
+                data = await response.json()
+            return [
+                VectorMatch(id=match['id'], score=match.get('score', 0.0), metadata=match.get('metadata') or {})
+                for match in data.get('matches', [])
+            ]
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error querying vectors: {str(e)}")
+            return []
+    
+    def delete_vectors(self, ids: List[str], namespace: Optional[str] = None) -> bool:
         """Delete vectors from Pinecone index"""
         try:
             if not ids:
@@ -105,7 +227,7 @@ class PineconeManager:
                 logger.error("Index is not initialized")
                 self.create_index_if_not_exists()
                 
-            self.index.delete(ids=ids)
+            self.index.delete(ids=ids, namespace=self._resolve_namespace(namespace))
             logger.info(f"Successfully deleted {len(ids)} vectors")
             return True
             
@@ -113,6 +235,61 @@ class PineconeManager:
             logger.error(f"Error deleting vectors: {str(e)}")
             return False
     
+    def delete_by_prefix(self, prefix: str, namespace: Optional[str] = None) -> int:
+        """Delete every vector whose ID starts with ``prefix``; returns the number deleted
+        
+        IDs are listed page by page from the index itself (serverless
+        indexes), so no ID list has to be kept elsewhere.
+        """
+        namespace = self._resolve_namespace(namespace)
+        try:
+            if self.index is None:
+                logger.error("Index is not initialized")
+                self.create_index_if_not_exists()
+            
+            deleted = 0
+            for ids in self.index.list(prefix=prefix, namespace=namespace):
+                if ids:
+                    self.index.delete(ids=ids, namespace=namespace)
+                    deleted += len(ids)
+            logger.info(f"Successfully deleted {deleted} vectors with prefix {prefix}")
+            return deleted
+            
+        except Exception as e:
+            logger.error(f"Error deleting vectors by prefix: {str(e)}")
+            raise
+    
+    def delete_namespace(self, namespace: str) -> bool:
+        """Delete every vector in a namespace"""
+        try:
+            if self.index is None:
+                logger.error("Index is not initialized")
+                self.create_index_if_not_exists()
+            
+            self.index.delete(delete_all=True, namespace=namespace)
+            logger.info(f"Successfully deleted namespace: {namespace}")
+            return True
+            
+        except pinecone.NotFoundException:
+            # Serverless indexes 404 on a namespace that was never written to
+            logger.info(f"Namespace {namespace} does not exist; nothing to delete")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting namespace: {str(e)}")
+            return False
+    
+    def fetch_vectors(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch stored vectors (values and metadata) by ID"""
+        if self.index is None:
+            logger.error("Index is not initialized")
+            self.create_index_if_not_exists()
+        
+        response = self.index.fetch(ids=ids, namespace=self._resolve_namespace(namespace))
+        return {
+            vector_id: {'id': vector_id, 'values': list(vector.values), 'metadata': vector.metadata or {}}
+            for vector_id, vector in response.vectors.items()
+        }
+    
     def get_index_stats(self) -> Dict[str, Any]:
         """Get statistics about the Pinecone index"""
         try:
@@ -0,0 +1,171 @@
+import os
+from typing import Optional
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ScalarQuantizer:
+    """int8 codes for a growing matrix of vectors, one float32 scale per row
+
+    ``codes[i] * scales[i]`` approximates row ``i``, so a dot product is
+    ``(codes @ query) * scales``. Needs no training; 4x smaller than float32.
+    """
+
+    method = 'int8'
+    trained = True
+    block_rows = 2048
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.codes = np.zeros((0, dimension), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def reserve(self, rows: int) -> None:
+        if rows <= len(self.codes):
+            return
+        # Grow by a quarter: codes are what we keep resident, so over-allocation is the cost
+        capacity = max(rows, len(self.codes) + len(self.codes) // 4, 1024)
+        codes = np.zeros((capacity, self.dimension), dtype=np.int8)
+        codes[:len(self.codes)] = self.codes
+        scales = np.zeros(capacity, dtype=np.float32)
+        scales[:len(self.scales)] = self.scales
+        self.codes, self.scales = codes, scales
+
+    def set(self, rows, vectors: np.ndarray) -> None:
+        """Encode ``vectors`` into ``rows``"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        self.reserve(int(np.max(rows)) + 1)
+        self.codes[rows] = np.clip(np.rint(vectors / scales[:, None]), -127, 127)
+        self.scales[rows] = scales
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products with ``query`` for ``rows`` (or every reserved row)"""
+        count = len(self.codes) if rows is None else len(rows)
+        out = np.empty(count, dtype=np.float32)
+        # int8 @ float32 has no BLAS path; widening cache-sized blocks keeps the scan near sgemv speed
+        block = np.empty((min(count, self.block_rows), self.dimension), dtype=np.float32)
+        for start in range(0, count, self.block_rows):
+            stop = min(start + self.block_rows, count)
+            widened = block[:stop - start]
+            widened[...] = self.codes[start:stop] if rows is None else self.codes[rows[start:stop]]
+            np.dot(widened, query, out=out[start:stop])
+        return out * (self.scales if rows is None else self.scales[rows])
+
+
+class ProductQuantizer:
+    """Product-quantized codes: each of ``subspaces`` sub-vectors is one of 256 centroids
+
+    A 1536-dim vector with 96 subspaces is stored in 96 bytes (64x smaller
+    than float32). Scores use asymmetric distance: the full-precision query
+    is dotted with every centroid once, then each row's score is a sum of
+    table lookups. Codebooks are trained with k-means on a sample.
+    """
+
+    method = 'pq'
+    centroids = 256
+
+    def __init__(self, dimension: int, subspaces: int = 96):
+        if dimension % subspaces:
+            raise ValueError(f"Dimension {dimension} is not divisible into {subspaces} subspaces")
+        self.dimension = dimension
+        self.subspaces = subspaces
+        self.sub_dimension = dimension // subspaces
+        self.codebooks = None  # (subspaces, 256, sub_dimension)
+        self.codes = np.zeros((0, subspaces), dtype=np.uint8)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.codebooks.nbytes if self.trained else 0)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        # (n, dimension) -> (subspaces, n, sub_dimension)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.subspaces, self.sub_dimension).transpose(1, 0, 2)
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        return np.argmax(data @ centroids.T - 0.5 * np.sum(centroids ** 2, axis=1), axis=1)
+
+    def train(self, vectors: np.ndarray, iterations: int = 10, seed: int = 0) -> None:
+        """Fit one k-means codebook per subspace (a few thousand sample vectors is plenty)"""
+        rng = np.random.default_rng(seed)
+        sub_vectors = self._split(vectors)
+        n = sub_vectors.shape[1]
+        codebooks = np.zeros((self.subspaces, self.centroids, self.sub_dimension), dtype=np.float32)
+        for s in range(self.subspaces):
+            data = sub_vectors[s]
+            centroids = data[rng.choice(n, size=self.centroids, replace=n < self.centroids)].copy()
+            for _ in range(iterations):
+                assignment = self._nearest(data, centroids)
+                counts = np.bincount(assignment, minlength=self.centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, data)
+                occupied = counts > 0
+                centroids[occupied] = sums[occupied] / counts[occupied, None]
+                # Re-seed empty clusters from random points
+                empty = np.flatnonzero(~occupied)
+                centroids[empty] = data[rng.choice(n, size=len(empty))]
+            codebooks[s] = centroids
+        self.codebooks = codebooks
+
+    def reserve(self, rows: int) -> None:
+        if rows <= len(self.codes):
+            return
+        codes = np.zeros((max(rows, len(self.codes) + len(self.codes) // 4, 1024), self.subspaces), dtype=np.uint8)
+        codes[:len(self.codes)] = self.codes
+        self.codes = codes
+
+    def set(self, rows, vectors: np.ndarray) -> None:
+        """Encode ``vectors`` into ``rows`` (requires trained codebooks)"""
+        sub_vectors = self._split(vectors)
+        codes = np.empty((sub_vectors.shape[1], self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            codes[:, s] = self._nearest(sub_vectors[s], self.codebooks[s])
+        self.reserve(int(np.max(rows)) + 1)
+        self.codes[rows] = codes
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products with ``query`` for ``rows`` (or every reserved row)"""
+        table = np.einsum('skd,sd->sk', self.codebooks, query.reshape(self.subspaces, self.sub_dimension))
+        codes = self.codes if rows is None else self.codes[rows]
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
+
+    def save_codebooks(self, path: str) -> None:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self.codebooks)
+        os.replace(tmp_path, path)
+
+    def load_codebooks(self, path: str) -> bool:
+        """Load codebooks saved by save_codebooks; False if missing or shaped for other settings"""
+        if not os.path.exists(path):
+            return False
+        codebooks = np.load(path)
+        if codebooks.shape != (self.subspaces, self.centroids, self.sub_dimension):
+            return False
+        self.codebooks = codebooks.astype(np.float32)
+        return True
+
+
+def make_quantizer(method: str, dimension: int, pq_subspaces: int = 96):
+    """Quantizer for a LOCAL_VECTOR_STORE_QUANTIZATION value, or None to scan float32"""
+    if not method or method == 'none':
+        return None
+    if method == 'int8':
+        return ScalarQuantizer(dimension)
+    if method == 'pq':
+        return ProductQuantizer(dimension, pq_subspaces)
+    raise ValueError(f"Unknown quantization method: {method}")
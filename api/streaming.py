@@ -0,0 +1,133 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+import openai
+from . import async_clients
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_STREAM = 'text/event-stream'
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views accept ``Accept: text/event-stream``
+
+    Streaming views return a StreamingHttpResponse themselves; this renders
+    the ordinary Responses such a client can still get (validation and
+    server errors) as a single ``error`` or ``message`` event.
+    """
+    media_type = EVENT_STREAM
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        event = 'error' if response is not None and response.status_code >= 400 else 'message'
+        return sse_event(event, data).encode(self.charset)
+
+
+def wants_event_stream(request, data=None) -> bool:
+    """True if the client asked for streaming via a ``stream`` flag or the Accept header
+
+    ``data`` is the parsed request body, by default DRF's ``request.data``.
+    """
+    flag = (request.data if data is None else data).get('stream')
+    if isinstance(flag, str):
+        flag = flag.lower() in ('1', 'true', 'yes')
+    return bool(flag) or EVENT_STREAM in request.META.get('HTTP_ACCEPT', '')
+
+
+def stream_chat_completion(messages: Optional[List[Dict]], metadata: Dict[str, Any],
+                           on_finish: Callable[[str, bool], Dict[str, Any]],
+                           model: str = "gpt-4o", fixed_response: str = "") -> StreamingHttpResponse:
+    """Stream a chat completion to the client as server-sent events
+
+    Events: ``metadata`` (sent before the model is called, e.g. retrieval
+    sources), ``token`` per content delta, then ``done``, or ``error`` if
+    the completion fails. Without ``messages`` the ``fixed_response`` is
+    sent as a single token. ``on_finish(text, completed)`` persists the
+    reply exactly once: when the stream ends, fails, or the client
+    disconnects (the server then closes the generator); what it returns is
+    added to the ``done`` event.
+    """
+    def events() -> Iterator[str]:
+        parts = []
+        finished = False
+        try:
+            yield sse_event('metadata', metadata)
+            if messages is None:
+                parts.append(fixed_response)
+                yield sse_event('token', {'content': fixed_response})
+            else:
+                try:
+                    for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True):
+                        content = chunk.choices[0].get('delta', {}).get('content')
+                        if content:
+                            parts.append(content)
+                            yield sse_event('token', {'content': content})
+                except Exception as e:
+                    logger.error(f"Error streaming chat completion: {str(e)}")
+                    finished = True
+                    on_finish("".join(parts) or f"I apologize, but I encountered an error: {str(e)}", False)
+                    yield sse_event('error', {'error': str(e)})
+                    return
+            finished = True
+            yield sse_event('done', on_finish("".join(parts), True) or {})
+        finally:
+            if not finished:
+                # Client went away mid-stream: keep what was generated so far
+                on_finish("".join(parts), False)
+
+    return _event_stream_response(events())
+
+
+def astream_chat_completion(messages: Optional[List[Dict]], metadata: Dict[str, Any],
+                            on_finish: Callable[[str, bool], Awaitable[Dict[str, Any]]],
+                            model: str = "gpt-4o", fixed_response: str = "") -> StreamingHttpResponse:
+    """stream_chat_completion for async views: tokens arrive without blocking
+    the event loop and ``on_finish`` is a coroutine function. Under ASGI a disconnect
+    cancels the stream, which persists the partial reply the same way.
+    """
+    async def events() -> AsyncIterator[str]:
+        parts = []
+        finished = False
+        try:
+            yield sse_event('metadata', metadata)
+            if messages is None:
+                parts.append(fixed_response)
+                yield sse_event('token', {'content': fixed_response})
+            else:
+                try:
+                    chunks = await async_clients.create_chat_completion(model=model, messages=messages, stream=True)
+                    async for chunk in chunks:
+                        content = chunk.choices[0].get('delta', {}).get('content')
+                        if content:
+                            parts.append(content)
+                            yield sse_event('token', {'content': content})
+                except Exception as e:
+                    logger.error(f"Error streaming chat completion: {str(e)}")
+                    finished = True
+                    await on_finish("".join(parts) or f"I apologize, but I encountered an error: {str(e)}", False)
+                    yield sse_event('error', {'error': str(e)})
+                    return
+            finished = True
+            yield sse_event('done', await on_finish("".join(parts), True) or {})
+        finally:
+            if not finished:
+                await on_finish("".join(parts), False)
+
+    return _event_stream_response(events())
+
+
+def _event_stream_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type=EVENT_STREAM)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase
+from api.hnsw import HNSWIndex
+from api.local_vector_store import LocalVectorStore
+
+DIMENSION = 16
+
+
+class HNSWIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(400, DIMENSION)).astype(np.float32)
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.queries = rng.normal(size=(10, DIMENSION)).astype(np.float32)
+        self.index = HNSWIndex(DIMENSION, m=8, ef_construction=64, ef_search=32, seed=0)
+        for label, vector in enumerate(self.vectors):
+            self.index.add(f"v{label}", vector)
+
+    def exact(self, query, k, exclude=()):
+        """Exact top-k labels by cosine similarity"""
+        query = query / np.linalg.norm(query)
+        order = np.argsort(-(self.vectors @ query))
+        return [f"v{i}" for i in order if f"v{i}" not in exclude][:k]
+
+    def search_all(self, index, **kwargs):
+        return [index.search(query, 10, **kwargs) for query in self.queries]
+
+    def test_exhaustive_search_is_exact(self):
+        # With ef at least the index size every reachable node is scored
+        for query, found in zip(self.queries, self.search_all(self.index, ef=len(self.vectors))):
+            self.assertEqual([label for label, _ in found], self.exact(query, 10))
+
+    def test_save_and_load_return_same_results(self):
+        self.index.delete('v3')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hnsw.pkl')
+            self.index.save(path, extra={'versions': {1: 2}})
+            loaded, extra = HNSWIndex.load(path)
+
+        self.assertEqual(extra, {'versions': {1: 2}})
+        self.assertEqual(len(loaded), len(self.index))
+        self.assertNotIn('v3', loaded)
+        self.assertEqual(self.search_all(loaded), self.search_all(self.index))
+
+        # The loaded graph keeps accepting inserts
+        loaded.add('new', self.queries[0])
+        self.assertEqual(loaded.search(self.queries[0], 1)[0][0], 'new')
+
+    def test_deleted_labels_are_never_returned(self):
+        deleted = {f"v{i}" for i in range(0, 400, 3)}
+        for label in deleted:
+            self.assertTrue(self.index.delete(label))
+        self.assertFalse(self.index.delete('v0'))
+        self.assertEqual(len(self.index), 400 - len(deleted))
+        self.assertAlmostEqual(self.index.tombstone_ratio, len(deleted) / 400)
+
+        for query, found in zip(self.queries, self.search_all(self.index, ef=len(self.vectors))):
+            labels = [label for label, _ in found]
+            self.assertFalse(deleted & set(labels))
+            self.assertEqual(labels, self.exact(query, 10, exclude=deleted))
+
+        self.index.compact()
+        self.assertEqual(self.index.tombstone_ratio, 0.0)
+        for query, found in zip(self.queries, self.search_all(self.index, ef=len(self.vectors))):
+            self.assertEqual([label for label, _ in found], self.exact(query, 10, exclude=deleted))
+
+    def test_readding_a_label_replaces_its_vector(self):
+        self.index.add('v5', self.queries[0])
+        self.assertEqual(len(self.index), 400)
+        label, similarity = self.index.search(self.queries[0], 1)[0]
+        self.assertEqual(label, 'v5')
+        self.assertAlmostEqual(similarity, 1.0, places=5)
+        self.assertNotIn('v5', [label for label, _ in self.index.search(self.vectors[5], 10, ef=400)])
+
+    def test_accept_filters_labels(self):
+        accept = lambda label: int(label[1:]) % 2 == 0
+        for found in self.search_all(self.index, ef=len(self.vectors), accept=accept):
+            self.assertEqual(len(found), 10)
+            self.assertTrue(all(accept(label) for label, _ in found))
+
+
+class LocalVectorStoreHNSWTests(SimpleTestCase):
+    """Namespaces past hnsw_min_vectors answer from the graph, kept in sync with the log"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        rng = np.random.default_rng(1)
+        self.vectors = [{'id': f"v{i}", 'values': rng.normal(size=DIMENSION).tolist(), 'metadata': {'n': i}}
+                        for i in range(300)]
+        self.queries = rng.normal(size=(5, DIMENSION)).tolist()
+
+    def open_store(self, hnsw_min_vectors=100):
+        # ef_search above the namespace size makes graph search exhaustive, hence comparable
+        return LocalVectorStore(self.directory.name, DIMENSION, namespace='',
+                                hnsw_min_vectors=hnsw_min_vectors, hnsw_m=8, hnsw_ef_search=400)
+
+    def sync_graph(self, store):
+        """Run the background graph maintenance in the calling thread"""
+        namespace = store._get_namespace('')
+        with namespace.lock:
+            namespace.refresh()
+        namespace._hnsw_work(namespace._generation)
+        return namespace
+
+    def results(self, store):
+        return [[(m.id, round(m.score, 5)) for m in store.query_vectors(query, top_k=8)] for query in self.queries]
+
+    def test_graph_matches_exact_scan_after_delete_save_and_load(self):
+        store = self.open_store()
+        store.upsert_vectors(self.vectors)
+        namespace = self.sync_graph(store)
+        self.assertIsNotNone(namespace.hnsw)
+        self.assertTrue(os.path.exists(namespace.hnsw_path))
+
+        store.delete_vectors([f"v{i}" for i in range(0, 300, 4)])
+        store.upsert_vectors([{'id': 'v1', 'values': self.queries[0], 'metadata': {'n': 'moved'}}])
+        exact = self.results(self.open_store(hnsw_min_vectors=0))
+        self.assertEqual(exact[0][0][0], 'v1')
+        # Changed rows not yet in the graph are scored exactly
+        self.assertEqual(self.results(store), exact)
+
+        self.sync_graph(store)
+        self.assertFalse(namespace.dirty_rows)
+        self.assertEqual(self.results(store), exact)
+
+        # A new process loads the saved graph instead of rebuilding it
+        reloaded = self.open_store()
+        reloaded_namespace = reloaded._get_namespace('')
+        with reloaded_namespace.lock:
+            reloaded_namespace.refresh()
+        index, versions = reloaded_namespace._load_hnsw()
+        self.assertIsNotNone(index)
+        self.assertEqual(versions, namespace.hnsw_versions)
+        self.sync_graph(reloaded)
+        self.assertEqual(len(reloaded_namespace.hnsw), 300 - 75)
+        self.assertEqual(self.results(reloaded), exact)
@@ -0,0 +1,105 @@
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase
+from api.local_vector_store import LocalVectorStore
+
+DIMENSION = 8
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class LocalVectorStoreLogTests(SimpleTestCase):
+    """The append-only log is replayed into the same state by any reader"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.rng = np.random.default_rng(0)
+
+    def open_store(self):
+        return LocalVectorStore(self.directory.name, DIMENSION, namespace='')
+
+    def vector(self, vector_id, metadata=None):
+        return {'id': vector_id, 'values': unit(self.rng.normal(size=DIMENSION)), 'metadata': metadata or {}}
+
+    def test_replay_after_delete_and_overwrite(self):
+        store = self.open_store()
+        vectors = [self.vector(f"v{i}", {'n': i}) for i in range(5)]
+        store.upsert_vectors(vectors)
+        # A reader that loaded the namespace before the changes below
+        reader = self.open_store()
+        self.assertEqual(len(reader.fetch_vectors([v['id'] for v in vectors])), 5)
+
+        self.assertTrue(store.delete_vectors(['v1', 'v3']))
+        overwrite = self.vector('v0', {'n': 'new'})
+        store.upsert_vectors([overwrite])
+
+        for replayed in (reader, self.open_store()):
+            fetched = replayed.fetch_vectors([f"v{i}" for i in range(5)])
+            self.assertEqual(sorted(fetched), ['v0', 'v2', 'v4'])
+            self.assertEqual(fetched['v0']['metadata'], {'n': 'new'})
+            np.testing.assert_allclose(fetched['v0']['values'], overwrite['values'], atol=1e-6)
+            np.testing.assert_allclose(fetched['v2']['values'], vectors[2]['values'], atol=1e-6)
+
+            matches = replayed.query_vectors(overwrite['values'], top_k=5)
+            self.assertEqual(len(matches), 3)
+            self.assertEqual(matches[0].id, 'v0')
+            self.assertAlmostEqual(matches[0].score, 1.0, places=5)
+            self.assertEqual(replayed.get_index_stats()['total_vector_count'], 3)
+
+    def test_deleted_rows_are_reused(self):
+        store = self.open_store()
+        store.upsert_vectors([self.vector(f"v{i}") for i in range(3)])
+        namespace = store._get_namespace('')
+        deleted_row = namespace.rows['v1']
+        store.delete_vectors(['v1'])
+        store.upsert_vectors([self.vector('v3')])
+
+        self.assertEqual(namespace.rows['v3'], deleted_row)
+        self.assertEqual(namespace.row_count, 3)
+        replayed = self.open_store()._get_namespace('')
+        replayed.refresh()
+        self.assertEqual(replayed.rows, namespace.rows)
+
+    def test_compaction_preserves_ids_and_metadata(self):
+        store = self.open_store()
+        vectors = [self.vector(f"v{i}", {'n': i, 'user_id': f"u{i % 3}"}) for i in range(40)]
+        store.upsert_vectors(vectors)
+        store.delete_vectors([f"v{i}" for i in range(0, 40, 2)])
+        kept_ids = [f"v{i}" for i in range(1, 40, 2)]
+        before = store.fetch_vectors(kept_ids)
+        query = vectors[7]['values']
+        matches_before = store.query_vectors(query, top_k=5, filter={'user_id': 'u1'})
+
+        namespace = store._get_namespace('')
+        with namespace.write_lock():
+            namespace.compact()
+
+        self.assertEqual(namespace.row_count, len(kept_ids))
+        self.assertFalse(namespace.free_rows)
+        for compacted in (store, self.open_store()):
+            after = compacted.fetch_vectors(kept_ids)
+            self.assertEqual(sorted(after), sorted(kept_ids))
+            for vector_id in kept_ids:
+                self.assertEqual(after[vector_id]['metadata'], before[vector_id]['metadata'])
+                np.testing.assert_allclose(after[vector_id]['values'], before[vector_id]['values'], atol=1e-6)
+            matches_after = compacted.query_vectors(query, top_k=5, filter={'user_id': 'u1'})
+            self.assertEqual([m.id for m in matches_after], [m.id for m in matches_before])
+
+    def test_delete_compacts_mostly_free_namespaces(self):
+        store = self.open_store()
+        store.upsert_vectors([self.vector(f"v{i}", {'n': i}) for i in range(1100)])
+        reader = self.open_store()
+        reader.fetch_vectors(['v0'])
+
+        store.delete_vectors([f"v{i}" for i in range(1000)])
+
+        namespace = store._get_namespace('')
+        self.assertEqual(namespace.row_count, 100)
+        # Another process notices the rewritten log and reloads
+        fetched = reader.fetch_vectors([f"v{i}" for i in range(1100)])
+        self.assertEqual(sorted(fetched), sorted(f"v{i}" for i in range(1000, 1100)))
+        self.assertEqual(fetched['v1050']['metadata'], {'n': 1050})
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase
+from api.local_vector_store import LocalVectorStore
+from api.quantization import ProductQuantizer, ScalarQuantizer, make_quantizer
+
+DIMENSION = 16
+
+
+def unit_vectors(rng, count):
+    vectors = rng.normal(size=(count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class QuantizerTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = unit_vectors(rng, 600)
+        self.query = unit_vectors(rng, 1)[0]
+
+    def test_int8_scores_approximate_dot_products(self):
+        quantizer = ScalarQuantizer(DIMENSION)
+        quantizer.set(np.arange(600), self.vectors)
+        exact = self.vectors @ self.query
+        np.testing.assert_allclose(quantizer.scores(self.query)[:600], exact, atol=0.02)
+        rows = np.array([5, 17, 300])
+        np.testing.assert_allclose(quantizer.scores(self.query, rows), exact[rows], atol=0.02)
+
+    def test_pq_codebooks_round_trip(self):
+        quantizer = ProductQuantizer(DIMENSION, subspaces=4)
+        quantizer.train(self.vectors)
+        quantizer.set(np.arange(600), self.vectors)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pq_codebooks.npy')
+            quantizer.save_codebooks(path)
+            loaded = ProductQuantizer(DIMENSION, subspaces=4)
+            self.assertTrue(loaded.load_codebooks(path))
+            # Codebooks trained for another subspace count are ignored
+            self.assertFalse(ProductQuantizer(DIMENSION, subspaces=8).load_codebooks(path))
+        loaded.set(np.arange(600), self.vectors)
+        np.testing.assert_array_equal(loaded.scores(self.query), quantizer.scores(self.query))
+
+    def test_bad_settings_fail_fast(self):
+        self.assertIsNone(make_quantizer('none', DIMENSION))
+        with self.assertRaises(ValueError):
+            make_quantizer('pq', DIMENSION, pq_subspaces=5)
+        with self.assertRaises(ValueError):
+            make_quantizer('int4', DIMENSION)
+
+
+class QuantizedSearchTests(SimpleTestCase):
+    """Compact-code scans re-ranked in float32 return the exact top-k"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        rng = np.random.default_rng(1)
+        self.vectors = [
+            {'id': f"v{i}", 'values': vector.tolist(), 'metadata': {'user_id': f"u{i % 2}"}}
+            for i, vector in enumerate(unit_vectors(rng, 600))
+        ]
+        self.queries = unit_vectors(rng, 20).tolist()
+        exact_store = LocalVectorStore(os.path.join(self.directory.name, 'exact'), DIMENSION, namespace='')
+        exact_store.upsert_vectors(self.vectors)
+        self.exact_store = exact_store
+
+    def quantized_store(self, method):
+        store = LocalVectorStore(os.path.join(self.directory.name, method), DIMENSION, namespace='',
+                                 quantization=method, pq_subspaces=4, rerank_factor=10, pq_train_min=500)
+        store.upsert_vectors(self.vectors)
+        return store
+
+    def assert_same_results(self, store, **kwargs):
+        for query in self.queries:
+            expected = self.exact_store.query_vectors(query, top_k=5, **kwargs)
+            found = store.query_vectors(query, top_k=5, **kwargs)
+            self.assertEqual([m.id for m in found], [m.id for m in expected])
+            # Scores come from the float32 re-rank, not the codes
+            np.testing.assert_allclose([m.score for m in found], [m.score for m in expected], rtol=1e-6)
+
+    def test_int8_scan_returns_exact_top_k(self):
+        store = self.quantized_store('int8')
+        self.assert_same_results(store)
+        self.assert_same_results(store, filter={'user_id': 'u1'})
+        namespace = store._get_namespace('')
+        self.assertIsNotNone(namespace.quantized_top_k(np.asarray(self.queries[0], np.float32), 5))
+
+    def test_pq_scan_returns_exact_top_k(self):
+        store = self.quantized_store('pq')
+        self.assert_same_results(store)
+        self.assert_same_results(store, filter={'user_id': 'u0'})
+        namespace = store._get_namespace('')
+        self.assertTrue(namespace.quantizer.trained)
+        self.assertTrue(os.path.exists(namespace.codebooks_path))
+
+    def test_pq_waits_for_enough_vectors_to_train(self):
+        store = LocalVectorStore(os.path.join(self.directory.name, 'small'), DIMENSION, namespace='',
+                                 quantization='pq', pq_subspaces=4, pq_train_min=1000)
+        store.upsert_vectors(self.vectors)
+        self.assert_same_results(store)
+        self.assertFalse(store._get_namespace('').quantizer.trained)
+
+    def test_codes_follow_overwrites_and_deletes(self):
+        store = self.quantized_store('int8')
+        store.upsert_vectors([{'id': 'v0', 'values': self.queries[0], 'metadata': {}}])
+        store.delete_vectors(['v1', 'v2'])
+        self.exact_store.upsert_vectors([{'id': 'v0', 'values': self.queries[0], 'metadata': {}}])
+        self.exact_store.delete_vectors(['v1', 'v2'])
+        self.assertEqual(store.query_vectors(self.queries[0], top_k=1)[0].id, 'v0')
+        self.assert_same_results(store)
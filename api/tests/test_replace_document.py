@@ -0,0 +1,144 @@
+import tempfile
+import zlib
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import lexical_index
+from api.document_processor import DocumentAlreadyIngested, DocumentProcessor
+from api.ingestion_queue import requeue_stale_documents
+from api.local_vector_store import LocalVectorStore
+from api.models import DocumentChunk, UserDocument
+from api.text_chunker import ChunkSpan
+
+DIMENSION = 8
+USER_ID = 'user-1'
+
+
+def fake_embedding(text):
+    """Deterministic per-text vector, so kept and re-added chunks are comparable"""
+    return np.random.default_rng(zlib.crc32(text.encode('utf-8'))).normal(size=DIMENSION).tolist()
+
+
+def chunk_list(texts):
+    """(span, text) pairs laid out back to back, as iter_text_chunks yields them"""
+    chunks, offset = [], 0
+    for text in texts:
+        chunks.append((ChunkSpan(offset, offset + len(text), len(text.split())), text))
+        offset += len(text) + 1
+    return chunks
+
+
+class ReplaceDocumentTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name, EMBEDDING_CACHE_ENABLED=False,
+                                              CHUNK_CACHE_ENTRIES=0, PINECONE_USER_NAMESPACES=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.store = LocalVectorStore(f"{directory.name}/vectors", DIMENSION, namespace='')
+        with mock.patch('api.document_processor.get_vector_store', return_value=self.store):
+            self.processor = DocumentProcessor()
+        self.processor.generate_embeddings = lambda texts, use_cache=True: [fake_embedding(t) for t in texts]
+        self.processor._rebuild_medical_profile = lambda user_id: None
+        self.namespace = self.processor.vector_namespace(USER_ID)
+
+    def ingest(self, texts):
+        """A completed document with one chunk and vector per text"""
+        document = UserDocument.objects.create(user_id=USER_ID, document_name='labs.pdf',
+                                               content_hash='original', processing_status='completed')
+        vectors, records = [], []
+        for index, (span, text) in enumerate(chunk_list(texts)):
+            vector, record = self.processor.build_chunk_vector(document, index, text, fake_embedding(text), span)
+            vectors.append(vector)
+            records.append(record)
+        self.store.upsert_vectors(vectors, namespace=self.namespace)
+        lexical_index.bulk_create_chunks(records)
+        document.extracted_text = "\n".join(texts)
+        document.vector_ids = [vector['id'] for vector in vectors]
+        document.save()
+        return document
+
+    def replace(self, document, texts):
+        self.processor.iter_pdf_pages = lambda pdf_file: ["\n".join(texts)]
+        self.processor.iter_text_chunks = lambda pages: chunk_list(texts)
+        upload = SimpleUploadedFile('labs-v2.pdf', "\n".join(texts).encode('utf-8'))
+        return self.processor.replace_document(USER_ID, str(document.id), upload)
+
+    def test_reordered_duplicated_and_removed_chunks(self):
+        old_texts = ['alpha', 'beta', 'alpha', 'gamma', 'delta']
+        document = self.ingest(old_texts)
+        old_ids = list(document.vector_ids)
+
+        new_texts = ['gamma', 'alpha', 'beta', 'epsilon', 'alpha', 'alpha']
+        document, stats = self.replace(document, new_texts)
+
+        # gamma, beta and both old alphas are kept; epsilon and a third alpha are new; delta is gone
+        self.assertEqual(stats, {'kept': 4, 'added': 2, 'removed': 1})
+        rows = list(DocumentChunk.objects.filter(document=document).order_by('chunk_index'))
+        self.assertEqual([row.chunk_index for row in rows], list(range(6)))
+        self.assertEqual([row.text_content for row in rows], new_texts)
+        self.assertEqual(document.vector_ids, [row.vector_id for row in rows])
+        self.assertEqual(document.revision, 1)
+        self.assertEqual(UserDocument.objects.get(id=document.id).processing_status, 'completed')
+
+        # Kept chunks keep their vectors, matched in order of their old position
+        self.assertEqual(rows[0].vector_id, old_ids[3])
+        self.assertEqual(rows[1].vector_id, old_ids[0])
+        self.assertEqual(rows[2].vector_id, old_ids[1])
+        self.assertEqual(rows[4].vector_id, old_ids[2])
+        for row in (rows[3], rows[5]):
+            self.assertNotIn(row.vector_id, old_ids)
+            self.assertIn('_r1_', row.vector_id)
+        for row, (span, _) in zip(rows, chunk_list(new_texts)):
+            self.assertEqual((row.start_offset, row.end_offset), (span.start, span.end))
+
+        # Only the removed chunk's vector was deleted
+        stored = self.store.fetch_vectors(old_ids + document.vector_ids, namespace=self.namespace)
+        self.assertEqual(sorted(stored), sorted(document.vector_ids))
+        self.assertNotIn(old_ids[4], stored)
+        self.assertEqual(stored[rows[5].vector_id]['metadata']['chunk_index'], 5)
+
+    def test_same_file_changes_nothing(self):
+        document = self.ingest(['alpha', 'beta'])
+        self.replace(document, ['gamma'])
+        document.refresh_from_db()
+        vector_ids = list(document.vector_ids)
+
+        document, stats = self.replace(document, ['gamma'])
+        self.assertEqual(stats, {'kept': 1, 'added': 0, 'removed': 0})
+        self.assertEqual(document.vector_ids, vector_ids)
+        self.assertEqual(document.revision, 1)
+
+    def test_failed_replace_keeps_previous_revision(self):
+        document = self.ingest(['alpha', 'beta'])
+        old_ids = list(document.vector_ids)
+        with mock.patch.object(self.store, 'upsert_vectors', return_value=[{'success': False}]):
+            with self.assertRaises(Exception):
+                self.replace(document, ['alpha', 'gamma'])
+
+        document.refresh_from_db()
+        self.assertEqual(document.processing_status, 'completed')
+        self.assertEqual(document.vector_ids, old_ids)
+        self.assertEqual(list(document.chunks.order_by('chunk_index').values_list('text_content', flat=True)),
+                         ['alpha', 'beta'])
+
+    def test_stale_replace_is_restored_not_requeued(self):
+        document = self.ingest(['alpha'])
+        UserDocument.objects.filter(id=document.id).update(
+            processing_status='replacing', processing_started_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(requeue_stale_documents(), 0)
+        self.assertEqual(UserDocument.objects.get(id=document.id).processing_status, 'completed')
+
+    def test_process_document_refuses_ingested_documents(self):
+        document = self.ingest(['alpha', 'beta'])
+        with self.assertRaises(DocumentAlreadyIngested):
+            self.processor.process_document(USER_ID, None, 'labs.pdf', document=document)
+        self.assertEqual(document.chunks.count(), 2)
+        self.assertEqual(len(self.store.fetch_vectors(document.vector_ids, namespace=self.namespace)), 2)
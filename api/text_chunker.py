@@ -0,0 +1,243 @@
+import re
+from collections import namedtuple
+from typing import List, Iterable, Iterator, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A sentence or paragraph piece of the text; offsets are absolute
+Segment = namedtuple('Segment', ['start', 'end', 'tokens', 'paragraph_end'])
+
+# A chunk as a span of the source text: text[start:end] is the chunk content
+ChunkSpan = namedtuple('ChunkSpan', ['start', 'end', 'token_count'])
+
+# Sentence ends (followed by whitespace) and paragraph breaks
+_BOUNDARY_RE = re.compile(r'\n[ \t]*\n\s*|(?<=[.!?])\s+')
+_SPACE_RE = re.compile(r'\s+')
+_APPROX_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+TOKEN_ENCODINGS = ('cl100k_base', 'o200k_base')  # Embedding models, gpt-4o
+
+_encodings = {}  # Encoding name -> tiktoken encoding, or None if it couldn't be loaded
+
+
+def _get_encoding(name: str = 'cl100k_base'):
+    """A tiktoken encoding if tiktoken is installed and the encoding loadable, else None"""
+    if name not in _encodings:
+        _encodings[name] = None
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            logger.warning(f"tiktoken {name} unavailable, using approximate token counts "
+                           f"(run manage.py fetch_tiktoken_encodings): {str(e)}")
+    return _encodings[name]
+
+
+def count_tokens(text: str, encoding_name: str = 'cl100k_base') -> int:
+    """Token count under a model encoding (cl100k_base: embeddings; o200k_base: gpt-4o)
+
+    Uses tiktoken when available; otherwise approximates by counting words and
+    punctuation, charging long words one extra token per four characters.
+    """
+    encoding = _get_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 + (len(word) - 1) // 4 for word in _APPROX_TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = 'cl100k_base') -> str:
+    """The longest prefix of ``text`` within ``max_tokens``, cut at a word boundary"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(encoding_name)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = encoding.decode(tokens[:max_tokens])
+        # Drop a partial trailing word
+        cut = prefix.rfind(' ')
+        return prefix[:cut] if cut > 0 else prefix
+
+    used = 0
+    end = 0
+    for match in _APPROX_TOKEN_RE.finditer(text):
+        used += 1 + (len(match.group()) - 1) // 4
+        if used > max_tokens:
+            return text[:end]
+        end = match.end()
+    return text
+
+
+class _TextWindow:
+    """The not-yet-discarded suffix of a streamed text, addressed by absolute offsets"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.base = 0  # Absolute offset of buffer[0]
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self.buffer)
+
+    def append(self, piece: str) -> None:
+        self.buffer += piece
+
+    def slice(self, start: int, end: int) -> str:
+        return self.buffer[start - self.base:end - self.base]
+
+    def discard_before(self, offset: int) -> None:
+        # Compact lazily so a single huge piece is not copied once per chunk
+        drop = offset - self.base
+        if drop > 0 and drop * 2 >= len(self.buffer):
+            self.buffer = self.buffer[drop:]
+            self.base = offset
+
+
+class TextChunker:
+    """Single-pass, token-budgeted text chunker
+
+    Sentence and paragraph boundaries are found once with one regex scan and
+    each sentence is token-counted once. Sentences are then packed greedily
+    into chunks of at most ``max_tokens``, cutting at the last paragraph
+    break if that still fills ``min_fill`` of the budget. The trailing
+    sentences of each chunk (up to ``overlap_tokens``) are carried into the
+    next one without being re-scanned, so total work is linear in the text.
+    """
+
+    def __init__(self, max_tokens: int = 250, overlap_tokens: int = 50, min_fill: float = 0.7):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+        # A boundary-free run longer than this is split on words before it is complete
+        self._max_pending_chars = max_tokens * 16
+
+    def split(self, text: str) -> List[ChunkSpan]:
+        """Chunk spans for ``text``"""
+        return [span for span, _ in self.iter_chunks([text])]
+
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[Tuple[ChunkSpan, str]]:
+        """Chunk a text that arrives in pieces (e.g. PDF pages)
+
+        Offsets are into ``"".join(pieces)``. Only the text of the chunk being
+        built is retained, so memory does not grow with the document.
+        """
+        window = _TextWindow()
+        segments = []          # Segments of the chunk being built
+        tokens = 0
+        carried = 0            # Leading segments already emitted (overlap)
+
+        for segment in self._iter_segments(pieces, window):
+            while segments and tokens + segment.tokens > self.max_tokens:
+                if len(segments) == carried:
+                    # Only overlap left and it doesn't fit with the next sentence
+                    segments, tokens, carried = [], 0, 0
+                    break
+                cut = self._choose_cut(segments, carried)
+                chunk = self._make_chunk(window, segments[:cut])
+                if chunk:
+                    yield chunk
+                overlap = self._overlap(segments, cut)
+                segments = overlap + segments[cut:]
+                tokens = sum(s.tokens for s in segments)
+                carried = len(overlap)
+                window.discard_before(segments[0].start if segments else segment.start)
+
+            segments.append(segment)
+            tokens += segment.tokens
+
+        if len(segments) > carried:
+            chunk = self._make_chunk(window, segments)
+            if chunk:
+                yield chunk
+
+    def _choose_cut(self, segments: List[Segment], carried: int) -> int:
+        """Number of segments to emit: up to the last paragraph break if it fills enough"""
+        min_tokens = self.max_tokens * self.min_fill
+        total = sum(s.tokens for s in segments)
+        for i in range(len(segments) - 1, carried, -1):
+            total -= segments[i].tokens
+            if total < min_tokens:
+                break
+            if segments[i - 1].paragraph_end:
+                return i
+        return len(segments)
+
+    def _overlap(self, segments: List[Segment], cut: int) -> List[Segment]:
+        """Trailing emitted segments to repeat at the start of the next chunk
+
+        Never includes the first segment, so every chunk starts further on.
+        """
+        overlap_tokens = 0
+        first = cut
+        while first > 1 and overlap_tokens + segments[first - 1].tokens <= self.overlap_tokens:
+            first -= 1
+            overlap_tokens += segments[first].tokens
+        return segments[first:cut]
+
+    def _make_chunk(self, window: _TextWindow, segments: List[Segment]):
+        start, end = segments[0].start, segments[-1].end
+        text = window.slice(start, end)
+        stripped = text.strip()
+        if not stripped:
+            return None
+        start += len(text) - len(text.lstrip())
+        end = start + len(stripped)
+        return ChunkSpan(start, end, sum(s.tokens for s in segments)), stripped
+
+    def _iter_segments(self, pieces: Iterable[str], window: _TextWindow) -> Iterator[Segment]:
+        """Split the streamed text into sentence segments, each scanned once"""
+        position = 0  # Absolute offset where the next segment starts
+        for piece in pieces:
+            window.append(piece)
+            position = yield from self._scan(window, position, final=False)
+        yield from self._scan(window, position, final=True)
+
+    def _scan(self, window: _TextWindow, position: int, final: bool):
+        buffer, base = window.buffer, window.base
+        for match in _BOUNDARY_RE.finditer(buffer, position - base):
+            if not final and match.end() == len(buffer):
+                # The boundary may continue in the next piece
+                break
+            paragraph_end = match.group().count('\n') >= 2
+            yield from self._segment(window, position, base + match.end(), paragraph_end)
+            position = base + match.end()
+
+        pending = window.end - position
+        if pending and (final or pending > self._max_pending_chars):
+            # End of text, or a run without sentence boundaries: cut it on words
+            yield from self._segment(window, position, window.end, False)
+            position = window.end
+        return position
+
+    def _segment(self, window: _TextWindow, start: int, end: int, paragraph_end: bool) -> Iterator[Segment]:
+        text = window.slice(start, end)
+        tokens = count_tokens(text)
+        if tokens <= self.max_tokens:
+            yield Segment(start, end, tokens, paragraph_end)
+            return
+
+        # A single sentence over budget: cut it into near-equal pieces at whitespace
+        # and count each piece once (re-splitting the rare piece that is still too big)
+        pieces = -(-tokens // int(self.max_tokens * 0.9))
+        step = len(text) / pieces
+        cuts = []
+        for k in range(1, pieces):
+            match = _SPACE_RE.search(text, int(k * step))
+            if match is None:
+                break
+            if match.end() < len(text) and (not cuts or match.end() > cuts[-1]):
+                cuts.append(match.end())
+        if not cuts:
+            # No whitespace to cut at (e.g. one enormous token); keep it whole
+            yield Segment(start, end, tokens, paragraph_end)
+            return
+
+        bounds = [0] + cuts + [len(text)]
+        for i in range(len(bounds) - 1):
+            piece_start, piece_end = start + bounds[i], start + bounds[i + 1]
+            last = i == len(bounds) - 2
+            yield from self._segment(window, piece_start, piece_end, paragraph_end and last)
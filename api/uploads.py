@@ -0,0 +1,35 @@
+import hashlib
+import os
+import uuid
+from typing import Tuple
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+
+class _HashingFile(File):
+    """File wrapper that hashes and measures the content as storage reads it"""
+
+    def __init__(self, file):
+        super().__init__(file, name=getattr(file, 'name', None))
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size) if hasattr(self.file, 'chunks') else super().chunks(chunk_size):
+            self.sha256.update(chunk)
+            self.bytes_read += len(chunk)
+            yield chunk
+
+
+def store_upload(user_id: str, uploaded_file, document_name: str) -> Tuple[str, str, int]:
+    """Stream an upload into default storage, hashing it on the way
+
+    Returns (storage path, SHA-256 hex digest, size in bytes).
+    """
+    extension = os.path.splitext(document_name)[1].lower() or '.pdf'
+    content = _HashingFile(uploaded_file)
+    storage_path = default_storage.save(
+        f"uploads/{user_id}/{uuid.uuid4().hex}{extension}",
+        content
+    )
+    return storage_path, content.sha256.hexdigest(), content.bytes_read
@@ -1,10 +1,19 @@
 from django.urls import path
-from .enhanced_views import EnhancedChatView, DocumentManagementView, ChatHistoryView
+from .enhanced_views import EnhancedChatView, DocumentManagementView, DocumentStatusView, ChatHistoryView
+from .async_views import AsyncChatView, AsyncDocumentManagementView, AsyncDocumentStatusView, AsyncChatHistoryView
 
 urlpatterns = [
     # Enhanced authenticated endpoints (main functionality)
     path('chat/', EnhancedChatView.as_view(), name='enhanced_chat'),
     path('documents/', DocumentManagementView.as_view(), name='documents'),
     path('documents/<str:document_id>/', DocumentManagementView.as_view(), name='document_detail'),
+    path('documents/<str:document_id>/status/', DocumentStatusView.as_view(), name='document_status'),
     path('chat-history/', ChatHistoryView.as_view(), name='chat_history'),
-] 
\ No newline at end of file
+
+    # Async variants of the same endpoints, for ASGI deployments
+    path('async/chat/', AsyncChatView.as_view(), name='async_chat'),
+    path('async/documents/', AsyncDocumentManagementView.as_view(), name='async_documents'),
+    path('async/documents/<str:document_id>/', AsyncDocumentManagementView.as_view(), name='async_document_detail'),
+    path('async/documents/<str:document_id>/status/', AsyncDocumentStatusView.as_view(), name='async_document_status'),
+    path('async/chat-history/', AsyncChatHistoryView.as_view(), name='async_chat_history'),
+]
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def get_vector_store():
+    """The configured vector store backend (VECTOR_STORE_BACKEND)
+
+    Both backends expose the PineconeManager interface: upsert_vectors,
+    query_vectors (and aquery_vectors for async views), delete_vectors,
+    delete_by_prefix, delete_namespace, fetch_vectors and get_index_stats.
+    """
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == 'pinecone':
+        from .pinecone_utils import get_pinecone_manager
+        return get_pinecone_manager()
+    if backend == 'local':
+        from .local_vector_store import get_local_vector_store
+        return get_local_vector_store()
+    raise ImproperlyConfigured(f"Unknown VECTOR_STORE_BACKEND: {backend}")
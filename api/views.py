@@ -1,5 +1,4 @@
 import openai
-import base64
 import PyPDF2
 import re
 from rest_framework.views import APIView
@@ -11,6 +10,7 @@ from decouple import config
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .pinecone_utils import get_pinecone_manager
+from .image_preprocessing import ImageRejected, ImagePreprocessingTimeout, prepare_image_upload, image_data_url
 
 
 openai.api_key = config('OPENAI_API_KEY')
@@ -147,8 +147,14 @@ class ChatView(APIView):
                 user_content.append({"type": "text", "text": user_message})
 
             if image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-                image_base64 = f"data:{image_file.content_type};base64,{image_data}"
+                try:
+                    image_base64 = image_data_url(prepare_image_upload(image_file))
+                except ImageRejected as e:
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                except ImagePreprocessingTimeout:
+                    return Response({
+                        'error': 'The image could not be processed in time; please try again'
+                    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
                 user_content.append({"type": "image_url", "image_url": {"url": image_base64}})
 
                 # If no text provided, add default image prompt
@@ -304,16 +310,18 @@ class VectorSearchView(APIView):
             manager.create_index_if_not_exists(dimension=1536, metric="cosine")
             
             # Store vectors
-            success = manager.upsert_vectors(vectors_data)
+            results = manager.upsert_vectors(vectors_data)
             
-            if success:
+            if manager.upsert_succeeded(results):
                 return Response({
                     'message': f'Successfully stored {len(vectors_data)} vectors',
                     'vectors_stored': len(vectors_data)
                 }, status=status.HTTP_200_OK)
             else:
                 return Response({
-                    'error': 'Failed to store vectors'
+                    'error': 'Failed to store vectors',
+                    'vectors_stored': sum(result['count'] for result in results if result['success']),
+                    'batches': results
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
                 
         except Exception as e:
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent chat turns on the sync view versus the async view.
+
+Runs N text chat requests against /api/chat/ (DRF view behind the WSGI
+handler, with a fixed number of worker threads like a gthread worker) and
+against /api/async/chat/ (async view behind the ASGI handler, one event
+loop). OpenAI is replaced by a local server that answers embeddings and
+completions after a fixed delay, so the numbers measure how many turns
+are in flight at once rather than model latency. Reports wall time,
+throughput, latency percentiles and the peak thread count.
+
+Uses a throwaway SQLite database and local vector store; Firebase token
+checks are bypassed (the bearer token is taken as the user ID).
+
+Usage: python benchmarks/bench_async_chat.py [--requests 200] [--threads 8]
+                                             [--completion-latency 0.5]
+                                             [--embedding-latency 0.1]
+"""
+
+import argparse
+import asyncio
+import base64
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='bench_async_chat_')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot_backend.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'bench')
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+os.environ['VECTOR_STORE_BACKEND'] = 'local'
+os.environ['LOCAL_VECTOR_STORE_PATH'] = os.path.join(WORKDIR, 'vectors')
+os.environ['EMBEDDING_CACHE_ENABLED'] = 'False'  # Every turn embeds its query
+os.environ['INGESTION_RUN_IN_PROCESS'] = 'False'
+
+import django
+from django.conf import settings
+
+django.setup()
+settings.DATABASES['default']['NAME'] = os.path.join(WORKDIR, 'db.sqlite3')
+
+import httpx
+import numpy as np
+import openai
+from aiohttp import web
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.test import Client
+
+from api import firebase_auth
+
+
+def serve_fake_openai(embedding_latency, completion_latency, dimension, connection):
+    """OpenAI-compatible server answering after fixed delays; sends its port over ``connection``"""
+    vector = np.full(dimension, 1.0 / dimension ** 0.5, dtype=np.float32)
+
+    async def embeddings(request):
+        body = await request.json()
+        await asyncio.sleep(embedding_latency)
+        # openai asks for base64 unless told otherwise, as the real API returns it
+        if body.get('encoding_format') == 'base64':
+            embedding = base64.b64encode(vector.tobytes()).decode('ascii')
+        else:
+            embedding = vector.tolist()
+        return web.json_response({'data': [
+            {'index': i, 'embedding': embedding} for i in range(len(body['input']))
+        ]})
+
+    async def completions(request):
+        await asyncio.sleep(completion_latency)
+        return web.json_response({'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'ok'}}]})
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post('/v1/embeddings', embeddings)
+        app.router.add_post('/v1/chat/completions', completions)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0, backlog=1024)
+        await site.start()
+        connection.send(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_fake_openai(embedding_latency, completion_latency, dimension):
+    """Run the fake OpenAI server in its own process (so it doesn't share our GIL); returns its base URL"""
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve_fake_openai, daemon=True,
+                                      args=(embedding_latency, completion_latency, dimension, child))
+    process.start()
+    return f"http://127.0.0.1:{parent.recv()}/v1"
+
+
+class ThreadSampler:
+    """Tracks the peak number of live threads while a run is going"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def report(name, latencies, failures, elapsed, peak_threads):
+    latencies = sorted(latencies)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0
+    print(f"{name:<28} {elapsed:7.2f}s  {len(latencies) / elapsed:7.1f} req/s  "
+          f"p50 {percentile(0.5):7.0f} ms  p95 {percentile(0.95):7.0f} ms  "
+          f"failed {failures}  peak threads {peak_threads}")
+
+
+def payload(i):
+    return {'message': f"What does my report say about vitamin D, question {i}?", 'retrieval_mode': 'hybrid'}
+
+
+def run_sync(requests, threads):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        started = time.perf_counter()
+        response = local.client.post('/api/chat/', payload(i), content_type='application/json',
+                                     HTTP_AUTHORIZATION=f"Bearer user{i % 20}")
+        return time.perf_counter() - started, response.status_code == 200
+
+    with ThreadSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+    report(f"sync view, {threads} threads", [latency for latency, ok in results if ok],
+           sum(1 for _, ok in results if not ok), elapsed, sampler.peak)
+
+
+async def run_async(requests, concurrency):
+    transport = httpx.ASGITransport(app=get_asgi_application())
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=300) as client:
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post('/api/async/chat/', json=payload(i),
+                                             headers={'Authorization': f"Bearer user{i % 20}"})
+                return time.perf_counter() - started, response.status_code == 200
+
+        with ThreadSampler() as sampler:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(one(i) for i in range(requests)))
+            elapsed = time.perf_counter() - started
+    report(f"async view, {concurrency} in flight", [latency for latency, ok in results if ok],
+           sum(1 for _, ok in results if not ok), elapsed, sampler.peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8, help='Worker threads for the sync view')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Requests in flight for the async view (default: all of them)')
+    parser.add_argument('--completion-latency', type=float, default=0.5)
+    parser.add_argument('--embedding-latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    firebase_auth.verify_firebase_token = lambda token: {'uid': token}
+    openai.api_base = start_fake_openai(args.embedding_latency, args.completion_latency,
+                                        settings.EMBEDDING_DIMENSION)
+
+    print(f"{args.requests} chat turns; upstream latency {args.embedding_latency}s embedding "
+          f"+ {args.completion_latency}s completion")
+    run_sync(args.requests, args.threads)
+    asyncio.run(run_async(args.requests, args.concurrency or args.requests))
+
+
+if __name__ == '__main__':
+    main()
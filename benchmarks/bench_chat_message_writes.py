@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Load test: ChatMessage inserts, one row per transaction versus the
+write-behind buffer.
+
+N threads each store M messages (as chat turns do) into a throwaway SQLite
+database configured like production (WAL, IMMEDIATE transactions), first
+with ChatMessage.objects.create and then with ChatMessageBuffer.add. The
+buffered run counts until the last message is on disk, so it includes the
+flush. Reports messages per second for both.
+
+Usage: python benchmarks/bench_chat_message_writes.py [--threads 8] [--messages 500]
+                                                      [--flush-interval 0.5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='bench_chat_messages_')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot_backend.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'bench')
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+
+import django
+from django.conf import settings
+
+django.setup()
+settings.DATABASES['default']['NAME'] = os.path.join(WORKDIR, 'db.sqlite3')
+
+from django.core.management import call_command
+from django.db import close_old_connections
+
+from api.message_buffer import ChatMessageBuffer
+from api.models import ChatMessage, UserChatSession
+
+
+def run(name, threads, messages, write, finish=lambda: None):
+    sessions = [UserChatSession.objects.create(session_id=f"{name}-{i}", user_id=f"user{i}")
+                for i in range(threads)]
+
+    def worker(session):
+        try:
+            for i in range(messages):
+                write(session=session, message_type='user' if i % 2 == 0 else 'assistant',
+                      content=f"Message {i} of a bench chat turn", metadata={'bench': True})
+        finally:
+            close_old_connections()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, sessions))
+    finish()
+    elapsed = time.perf_counter() - started
+    written = ChatMessage.objects.filter(session__in=sessions).count()
+    print(f"{name:<22} {written:7d} messages  {elapsed:7.2f}s  {written / elapsed:9.0f} msg/s")
+    return written / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=500, help='Messages per thread')
+    parser.add_argument('--flush-interval', type=float, default=settings.CHAT_MESSAGE_FLUSH_INTERVAL)
+    parser.add_argument('--batch-size', type=int, default=settings.CHAT_MESSAGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    print(f"{args.threads} threads x {args.messages} messages")
+    direct = run('objects.create', args.threads, args.messages, ChatMessage.objects.create)
+    buffer = ChatMessageBuffer(flush_interval=args.flush_interval, batch_size=args.batch_size)
+    buffered = run('write-behind buffer', args.threads, args.messages, buffer.add, buffer.stop)
+    print(f"speedup {buffered / direct:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: text chunking throughput on 1-50 MB texts.
+
+Compares the previous character-based chunker (rfind-based, kept here verbatim
+as a reference) with api.text_chunker.TextChunker and prints time per MB so
+linear scaling is easy to check.
+
+Usage: python benchmarks/bench_chunker.py [--sizes 1 5 10 25 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.text_chunker import TextChunker
+
+WORDS = [
+    'patient', 'glucose', 'fasting', 'HbA1c', 'mg/dL', 'mmol/L', 'metformin', '500mg',
+    'twice', 'daily', 'LDL', 'cholesterol', 'elevated', 'within', 'normal', 'range',
+    'the', 'of', 'and', 'was', 'is', 'blood', 'pressure', '128/84', 'recommend', 'diet',
+]
+
+
+def legacy_create_text_chunks(text, chunk_size=1000, chunk_overlap=200):
+    """The character-based chunker DocumentProcessor used before TextChunker"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            sentence_endings = ['.', '!', '?', '\n\n']
+            for ending in sentence_endings:
+                last_ending = text.rfind(ending, start, end)
+                if last_ending > start + chunk_size * 0.7:
+                    end = last_ending + 1
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end - chunk_overlap
+        if start >= len(text):
+            break
+    return chunks
+
+
+def make_text(size_bytes, seed=0):
+    """Report-like text: sentences, occasional paragraph breaks and long lines without punctuation"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 30)))
+        if rng.random() < 0.1:
+            sentence += ' ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(100, 400)))  # table-like run
+        sentence += rng.choice(['. ', '. ', '! ', '? ', '.\n\n'])
+        parts.append(sentence)
+        total += len(sentence)
+    return ''.join(parts)[:size_bytes]
+
+
+def bench(label, fn, text):
+    start = time.perf_counter()
+    result = fn(text)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 5, 10, 25, 50], help='Text sizes in MB')
+    args = parser.parse_args()
+
+    chunker = TextChunker(max_tokens=250, overlap_tokens=50)
+
+    print(f"{'size':>8} {'legacy s':>10} {'legacy s/MB':>12} {'chunks':>8} {'new s':>10} {'new s/MB':>10} {'chunks':>8}")
+    for size_mb in args.sizes:
+        text = make_text(int(size_mb * 1024 * 1024))
+        legacy_time, legacy_chunks = bench('legacy', legacy_create_text_chunks, text)
+        new_time, new_chunks = bench('new', chunker.split, text)
+        print(f"{size_mb:>6.0f}MB {legacy_time:>10.2f} {legacy_time / size_mb:>12.3f} {legacy_chunks:>8} "
+              f"{new_time:>10.2f} {new_time / size_mb:>10.3f} {new_chunks:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: HNSW recall and latency versus exact search.
+
+Builds api.hnsw.HNSWIndex over clustered random vectors (embeddings are
+clustered by topic, which uniform noise is not), then reports recall@k and
+mean query latency for several ef_search values next to an exact NumPy
+scan. Also times deleting 10% of the vectors and compacting.
+
+Usage: python benchmarks/bench_hnsw.py [--n 20000] [--dim 256] [--m 16]
+                                       [--ef-construction 100] [--ef 16 32 64 128 256]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.hnsw import HNSWIndex
+
+
+def make_vectors(n, dim, clusters=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(matrix, query, k):
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--m', type=int, default=16)
+    parser.add_argument('--ef-construction', type=int, default=100)
+    parser.add_argument('--ef', type=int, nargs='+', default=[16, 32, 64, 128, 256])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.n + args.queries, args.dim)
+    data, queries = vectors[:args.n], vectors[args.n:]
+
+    index = HNSWIndex(args.dim, m=args.m, ef_construction=args.ef_construction, seed=0)
+    started = time.perf_counter()
+    for i, vector in enumerate(data):
+        index.add(i, vector)
+    build = time.perf_counter() - started
+    print(f"Built HNSW over {args.n} x {args.dim} (M={args.m}, ef_construction={args.ef_construction}) "
+          f"in {build:.1f}s ({build / args.n * 1000:.2f} ms/insert)")
+
+    started = time.perf_counter()
+    truth = [exact_top_k(data, query, args.k) for query in queries]
+    exact_ms = (time.perf_counter() - started) / len(queries) * 1000
+    print(f"\n{'search':>12} {'recall@' + str(args.k):>10} {'ms/query':>10}")
+    print(f"{'exact':>12} {1.0:>10.3f} {exact_ms:>10.2f}")
+
+    for ef in args.ef:
+        started = time.perf_counter()
+        found = [index.search(query, args.k, ef=ef) for query in queries]
+        elapsed_ms = (time.perf_counter() - started) / len(queries) * 1000
+        recall = np.mean([
+            len({label for label, _ in result} & set(expected.tolist())) / args.k
+            for result, expected in zip(found, truth)
+        ])
+        print(f"{'ef=' + str(ef):>12} {recall:>10.3f} {elapsed_ms:>10.2f}")
+
+    # Tombstone 10% of the vectors, check recall on the rest, then compact
+    removed = set(range(0, args.n, 10))
+    for label in removed:
+        index.delete(label)
+    keep = np.array(sorted(set(range(args.n)) - removed))
+    truth = [keep[exact_top_k(data[keep], query, args.k)] for query in queries]
+    found = [index.search(query, args.k) for query in queries]
+    recall = np.mean([
+        len({label for label, _ in result} & set(expected.tolist())) / args.k
+        for result, expected in zip(found, truth)
+    ])
+    print(f"\nAfter deleting {len(removed)} vectors (tombstones): recall@{args.k} {recall:.3f} "
+          f"at ef={index.ef_search}")
+    started = time.perf_counter()
+    index.compact()
+    print(f"Compacted to {len(index)} vectors in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
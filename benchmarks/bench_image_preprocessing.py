@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: what image preprocessing does to vision-call payloads.
+
+For each sample image (synthetic 12 MP phone photos by default, or every
+JPEG/PNG in --images), compares sending the upload as-is (as the views did
+before) with sending it through prepare_image_upload: payload bytes (the
+base64 data URL sent to OpenAI), the time to upload that payload at --uplink-mbps, and the time
+spent preprocessing. Then runs all images through the worker pool to get
+throughput, and reports the peak Python heap of the request process for
+both paths (tracemalloc; decoded bitmaps live in the pool workers).
+
+Uploads are wrapped the way Django hands them to views: files over
+FILE_UPLOAD_MAX_MEMORY_SIZE as temporary files on disk.
+
+Usage: python benchmarks/bench_image_preprocessing.py [--images DIR] [--count 8]
+                                                      [--workers 2] [--uplink-mbps 10]
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot_backend.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'bench')
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+
+import django
+from django.conf import settings
+
+django.setup()
+
+import numpy as np
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+
+from api import image_preprocessing
+from api.image_preprocessing import ImagePreprocessingPool, image_data_url, prepare_image_upload
+
+
+def synthetic_photo(seed, size=(4032, 3024), quality=92):
+    """A phone-camera-like JPEG: smooth scene plus sensor noise, landscape or portrait"""
+    rng = np.random.RandomState(seed)
+    scene = Image.fromarray((rng.rand(24, 32, 3) * 255).astype(np.uint8)).resize(size, Image.BICUBIC)
+    pixels = np.asarray(scene, dtype=np.int16) + rng.normal(0, 6, (size[1], size[0], 3)).astype(np.int16)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    if seed % 2:
+        image = image.transpose(Image.Transpose.ROTATE_90)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def load_samples(directory, count):
+    if not directory:
+        return [(f"synthetic-{i}.jpg", 'image/jpeg', synthetic_photo(i)) for i in range(count)]
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        extension = os.path.splitext(name)[1].lower()
+        if extension in ('.jpg', '.jpeg', '.png'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                content_type = 'image/png' if extension == '.png' else 'image/jpeg'
+                samples.append((name, content_type, f.read()))
+    return samples
+
+
+def uploaded_file(name, content_type, data):
+    """The upload as Django's default upload handlers would pass it to the view"""
+    if len(data) <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return SimpleUploadedFile(name, data, content_type=content_type)
+    upload = TemporaryUploadedFile(name, content_type, len(data), None)
+    upload.write(data)
+    upload.seek(0)
+    return upload
+
+
+def original_data_url(upload):
+    """What the views sent before preprocessing"""
+    upload.seek(0)
+    image_data = base64.b64encode(upload.read()).decode("utf-8")
+    return f"data:{upload.content_type};base64,{image_data}"
+
+
+def peak_heap(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='Directory of sample JPEG/PNG images (default: synthetic photos)')
+    parser.add_argument('--count', type=int, default=8, help='Number of synthetic photos')
+    parser.add_argument('--workers', type=int, default=2, help='Preprocessing pool size for the throughput run')
+    parser.add_argument('--uplink-mbps', type=float, default=10.0,
+                        help='Upstream bandwidth to OpenAI used to estimate upload time')
+    args = parser.parse_args()
+
+    samples = load_samples(args.images, args.count)
+    uploads = [uploaded_file(*sample) for sample in samples]
+    seconds_per_byte = 8 / (args.uplink_mbps * 1e6)
+    print(f"{len(samples)} images; max edge {settings.IMAGE_MAX_EDGE}, JPEG quality "
+          f"{settings.IMAGE_JPEG_QUALITY}, upload at {args.uplink_mbps:g} Mbit/s")
+    print(f"{'image':<24} {'original':>10} {'prepared':>10} {'payload':>17} {'upload':>17} {'prepare':>9}")
+
+    # Inline first: per-image preprocessing cost without pool overhead
+    settings.IMAGE_PREPROCESS_WORKERS = 0
+    totals = np.zeros(5)
+    for (name, _, data), upload in zip(samples, uploads):
+        before = len(original_data_url(upload))
+        started = time.perf_counter()
+        prepared = prepare_image_upload(upload)
+        elapsed = time.perf_counter() - started
+        after = len(image_data_url(prepared))
+        size = Image.open(io.BytesIO(prepared.data)).size
+        totals += (before, after, before * seconds_per_byte, after * seconds_per_byte, elapsed)
+        print(f"{name[:24]:<24} {len(data) / 1e6:8.2f}MB {len(prepared.data) / 1e6:8.2f}MB "
+              f"{before / 1e6:6.2f} -> {after / 1e6:5.2f}MB {before * seconds_per_byte:6.2f} -> "
+              f"{after * seconds_per_byte:5.2f}s {elapsed * 1000:7.0f}ms  {size[0]}x{size[1]}")
+    count = len(samples)
+    print(f"{'mean':<24} {'':>10} {'':>10} {totals[0] / count / 1e6:6.2f} -> {totals[1] / count / 1e6:5.2f}MB "
+          f"{totals[2] / count:6.2f} -> {totals[3] / count:5.2f}s {totals[4] / count * 1000:7.0f}ms")
+
+    # Pool throughput, after one warm-up job per worker has spawned the processes
+    pool = ImagePreprocessingPool(max_workers=args.workers, timeout=settings.IMAGE_PREPROCESS_TIMEOUT)
+    image_preprocessing.image_preprocessing_pool = pool
+    settings.IMAGE_PREPROCESS_WORKERS = args.workers
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(prepare_image_upload, uploads[:args.workers]))
+        started = time.perf_counter()
+        list(executor.map(prepare_image_upload, uploads))
+        elapsed = time.perf_counter() - started
+    print(f"pool, {args.workers} workers: {count / elapsed:.1f} images/s")
+
+    # Request-process heap for the largest upload
+    largest = max(uploads, key=lambda upload: upload.size)
+    before = peak_heap(original_data_url, largest)
+    after = peak_heap(lambda upload: image_data_url(prepare_image_upload(upload)), largest)
+    print(f"request heap peak for a {largest.size / 1e6:.1f}MB upload: "
+          f"{before / 1e6:.1f}MB as-is, {after / 1e6:.1f}MB preprocessed in the pool")
+
+
+if __name__ == '__main__':
+    main()
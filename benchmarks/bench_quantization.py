@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: recall@k and memory of int8 / PQ codes versus float32.
+
+Encodes synthetic embedding-like unit vectors with api.quantization, then
+for each method reports resident bytes, recall@k of the code scan alone,
+and recall@k and latency after re-ranking a shortlist of
+``rerank_factor * k`` rows in float32 -- the path LocalVectorStore takes
+with LOCAL_VECTOR_STORE_QUANTIZATION set.
+
+Usage: python benchmarks/bench_quantization.py [--n 20000] [--dim 1536]
+                                               [--subspaces 96] [--rerank 1 5 10 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.quantization import ProductQuantizer, ScalarQuantizer
+
+
+def make_vectors(n, dim, clusters=64, latent=48, seed=0):
+    # Topic clusters plus low-rank variation and a little noise: text embeddings have a
+    # low intrinsic dimension, which is what PQ exploits (isotropic noise would defeat it)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    basis = rng.normal(size=(latent, dim)) / np.sqrt(latent)
+    vectors = (centers[rng.integers(0, clusters, size=n)] + rng.normal(size=(n, latent)) @ basis
+               + 0.15 * rng.normal(size=(n, dim)))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def recall(found, truth):
+    return np.mean([len(set(f.tolist()) & set(t.tolist())) / len(t) for f, t in zip(found, truth)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--subspaces', type=int, default=96)
+    parser.add_argument('--rerank', type=int, nargs='+', default=[1, 5, 10, 20])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.n + args.queries, args.dim)
+    data, queries = vectors[:args.n], vectors[args.n:]
+    rows = np.arange(args.n)
+
+    started = time.perf_counter()
+    truth = [top_k(data @ query, args.k) for query in queries]
+    exact_ms = (time.perf_counter() - started) / len(queries) * 1000
+    print(f"{args.n} x {args.dim} float32: {data.nbytes / 2**20:.1f} MiB, exact scan {exact_ms:.2f} ms/query "
+          f"(as Python lists: ~{args.n * args.dim * 32 / 2**20:.0f} MiB)\n")
+
+    int8 = ScalarQuantizer(args.dim)
+    started = time.perf_counter()
+    int8.set(rows, data)
+    print(f"int8 encode: {time.perf_counter() - started:.1f}s")
+
+    pq = ProductQuantizer(args.dim, args.subspaces)
+    started = time.perf_counter()
+    pq.train(data[np.random.default_rng(0).choice(args.n, size=min(args.n, 8192), replace=False)])
+    trained = time.perf_counter()
+    pq.set(rows, data)
+    print(f"pq train (8192 sample): {trained - started:.1f}s, encode: {time.perf_counter() - trained:.1f}s\n")
+
+    print(f"{'method':>8} {'MiB':>8} {'x smaller':>10} {'rerank':>7} {'recall@' + str(args.k):>10} {'ms/query':>9}")
+    for quantizer in (int8, pq):
+        resident = quantizer.nbytes
+        for factor in args.rerank:
+            found = []
+            started = time.perf_counter()
+            for query in queries:
+                scores = quantizer.scores(query)[:args.n]
+                if factor <= 1:
+                    found.append(top_k(scores, args.k))
+                    continue
+                shortlist = np.sort(np.argpartition(-scores, args.k * factor - 1)[:args.k * factor])
+                found.append(shortlist[top_k(data[shortlist] @ query, args.k)])
+            elapsed_ms = (time.perf_counter() - started) / len(queries) * 1000
+            print(f"{quantizer.method:>8} {resident / 2**20:>8.1f} {data.nbytes / resident:>10.1f} "
+                  f"{'none' if factor <= 1 else str(factor) + 'k':>7} {recall(found, truth):>10.3f} {elapsed_ms:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
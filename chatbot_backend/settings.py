@@ -90,6 +90,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Readers don't block the writer, and concurrent writers (async views,
+            # ingestion workers) queue for the lock instead of failing as locked
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -155,6 +162,110 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 PINECONE_API_KEY = config('PINECONE_API_KEY', default='')
 PINECONE_ENVIRONMENT = config('PINECONE_ENVIRONMENT', default='us-east-1-aws')
 PINECONE_INDEX_NAME = config('PINECONE_INDEX_NAME', default='chatbot-index')
+PINECONE_INDEX_HOST = config('PINECONE_INDEX_HOST', default='')  # Data-plane host for async queries; looked up when empty
+PINECONE_NAMESPACE = config('PINECONE_NAMESPACE', default='')  # '' is Pinecone's default namespace
+VECTOR_STORE_BACKEND = config('VECTOR_STORE_BACKEND', default='pinecone')  # 'pinecone' or 'local'
+LOCAL_VECTOR_STORE_PATH = config('LOCAL_VECTOR_STORE_PATH', default=os.path.join(BASE_DIR, 'var', 'vectors'))  # Used by the 'local' backend
+LOCAL_VECTOR_STORE_HNSW_MIN_VECTORS = config('LOCAL_VECTOR_STORE_HNSW_MIN_VECTORS', default=50000, cast=int)  # Namespaces this big use HNSW (0 = always exact)
+HNSW_M = config('HNSW_M', default=16, cast=int)  # Graph degree
+HNSW_EF_CONSTRUCTION = config('HNSW_EF_CONSTRUCTION', default=100, cast=int)
+HNSW_EF_SEARCH = config('HNSW_EF_SEARCH', default=64, cast=int)  # Higher = better recall, slower queries
+LOCAL_VECTOR_STORE_QUANTIZATION = config('LOCAL_VECTOR_STORE_QUANTIZATION', default='none')  # none, int8 (4x smaller) or pq (64x at 1536 dims)
+LOCAL_VECTOR_STORE_PQ_SUBSPACES = config('LOCAL_VECTOR_STORE_PQ_SUBSPACES', default=96, cast=int)  # PQ bytes per vector; must divide the dimension
+LOCAL_VECTOR_STORE_RERANK_FACTOR = config('LOCAL_VECTOR_STORE_RERANK_FACTOR', default=10, cast=int)  # Shortlist of factor * top_k re-scored in float32
+PINECONE_USER_NAMESPACES = config('PINECONE_USER_NAMESPACES', default=False, cast=bool)  # One namespace per user; run `manage.py migrate_user_namespaces` before enabling
+PINECONE_METADATA_TEXT = config('PINECONE_METADATA_TEXT', default=False, cast=bool)  # Copy chunk text into vector metadata (else hydrate from the DB)
+PINECONE_UPSERT_BATCH_SIZE = config('PINECONE_UPSERT_BATCH_SIZE', default=100, cast=int)  # Vectors per upsert request
+PINECONE_UPSERT_MAX_BYTES = config('PINECONE_UPSERT_MAX_BYTES', default=1536 * 1024, cast=int)  # Serialized bytes per request (API limit is 2MB)
+PINECONE_UPSERT_MAX_CONCURRENCY = config('PINECONE_UPSERT_MAX_CONCURRENCY', default=4, cast=int)  # Batches in flight
+PINECONE_UPSERT_MAX_RETRIES = config('PINECONE_UPSERT_MAX_RETRIES', default=3, cast=int)
+PINECONE_UPSERT_RETRY_BACKOFF = config('PINECONE_UPSERT_RETRY_BACKOFF', default=1.0, cast=float)  # Seconds, doubled per attempt
 
 # Firebase Configuration
 FIREBASE_SERVICE_ACCOUNT_KEY = config('FIREBASE_SERVICE_ACCOUNT_KEY', default='')
+
+# Embedding Configuration
+EMBEDDING_MODEL = config('EMBEDDING_MODEL', default='text-embedding-ada-002')
+EMBEDDING_DIMENSION = config('EMBEDDING_DIMENSION', default=1536, cast=int)  # Must match EMBEDDING_MODEL
+EMBEDDING_BATCH_SIZE = config('EMBEDDING_BATCH_SIZE', default=100, cast=int)  # Inputs per request
+EMBEDDING_BATCH_MAX_TOKENS = config('EMBEDDING_BATCH_MAX_TOKENS', default=50000, cast=int)  # Approx. tokens per request
+EMBEDDING_MAX_CONCURRENCY = config('EMBEDDING_MAX_CONCURRENCY', default=4, cast=int)  # Batches in flight
+EMBEDDING_MAX_RETRIES = config('EMBEDDING_MAX_RETRIES', default=3, cast=int)  # Attempts per batch (at least 1)
+EMBEDDING_RETRY_BACKOFF = config('EMBEDDING_RETRY_BACKOFF', default=1.0, cast=float)  # Seconds, doubled per attempt
+
+# Embedding cache (SQLite file shared by all workers on the host)
+EMBEDDING_CACHE_ENABLED = config('EMBEDDING_CACHE_ENABLED', default=True, cast=bool)
+EMBEDDING_CACHE_PATH = config('EMBEDDING_CACHE_PATH', default=os.path.join(BASE_DIR, 'var', 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_MAX_BYTES = config('EMBEDDING_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+EMBEDDING_CACHE_MEMORY_ENTRIES = config('EMBEDDING_CACHE_MEMORY_ENTRIES', default=2048, cast=int)
+
+# In-process cache of chunk text used to hydrate search results
+CHUNK_CACHE_ENTRIES = config('CHUNK_CACHE_ENTRIES', default=4096, cast=int)  # 0 disables
+
+# Semantic cache of RAG answers (per user, invalidated when their documents change)
+RESPONSE_CACHE_ENTRIES = config('RESPONSE_CACHE_ENTRIES', default=10000, cast=int)  # 0 disables
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=24 * 3600, cast=float)  # Seconds an answer may be reused
+RESPONSE_CACHE_SIMILARITY = config('RESPONSE_CACHE_SIMILARITY', default=0.95, cast=float)  # Minimum cosine similarity of the queries
+
+# Cache of food-image analyses (per user, invalidated when their documents change)
+IMAGE_CACHE_ENTRIES = config('IMAGE_CACHE_ENTRIES', default=2000, cast=int)  # 0 disables
+IMAGE_CACHE_MAX_DISTANCE = config('IMAGE_CACHE_MAX_DISTANCE', default=6, cast=int)  # Differing perceptual-hash bits (of 64) still treated as the same photo
+
+# Retrieval over user documents
+RETRIEVAL_MODE = config('RETRIEVAL_MODE', default='hybrid')  # vector, lexical (BM25, no embedding call) or hybrid
+RETRIEVAL_CANDIDATES = config('RETRIEVAL_CANDIDATES', default=20, cast=int)  # Per-ranking depth fused in hybrid mode
+RRF_K = config('RRF_K', default=60, cast=int)  # Reciprocal rank fusion constant
+RAG_TOP_K = config('RAG_TOP_K', default=6, cast=int)  # Chunks retrieved per chat turn, before merging and packing
+RAG_CONTEXT_MAX_TOKENS = config('RAG_CONTEXT_MAX_TOKENS', default=750, cast=int)  # Prompt budget for document context (0 = unlimited)
+RAG_MMR_LAMBDA = config('RAG_MMR_LAMBDA', default=0.7, cast=float)  # 1 = relevance only, lower = more diverse context
+
+# Async views under /api/async/ (served by an ASGI worker)
+ASYNC_HTTP_MAX_CONNECTIONS = config('ASYNC_HTTP_MAX_CONNECTIONS', default=200, cast=int)  # Upstream connections per event loop
+ASYNC_HTTP_TIMEOUT = config('ASYNC_HTTP_TIMEOUT', default=60, cast=float)  # Seconds an OpenAI/Pinecone read may stall
+
+# Threads running the concurrent stages of sync chat turns (embedding, message writes)
+CHAT_TURN_WORKERS = config('CHAT_TURN_WORKERS', default=16, cast=int)
+
+# Write-behind buffer for chat messages, per process (0 interval = write each message immediately).
+# History reads only flush their own process, so with several workers they can lag by the interval.
+CHAT_MESSAGE_FLUSH_INTERVAL = config('CHAT_MESSAGE_FLUSH_INTERVAL', default=0.5, cast=float)  # Seconds; the most a crash can lose
+CHAT_MESSAGE_BATCH_SIZE = config('CHAT_MESSAGE_BATCH_SIZE', default=200, cast=int)  # Pending messages that trigger an early flush
+
+# Background document ingestion (queue is the user_documents table)
+INGESTION_RUN_IN_PROCESS = config('INGESTION_RUN_IN_PROCESS', default=True, cast=bool)  # Else run `manage.py run_ingestion_workers`
+INGESTION_WORKERS = config('INGESTION_WORKERS', default=2, cast=int)
+INGESTION_POLL_INTERVAL = config('INGESTION_POLL_INTERVAL', default=2.0, cast=float)  # Seconds between idle queue checks
+INGESTION_MAX_ATTEMPTS = config('INGESTION_MAX_ATTEMPTS', default=3, cast=int)
+INGESTION_JOB_TIMEOUT = config('INGESTION_JOB_TIMEOUT', default=900, cast=int)  # Seconds before a claimed job counts as stale
+INGESTION_STATUS_POLL_INTERVAL = config('INGESTION_STATUS_POLL_INTERVAL', default=0.5, cast=float)
+INGESTION_STATUS_MAX_WAIT = config('INGESTION_STATUS_MAX_WAIT', default=30, cast=int)  # Long-poll cap in seconds
+
+# Streaming ingestion pipeline (chunk -> embed -> upsert with bounded queues)
+INGESTION_PIPELINE_BATCH_SIZE = config('INGESTION_PIPELINE_BATCH_SIZE', default=32, cast=int)  # Chunks per embedding batch
+INGESTION_PIPELINE_QUEUE_SIZE = config('INGESTION_PIPELINE_QUEUE_SIZE', default=4, cast=int)  # Batches buffered between stages
+
+# PDF text extraction process pool (0 workers = extract inline)
+PDF_EXTRACTION_WORKERS = config('PDF_EXTRACTION_WORKERS', default=os.cpu_count() or 2, cast=int)
+PDF_EXTRACTION_PAGES_PER_JOB = config('PDF_EXTRACTION_PAGES_PER_JOB', default=8, cast=int)
+PDF_EXTRACTION_TIMEOUT = config('PDF_EXTRACTION_TIMEOUT', default=60, cast=float)  # Seconds per page-range job
+
+# Uploaded food images are downscaled and re-encoded before the vision call (0 workers = inline)
+IMAGE_PREPROCESS_WORKERS = config('IMAGE_PREPROCESS_WORKERS', default=2, cast=int)
+IMAGE_PREPROCESS_TIMEOUT = config('IMAGE_PREPROCESS_TIMEOUT', default=20, cast=float)  # Seconds per image
+IMAGE_MAX_EDGE = config('IMAGE_MAX_EDGE', default=1536, cast=int)  # Pixels; gpt-4o scales the short side to 768 anyway
+IMAGE_JPEG_QUALITY = config('IMAGE_JPEG_QUALITY', default=85, cast=int)
+IMAGE_MAX_UPLOAD_BYTES = config('IMAGE_MAX_UPLOAD_BYTES', default=25 * 1024 * 1024, cast=int)
+IMAGE_MAX_PIXELS = config('IMAGE_MAX_PIXELS', default=60_000_000, cast=int)  # Larger images are refused undecoded
+
+# Token counting: tiktoken reads its encoding files from here (fill it with `manage.py fetch_tiktoken_encodings`)
+TIKTOKEN_CACHE_DIR = config('TIKTOKEN_CACHE_DIR', default=os.path.join(BASE_DIR, 'var', 'tiktoken'))
+os.environ['TIKTOKEN_CACHE_DIR'] = TIKTOKEN_CACHE_DIR  # Also seen by worker processes
+
+# Text chunking (token budgets; counts use tiktoken when installed)
+CHUNK_MAX_TOKENS = config('CHUNK_MAX_TOKENS', default=250, cast=int)
+CHUNK_OVERLAP_TOKENS = config('CHUNK_OVERLAP_TOKENS', default=50, cast=int)
+
+# Bulk re-embedding (`manage.py reembed_chunks`) rate budget
+REEMBED_BATCH_SIZE = config('REEMBED_BATCH_SIZE', default=1000, cast=int)  # Chunks read and checkpointed together
+REEMBED_REQUESTS_PER_MINUTE = config('REEMBED_REQUESTS_PER_MINUTE', default=500, cast=int)
+REEMBED_TOKENS_PER_MINUTE = config('REEMBED_TOKENS_PER_MINUTE', default=1000000, cast=int)
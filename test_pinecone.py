@@ -66,13 +66,13 @@ def test_pinecone_setup():
         
         # Upsert test vector
         print("   Upserting test vector...")
-        success = manager.upsert_vectors([{
+        results = manager.upsert_vectors([{
             "id": "test-vector-1",
             "values": test_vector,
             "metadata": test_metadata
         }])
         
-        if success:
+        if manager.upsert_succeeded(results):
             print("   ✅ Test vector upserted successfully")
             
             # Query test vector